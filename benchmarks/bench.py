@@ -0,0 +1,430 @@
+"""
+bench.py — микро-бенчмарки вспомогательных функций и хранилища
+
+Запуск (без сети и без токена Discord):
+    python benchmarks/bench.py                 # сравнить с baseline.json
+    python benchmarks/bench.py --update        # перезаписать baseline.json
+    python benchmarks/bench.py -k progress     # только бенчмарки с "progress" в имени
+    python benchmarks/bench.py --threshold 50  # допустимая регрессия, %
+    python benchmarks/bench.py --fast          # профиль PERF_PROFILE (baseline_fast.json)
+
+Код возврата 1, если хотя бы один бенчмарк медленнее baseline больше чем на
+threshold процентов или его нет в baseline (новый бенчмарк — добавьте его
+через --update и закоммитьте baseline).
+
+baseline хранится в репозитории, поэтому время в нём — не секунды, а доли
+калибровочного цикла (calibrate): он измеряется на той же машине перед
+каждым бенчмарком, и разница в скорости машин (и колебания нагрузки во
+время прогона) сокращается.
+"""
+
+import argparse
+import asyncio
+import atexit
+import contextlib
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+FAST_BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline_fast.json")
+DEFAULT_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "50"))
+CONFIRM_ROUNDS = 2
+
+# Рабочие файлы (progress.json, declined.txt, ...) пишутся во временную папку
+WORKDIR = tempfile.mkdtemp(prefix="bellbot-bench-")
+os.chdir(WORKDIR)
+atexit.register(shutil.rmtree, WORKDIR, ignore_errors=True)
+sys.path.insert(0, ROOT)
+
+from benchmarks import respstore  # noqa: E402
+from cogs import applications, deadlines, guilds, helpers, perf, snapshot  # noqa: E402
+from cogs.state import LocalStateBackend, RedisStateBackend  # noqa: E402
+from configuration import DECLINED_FILE, GUILD_ID  # noqa: E402
+
+BENCHMARKS = {}
+
+
+def benchmark(name, number=1, repeat=5):
+    """
+    Регистрирует бенчмарк. Функция-фабрика готовит данные и возвращает
+    callable, время которого измеряется (number вызовов, лучший из repeat).
+    """
+
+    def decorator(factory):
+        BENCHMARKS[name] = (factory, number, repeat)
+        return factory
+
+    return decorator
+
+
+def fake_id(i: int) -> int:
+    return 100_000_000_000_000_000 + i
+
+
+# -------------------- Хелперы --------------------
+@benchmark("extract_lines/large_embed", number=200)
+def bench_extract_lines():
+    fields = [
+        SimpleNamespace(name=f"Вопрос {i}", value=f"Ответ {i}\nещё строка\n  \n")
+        for i in range(25)
+    ]
+    embed = SimpleNamespace(description="Описание анкеты\n" * 200, fields=fields)
+    message = SimpleNamespace(content="Новая заявка\nВаш DISCORD\nuser", embeds=[embed] * 10)
+    return lambda: helpers.extract_lines(message)
+
+
+@benchmark("calculate_score", number=200)
+def bench_calculate_score():
+    answers = ["Да", "21+", ">2 лет", "Да", "Да", ">2 недель", "Christopher", "Иван"]
+    return lambda: helpers.calculate_score(answers)
+
+
+@benchmark("get_next_index", number=10_000)
+def bench_get_next_index():
+    loop = perf.new_event_loop()
+    answers = ["Да", "21+", ">2 лет", "Нет", "Нет", "", "", ""]
+
+    async def run():
+        for index in range(len(answers)):
+            await helpers.get_next_index(index, answers)
+
+    return lambda: loop.run_until_complete(run())
+
+
+@benchmark("is_blacklisted/100k", number=1_000)
+def bench_is_blacklisted():
+    helpers.blacklist_ids[GUILD_ID] = {str(fake_id(i)) for i in range(100_000)}
+    uid = fake_id(99_999)
+    return lambda: helpers.is_blacklisted(uid)
+
+
+@benchmark("is_declined/100k", number=5)
+def bench_is_declined():
+    with open(DECLINED_FILE, "w", encoding="utf-8") as f:
+        f.writelines(f"{fake_id(i)}\n" for i in range(100_000))
+    uid = fake_id(99_999)
+    return lambda: helpers.is_declined(uid)
+
+
+@benchmark("load_blacklist_from_channel/1k", number=5)
+def bench_load_blacklist():
+    messages = [
+        SimpleNamespace(
+            id=fake_id(i), content=f"ЧС {fake_id(i)} причина: ... и {fake_id(i + 1)}"
+        )
+        for i in range(1000)
+    ]
+
+    class FakeChannel:
+        async def history(self, limit=None, after=None):
+            for msg in messages[:limit]:
+                yield msg
+
+    bot = SimpleNamespace(get_channel=lambda _id: FakeChannel())
+    loop = perf.new_event_loop()
+
+    def run():
+        guilds.channel_marks.clear()  # холодный старт — читаем всю историю
+        loop.run_until_complete(helpers.load_blacklist_from_channel(bot))
+
+    return run
+
+
+# -------------------- Снимок состояния --------------------
+def fill_snapshot_state(count: int):
+    helpers.blacklist_ids[GUILD_ID] = {str(fake_id(i)) for i in range(count)}
+    deadlines.pending_deadlines[GUILD_ID] = {
+        fake_id(i): (fake_id(i + 1), 1.7e9 + i) for i in range(count // 100)
+    }
+    guilds.channel_marks.update({fake_id(i): fake_id(i + 7) for i in range(3)})
+    snapshot._ready = True
+
+
+@benchmark("save_snapshot/100k", number=1, repeat=5)
+def bench_save_snapshot():
+    fill_snapshot_state(100_000)
+    return snapshot.save_snapshot
+
+
+@benchmark("load_snapshot/100k", number=1, repeat=5)
+def bench_load_snapshot():
+    fill_snapshot_state(100_000)
+    snapshot.save_snapshot()
+    return snapshot.load_snapshot
+
+
+# -------------------- Маршрутизация событий --------------------
+def busy_server_messages(count: int) -> list:
+    """
+    Синтетическая лента загруженного сервера: болтовня в чужих каналах
+    и ЛС от людей без анкеты.
+    """
+    import discord
+
+    guild = SimpleNamespace(id=GUILD_ID)
+    messages = []
+    for i in range(count):
+        kind = i % 20
+        if kind == 0:  # ЛС без анкеты
+            channel = SimpleNamespace(id=fake_id(10_000 + i), type=discord.ChannelType.private)
+            msg_guild, content = None, "привет"
+        else:  # обычная болтовня
+            channel = SimpleNamespace(id=fake_id(i % 50), type=discord.ChannelType.text)
+            msg_guild, content = guild, f"сообщение {i}"
+        author = SimpleNamespace(id=fake_id(20_000 + i), bot=False)
+        messages.append(
+            SimpleNamespace(
+                id=fake_id(i), guild=msg_guild, channel=channel, author=author,
+                content=content, embeds=[], reactions=[],
+            )
+        )
+    return messages
+
+
+@benchmark("on_message/busy_server_10k", number=1)
+def bench_on_message():
+    import bot as bot_module
+
+    bot_module.bot._connection.user = SimpleNamespace(id=1)
+    messages = busy_server_messages(10_000)
+    for message in messages:
+        message._state = bot_module.bot._connection
+    loop = perf.new_event_loop()
+
+    async def run():
+        for message in messages:
+            await bot_module.on_message(message)
+
+    return lambda: loop.run_until_complete(run())
+
+
+# -------------------- Хранилище прогресса --------------------
+def make_sessions(count: int) -> dict:
+    return {
+        fake_id(i): {
+            "answers": ["Да", "21+", ">2 лет", "Нет"],
+            "index": 4,
+            "msg_id": fake_id(i + 1),
+            "qmsg_id": fake_id(i + 2),
+        }
+        for i in range(count)
+    }
+
+
+def register_progress_benchmarks(count: int, number: int, repeat: int):
+    sessions = make_sessions(count)
+
+    @benchmark(f"save_progress/{count}", number=number, repeat=repeat)
+    def bench_save():
+        loop = perf.new_event_loop()
+
+        def run():
+            applications.user_progress.clear()
+            applications.user_progress.update(sessions)
+            loop.run_until_complete(applications.save_progress())
+
+        return run
+
+    @benchmark(f"load_progress/{count}", number=number, repeat=repeat)
+    def bench_load():
+        loop = perf.new_event_loop()
+        applications.user_progress.clear()
+        applications.user_progress.update(sessions)
+        loop.run_until_complete(applications.save_progress())
+        return lambda: loop.run_until_complete(applications.load_progress())
+
+
+register_progress_benchmarks(10, number=200, repeat=5)
+register_progress_benchmarks(1_000, number=10, repeat=5)
+register_progress_benchmarks(100_000, number=1, repeat=3)
+
+
+# -------------------- Общее хранилище анкет --------------------
+def register_state_benchmark(kind: str, count: int, number: int):
+    """
+    Чтение и запись анкеты (compare-and-set) на каждое событие — то, что
+    делает worker.py. resp — через RESP-хранилище (benchmarks/respstore.py) в
+    том же процессе: это стоимость протокола, без сетевой задержки.
+    """
+
+    @benchmark(f"session_pull_push/{kind}_{count}", number=number)
+    def bench():
+        loop = perf.new_event_loop()
+        sessions = make_sessions(count)
+        if kind == "local":
+            backend = LocalStateBackend()
+        else:
+            server, port = loop.run_until_complete(respstore.start_store())
+            backend = RedisStateBackend(port=port)
+
+            async def shutdown():
+                await backend.close()
+                server.close()
+                await asyncio.sleep(0.01)  # соединения сервера успевают закрыться
+
+            atexit.register(lambda: loop.run_until_complete(shutdown()))
+        for uid, entry in sessions.items():
+            loop.run_until_complete(backend.cas_session(uid, 0, entry))
+
+        async def run():
+            applications.use_state_backend(backend)
+            try:
+                for uid in sessions:
+                    async with applications.shared_session(uid) as entry:
+                        entry["last_active"] = time.time()
+            finally:
+                applications.use_state_backend(None)
+
+        return lambda: loop.run_until_complete(run())
+
+
+register_state_benchmark("local", 100, number=20)
+register_state_benchmark("resp", 100, number=5)
+
+
+# -------------------- Запуск --------------------
+def calibrate(repeat: int = 7) -> float:
+    """
+    Время калибровочного цикла (лучшее из repeat, секунды): JSON, словари,
+    строки и арифметика — то же, из чего состоят бенчмарки.
+    """
+    data = {str(fake_id(i)): ["Да", "21+", i, {"index": i % 8}] for i in range(2_000)}
+
+    def workload():
+        json.loads(json.dumps(data, ensure_ascii=False))
+        total = 0
+        for i in range(20_000):
+            total += i * i % 7
+        sorted(data, key=lambda key: key[::-1])
+        return total
+
+    workload()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        workload()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(name) -> float:
+    """
+    Возвращает лучшее время одного вызова (секунды). Сборщик мусора на время
+    замеров выключен, как в timeit, — иначе время зависит от того, на какой
+    повтор попала сборка.
+    """
+    factory, number, repeat = BENCHMARKS[name]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        func = factory()
+        func()  # прогрев
+        best = float("inf")
+        for _ in range(repeat):
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                for _ in range(number):
+                    func()
+                best = min(best, (time.perf_counter() - start) / number)
+            finally:
+                gc.enable()
+    return best
+
+
+def measure(name, rounds: int = 1) -> tuple[float, float]:
+    """
+    (время одного вызова, оно же в долях калибровочного цикла). rounds > 1 —
+    медиана по раундам (для --update: baseline не должен быть удачным выбросом).
+    """
+    samples = []
+    for _ in range(rounds):
+        unit = calibrate()
+        current = run_benchmark(name)
+        samples.append((current / unit, current))
+    ratio, current = sorted(samples)[len(samples) // 2]
+    return current, ratio
+
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.3f} µs"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Микро-бенчмарки BellBot")
+    parser.add_argument("-k", dest="filter", default="", help="подстрока имени бенчмарка")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="допустимая регрессия относительно baseline, %%")
+    parser.add_argument("--update", action="store_true", help="перезаписать baseline.json")
+    parser.add_argument("--baseline", help="путь к baseline.json")
+    parser.add_argument("--fast", action="store_true",
+                        help="профиль производительности (msgspec/orjson + uvloop)")
+    args = parser.parse_args(argv)
+
+    if args.fast:
+        print(f"⚡ Профиль производительности: {perf.enable_fast_profile()}")
+    args.baseline = args.baseline or (FAST_BASELINE_PATH if args.fast else BASELINE_PATH)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    python = f"{sys.version_info.major}.{sys.version_info.minor}"
+    if baseline.get("_python", python) != python:
+        print(f"⚠️ baseline снят на Python {baseline['_python']}, сейчас {python}")
+
+    results = {}
+    regressions = []
+    missing = []
+    for name in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        current, results[name] = measure(name, rounds=3 if args.update else 1)
+        base = baseline.get(name)
+        if base:
+            change = (results[name] - base) / base * 100
+            # Выброс не должен валить проверку: регрессию подтверждаем повторными
+            # замерами и берём лучший — настоящее замедление воспроизводится.
+            for _ in range(CONFIRM_ROUNDS):
+                if args.update or change <= args.threshold:
+                    break
+                retry, ratio = measure(name)
+                if ratio < results[name]:
+                    current, results[name] = retry, ratio
+                    change = (ratio - base) / base * 100
+            mark = "❌" if change > args.threshold else "✅"
+            if change > args.threshold:
+                regressions.append(name)
+            print(f"{mark} {name:<35} {format_time(current):>12}  ({change:+.1f}% к baseline)")
+        else:
+            missing.append(name)
+            mark = "➕" if args.update else "❌"
+            print(f"{mark} {name:<35} {format_time(current):>12}  (нет в baseline)")
+
+    if args.update:
+        baseline.update(results, _python=python)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"💾 Baseline сохранён: {args.baseline}")
+        return 0
+
+    if missing:
+        print(f"❌ Нет в baseline (добавьте через --update): {', '.join(missing)}")
+    if regressions:
+        print(f"❌ Регрессии больше {args.threshold}%: {', '.join(regressions)}")
+    return 1 if missing or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,934 @@
+"""
+replay.py — воспроизведение trace-файла через настоящие обработчики бота
+
+Trace записывается ботом при TRACE_FILE=<путь> в .env (см. cogs/trace.py).
+События подаются в on_message / on_raw_reaction_add из bot.py, а все обращения
+к Discord уходят в поддельный REST-слой (без сети и токена).
+
+    python benchmarks/replay.py trace.jsonl.gz                 # как можно быстрее
+    python benchmarks/replay.py trace.jsonl.gz --speed 10      # в 10 раз быстрее реального
+    python benchmarks/replay.py trace.jsonl.gz --rest-latency 50
+    python benchmarks/replay.py trace.jsonl.gz --fast          # профиль PERF_PROFILE
+    LEAN_INTENTS=1 python benchmarks/replay.py trace.jsonl.gz  # без кэша сообщений
+    python benchmarks/replay.py trace.jsonl.gz --handoff 4     # шлюз + 4 обработчика (worker.py)
+    python benchmarks/replay.py trace.jsonl.gz --handoff 4 --processes  # ... отдельными процессами
+    python benchmarks/replay.py trace.jsonl.gz --dump state.json
+    python benchmarks/replay.py trace.jsonl.gz --expect state.json   # diff итогового состояния
+    python benchmarks/replay.py --synthesize 200 --window 3600 --out burst.jsonl.gz
+    python benchmarks/replay.py --check-duplicates  # дубликаты заявок и гонка с on_ready
+
+Отчёт: пропускная способность (рядом — сколько анкет завершено и сколько
+нет), распределение задержек обработчиков, процессорное время и пиковый RSS
+процесса, количество REST-вызовов по типам и итоговое состояние (анкеты,
+архив, ...). Код возврата 1, если анкеты остались
+незавершёнными (для trace, обрывающегося посреди анкет, — --allow-unfinished).
+"""
+
+import argparse
+import asyncio
+import atexit
+import contextlib
+import gzip
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict, deque
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CWD = os.getcwd()  # относительные пути аргументов — от папки запуска
+
+# Рабочие файлы бота (progress.json, archive.db, ...) — во временной папке
+# (обработчики --processes работают в папке шлюза, её передаёт REPLAY_WORKDIR)
+WORKDIR = os.environ.get("REPLAY_WORKDIR")
+if WORKDIR is None:
+    WORKDIR = tempfile.mkdtemp(prefix="bellbot-replay-")
+    atexit.register(shutil.rmtree, WORKDIR, ignore_errors=True)
+os.chdir(WORKDIR)
+sys.path.insert(0, ROOT)
+
+import discord  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+from cogs import applications, archive, helpers, outbox, perf  # noqa: E402
+from cogs.guilds import guild_configs, guild_for_channel  # noqa: E402
+from cogs.helpers import get_next_index, load_ids  # noqa: E402
+from cogs.state import RedisStateBackend, answer_queue  # noqa: E402
+from cogs.trace import read_trace  # noqa: E402
+from configuration import GUILD_ID  # noqa: E402
+
+BOT_ID = 1
+FIRST_ID = 900_000_000_000_000_000  # ID, которые выдаёт поддельный REST
+STOP_EVENT = {"kind": "replay_stop", "uid": 0}  # конец очереди для обработчика --processes
+SENT_KEY = "bell:replay:sent"  # ID ЛС, отправленных обработчиками --processes
+QUESTION_TIMEOUT = 30  # сколько ответ ждёт отправки своего вопроса, с
+
+
+# -------------------- Поддельный REST-слой --------------------
+class FakeRest:
+    """
+    Считает обращения к Discord и (опционально) имитирует задержку ответа.
+    """
+
+    def __init__(self, latency: float = 0.0, first_id: int = FIRST_ID):
+        self.latency = latency
+        self.calls = Counter()
+        self._next_id = first_id  # у процессов --processes — непересекающиеся ID
+
+    async def call(self, op: str):
+        self.calls[op] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+
+class FakeWorld:
+    """
+    Серверы, каналы, участники и сообщения, которые видят обработчики бота.
+    """
+
+    def __init__(
+        self, rest: FakeRest, members_by_tag: dict, dm_ids: dict, question_dms: set = frozenset()
+    ):
+        self.rest = rest
+        self.members_by_tag = members_by_tag
+        self.dm_ids = dm_ids  # {uid: deque(ID, которые получили ЛС бота при записи)}
+        # ЛС с пометкой "q" (синтетический trace) — только вопросы: прочие ЛС
+        # (позиция в очереди допуска, напоминания) их ID не забирают
+        self.question_dms = question_dms
+        self.users = {}
+        self.messages = {}
+        self.channels = {}
+        self.dm_channels = {}
+        self.backlog = {}  # {channel_id: [сообщения]} — история канала для on_ready
+        self.dm_log = []  # [(uid, текст)] — все ЛС бота
+        self.sent_dms = set()  # ID записанных ЛС, которые бот уже отправил
+        self.dm_waiters = {}  # {ID ЛС: asyncio.Event} — ответы, ждущие вопроса
+        self.publish_dm = None  # обработчик --processes сообщает шлюзу об отправке
+        self.unanswerable = 0  # ответы, вопрос к которым так и не был отправлен
+        self.guilds = {gid: FakeGuild(self, gid) for gid in guild_configs}
+
+    def user(self, uid: int, name: str | None = None):
+        if uid not in self.users:
+            guild = self.guilds.get(GUILD_ID) or next(iter(self.guilds.values()))
+            self.users[uid] = FakeMember(self, uid, name or f"user{uid}", guild)
+        return self.users[uid]
+
+    def channel(self, channel_id: int):
+        if channel_id not in self.channels:
+            guild = self.guilds.get(guild_for_channel(channel_id))
+            self.channels[channel_id] = FakeTextChannel(self, channel_id, guild)
+        return self.channels[channel_id]
+
+    def mark_dm_sent(self, message_id: int):
+        self.sent_dms.add(message_id)
+        waiter = self.dm_waiters.pop(message_id, None)
+        if waiter is not None:
+            waiter.set()
+
+    async def wait_dm_sent(self, message_id: int) -> bool:
+        """
+        Ждёт, пока бот отправит ЛС с этим ID: пользователь не может ответить
+        на вопрос, которого ещё нет. False — не дождались (QUESTION_TIMEOUT).
+        """
+        if message_id in self.sent_dms:
+            return True
+        waiter = self.dm_waiters.setdefault(message_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(waiter.wait(), QUESTION_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            self.unanswerable += 1
+            return False
+
+    def dm_for(self, uid: int):
+        for dm in self.dm_channels.values():
+            if dm.uid == uid:
+                return dm
+        dm = FakeDM(self, self.rest.new_id(), uid)
+        self.dm_channels[dm.id] = dm
+        return dm
+
+
+class FakeGuild:
+    def __init__(self, world, guild_id):
+        self.world = world
+        self.id = guild_id
+
+    def get_member(self, uid):
+        return self.world.user(uid)
+
+    def get_member_named(self, tag):
+        uid = self.world.members_by_tag.get(tag)
+        if uid is None and tag.isdigit():
+            uid = int(tag)
+        return self.world.user(uid, tag) if uid else None
+
+    async def fetch_member(self, uid):
+        await self.world.rest.call("fetch_member")
+        return self.world.user(uid)
+
+    def get_role(self, role_id):
+        return SimpleNamespace(id=role_id, mention=f"<@&{role_id}>")
+
+
+class FakeMember:
+    def __init__(self, world, uid, name, guild):
+        self.world = world
+        self.id = uid
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{uid}>"
+        self.guild = guild
+        self.roles = []
+        self.bot = False
+        self.dm_channel = None
+
+    def __str__(self):
+        return self.name
+
+    async def create_dm(self):
+        await self.world.rest.call("create_dm")
+        self.dm_channel = self.world.dm_for(self.id)
+        return self.dm_channel
+
+    async def add_roles(self, *roles):
+        await self.world.rest.call("add_roles")
+        self.roles.extend(roles)
+
+    async def edit(self, nick=None):
+        await self.world.rest.call("edit_member")
+        self.display_name = nick or self.display_name
+
+
+class FakeMessage:
+    def __init__(self, world, message_id, channel, author, content="", embeds=None):
+        self.world = world
+        self.id = message_id
+        self.channel = channel
+        self.guild = getattr(channel, "guild", None)
+        self.author = author
+        self.content = content or ""
+        self.embeds = embeds or []
+        self.reactions = []
+        self._state = bot_module.bot._connection
+
+    async def add_reaction(self, emoji):
+        await self.world.rest.call("add_reaction")
+        self.reactions.append(SimpleNamespace(emoji=emoji))
+
+    async def create_thread(self, name):
+        await self.world.rest.call("create_thread")
+        return FakeTextChannel(self.world, self.world.rest.new_id(), self.guild, name)
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeTextChannel:
+    type = discord.ChannelType.text
+
+    def __init__(self, world, channel_id, guild, name=None):
+        self.world = world
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+
+    async def send(self, content=None, **kwargs):
+        await self.world.rest.call("channel_send")
+        message = FakeMessage(self.world, self.world.rest.new_id(), self, None, content)
+        gateway_message(message)  # своё сообщение бот тоже получает через gateway
+        return message
+
+    def get_partial_message(self, message_id):
+        return self.world.messages.get(message_id) or FakeMessage(
+            self.world, message_id, self, None
+        )
+
+    async def fetch_message(self, message_id):
+        await self.world.rest.call("fetch_message")
+        return self.world.messages[message_id]
+
+    async def history(self, limit=None, **kwargs):
+        await self.world.rest.call("history")
+        for message in self.world.backlog.get(self.id, []):
+            yield message
+
+
+class FakeDM:
+    type = discord.ChannelType.private
+
+    def __init__(self, world, channel_id, uid):
+        self.world = world
+        self.id = channel_id
+        self.uid = uid
+        self.guild = None
+
+    async def send(self, content=None, **kwargs):
+        await self.world.rest.call("dm_send")
+        self.world.dm_log.append((self.uid, content))
+        recorded = self.world.dm_ids.get(self.uid)
+        # прошлые вопросы мог задать другой процесс (--processes) — их ID пропускаем
+        last = applications.user_progress.get(self.uid, {}).get("qmsg_id")
+        while recorded and last and recorded[0] <= last:
+            recorded.popleft()
+        if recorded and recorded[0] in self.world.question_dms and not (
+            content or ""
+        ).startswith("**Вопрос "):
+            recorded = None
+        message_id = recorded.popleft() if recorded else self.world.rest.new_id()
+        self.world.mark_dm_sent(message_id)
+        if self.world.publish_dm is not None:
+            await self.world.publish_dm(message_id)
+        message = FakeMessage(self.world, message_id, self, None, content)
+        gateway_message(message)
+        return message
+
+
+def gateway_message(message: FakeMessage):
+    """
+    То, что gateway discord.py делает с MESSAGE_CREATE (parse_message_create):
+    строит discord.Message и кладёт его в кэш сообщений, если тот включён
+    (без LEAN_INTENTS — до 1000 последних). Обработчики получают FakeMessage,
+    discord.Message нужен только ради памяти и времени кэша.
+    """
+    state = bot_module.bot._connection
+    author = message.author
+    data = {
+        "id": str(message.id),
+        "channel_id": str(message.channel.id),
+        "author": {
+            "id": str(author.id if author else BOT_ID),
+            "username": author.name if author else "bot",
+            "discriminator": "0",
+            "avatar": None,
+        },
+        "content": message.content,
+        "embeds": [
+            {
+                "description": embed.description,
+                "fields": [{"name": f.name, "value": f.value} for f in embed.fields],
+            }
+            for embed in message.embeds
+        ],
+        "attachments": [],
+        "mentions": [],
+        "mention_roles": [],
+        "mention_everyone": False,
+        "pinned": False,
+        "tts": False,
+        "type": 0,
+        "timestamp": discord.utils.snowflake_time(message.id).isoformat(),
+        "edited_timestamp": None,
+    }
+    cached = discord.Message(state=state, channel=message.channel, data=data)
+    if state._messages is not None:
+        state._messages.append(cached)
+
+
+def install_world(world: FakeWorld):
+    """
+    Подменяет у бота обращения к кэшу и REST на поддельный мир.
+    """
+    bot = bot_module.bot
+    bot._connection.user = SimpleNamespace(id=BOT_ID)
+    bot.get_guild = lambda gid: world.guilds.get(gid)
+    bot.get_channel = lambda cid: world.channel(cid) if cid else None
+    bot.get_user = lambda uid: world.users.get(uid)
+
+    async def fetch_user(uid):
+        await world.rest.call("fetch_user")
+        return world.user(uid)
+
+    def get_partial_messageable(channel_id, type=None):
+        if channel_id not in world.dm_channels:
+            # ЛС мог открыть другой процесс (--processes): владелец — из кэша ЛС
+            uid = next((u for u, c in helpers.dm_channels.items() if c == channel_id), None)
+            world.dm_channels[channel_id] = FakeDM(world, channel_id, uid)
+        return world.dm_channels[channel_id]
+
+    bot.fetch_user = fetch_user
+    bot.get_partial_messageable = get_partial_messageable
+
+
+# -------------------- Воспроизведение --------------------
+def scan_trace(path: str):
+    """
+    Первый проход: теги участников, ID ЛС бота и какие из них — вопросы анкеты
+    (нужны до подачи событий).
+    """
+    members_by_tag = {}
+    dm_ids = defaultdict(deque)
+    question_dms = set()
+    for event in read_trace(path):
+        if event["k"] == "member":
+            members_by_tag[event["tag"]] = event["u"]
+        elif event["k"] == "dm":
+            dm_ids[event["u"]].append(event["m"])
+            if "q" in event:
+                question_dms.add(event["m"])
+    return members_by_tag, dm_ids, question_dms
+
+
+def build_message(world: FakeWorld, event: dict):
+    if event["ct"] == discord.ChannelType.private.value:
+        channel = world.dm_for(event["a"])
+    else:
+        channel = world.channel(event["ch"])
+    embeds = [
+        SimpleNamespace(
+            description=embed.get("d"),
+            fields=[SimpleNamespace(name=n, value=v) for n, v in embed.get("f", [])],
+        )
+        for embed in event.get("e", [])
+    ]
+    author = world.user(event["a"], event.get("an"))
+    message = FakeMessage(world, event["id"], channel, author, event.get("c"), embeds)
+    world.messages[message.id] = message
+    gateway_message(message)
+    return message
+
+
+def build_reaction(world: FakeWorld, event: dict):
+    return SimpleNamespace(
+        user_id=event["u"],
+        message_id=event["m"],
+        channel_id=event["ch"],
+        guild_id=event.get("g"),
+        emoji=event["e"],
+        member=None,
+    )
+
+
+async def start_handoff(workers: int):
+    """
+    Режим нескольких процессов в одном event loop: RESP-хранилище
+    (benchmarks/respstore.py), шлюз bot.py с HANDOFF_WORKERS=workers и
+    обработчики worker.py, читающие свои очереди. Возвращает хранилище.
+    """
+    from benchmarks import respstore
+    import worker as worker_module
+
+    server, port = await respstore.start_store()
+    backend = RedisStateBackend(port=port)
+    backend.server = server  # держим сервер, пока живёт хранилище
+    applications.use_state_backend(backend)
+    bot_module.HANDOFF_WORKERS = worker_module.HANDOFF_WORKERS = workers
+    bot_module.state_backend = worker_module.state_backend = backend
+    worker_module.client = bot_module.bot
+    worker_module._tasks.extend(
+        asyncio.create_task(worker_module.consume(answer_queue(n, workers)))
+        for n in range(workers)
+    )
+    return backend
+
+
+async def drain_handoff(backend, workers: int):
+    """
+    Ждёт, пока обработчики разберут свои очереди.
+    """
+    import worker as worker_module
+
+    while True:
+        async with backend._connection() as conn:
+            queued = [
+                await conn.call("LLEN", f"bell:queue:{answer_queue(n, workers)}")
+                for n in range(workers)
+            ]
+        if not any(queued) and not worker_module.in_flight:
+            return
+        await asyncio.sleep(0.01)
+
+
+async def start_worker_processes(trace_path: str, workers: int, args: list) -> SimpleNamespace:
+    """
+    Режим --processes: RESP-хранилище и обработчики — отдельные процессы
+    (этот же скрипт с --worker-process), как bot.py + worker.py в проде.
+    Шлюз остаётся в текущем процессе. Возвращает, когда все обработчики
+    подключились к своим очередям.
+    """
+    store = subprocess.Popen(
+        [sys.executable, "-u", os.path.join(ROOT, "benchmarks", "respstore.py"), "--port", "0"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    port = int(store.stdout.readline().rsplit(":", 1)[1])
+    backend = RedisStateBackend(port=port)
+    applications.use_state_backend(backend)
+    bot_module.HANDOFF_WORKERS = workers
+    bot_module.state_backend = backend
+    procs = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), trace_path,
+             "--handoff", str(workers), "--worker-process", str(n),
+             "--store-port", str(port), *args],
+            env={**os.environ, "WORKER_ID": str(n), "REPLAY_WORKDIR": WORKDIR},
+            stdout=None if "--verbose" in args else subprocess.DEVNULL,
+        )
+        for n in range(workers)
+    ]
+    while True:
+        async with backend._connection() as conn:
+            if await conn.call("LLEN", "bell:replay:ready") == workers:
+                break
+        if any(proc.poll() is not None for proc in procs):
+            raise RuntimeError("обработчик --processes завершился при запуске")
+        await asyncio.sleep(0.05)
+    return SimpleNamespace(backend=backend, store=store, procs=procs)
+
+
+async def relay_sent_dms(backend, world: FakeWorld):
+    """
+    Шлюз --processes: отмечает ЛС, отправленные обработчиками, в своём мире.
+    """
+    while True:
+        result = await backend._call("BLPOP", SENT_KEY, 1)
+        if result:
+            world.mark_dm_sent(int(result[1]))
+
+
+async def stop_worker_processes(handoff: SimpleNamespace, world: FakeWorld):
+    """
+    Ставит в конец каждой очереди STOP_EVENT и ждёт обработчики; их
+    REST-вызовы добавляются к вызовам шлюза.
+    """
+    for n in range(len(handoff.procs)):
+        await handoff.backend.push(answer_queue(n, len(handoff.procs)), STOP_EVENT)
+    for n, proc in enumerate(handoff.procs):
+        await asyncio.to_thread(proc.wait)
+        with open(f"replay_worker{n}.json", "r", encoding="utf-8") as f:
+            world.rest.calls.update(json.load(f))
+
+
+async def run_worker_process(world: FakeWorld, workers: int, index: int, port: int):
+    """
+    Обработчик --processes: worker.consume своей очереди до STOP_EVENT, затем
+    фоновые задачи и outbox. REST-вызовы — в replay_worker<index>.json.
+    """
+    import worker as worker_module
+
+    # у worker.py нет gateway и кэша сообщений (max_messages=None)
+    bot_module.bot._connection._messages = None
+    stopped = asyncio.Event()
+    handle_event = worker_module.handle_event
+
+    async def handle_or_stop(event):
+        if event["kind"] == STOP_EVENT["kind"]:
+            stopped.set()
+        else:
+            await handle_event(event)
+
+    backend = RedisStateBackend(port=port)
+    applications.use_state_backend(backend)
+    worker_module.HANDOFF_WORKERS = workers
+    worker_module.state_backend = backend
+    worker_module.client = bot_module.bot
+    worker_module.handle_event = handle_or_stop
+    world.publish_dm = lambda message_id: backend._call("RPUSH", SENT_KEY, message_id)
+    await worker_module.refresh_blacklist()
+    outbox.start_outbox_workers(bot_module.bot)
+    consumer = asyncio.create_task(worker_module.consume(answer_queue(index, workers)))
+    async with backend._connection() as conn:
+        await conn.call("RPUSH", "bell:replay:ready", index)
+
+    await stopped.wait()
+    consumer.cancel()
+    while worker_module.in_flight:
+        await asyncio.gather(*worker_module.in_flight)
+    while applications._background_tasks:
+        await asyncio.gather(*applications._background_tasks)
+    await outbox.drain_outbox()
+    await backend.close()
+    with open(f"replay_worker{index}.json", "w", encoding="utf-8") as f:
+        json.dump(world.rest.calls, f)
+
+
+async def replay(
+    path: str,
+    speed: float,
+    world: FakeWorld,
+    handoff: int = 0,
+    processes: SimpleNamespace | None = None,
+):
+    """
+    Подаёт события в обработчики бота с учётом speed (0 — без пауз).
+    processes — обработчики из start_worker_processes (вместо handoff в этом
+    процессе). Ответ на вопрос подаётся не раньше, чем бот отправил сам вопрос
+    (его ID — в записи ЛС перед ответом), иначе при speed 0 ответы обгоняют
+    вопросы и отбрасываются. Возвращает (число событий, время,
+    {вид события: [задержки]}).
+    """
+    latencies = defaultdict(list)
+    tasks = []
+    last_dm = {}  # {uid: ID последнего записанного ЛС бота}
+
+    async def run(kind, handler, arg, question=None):
+        if question is not None:
+            await world.wait_dm_sent(question)
+        start = time.perf_counter()
+        try:
+            await handler(arg)
+        except Exception as e:
+            print(f"⚠️ Ошибка обработчика {kind}: {e!r}")
+        latencies[kind].append(time.perf_counter() - start)
+
+    outbox.start_outbox_workers(bot_module.bot)
+    backend = await start_handoff(handoff) if handoff and not processes else None
+    relay = asyncio.create_task(relay_sent_dms(processes.backend, world)) if processes else None
+    started = time.perf_counter()
+    for event in read_trace(path):
+        kind = event["k"]
+        question = None
+        if kind == "dm":
+            last_dm[event["u"]] = event["m"]
+            continue
+        if kind == "msg":
+            handler, arg = bot_module.on_message, build_message(world, event)
+            if event["ct"] == discord.ChannelType.private.value:
+                question = last_dm.get(event["a"])
+        elif kind == "react":
+            handler, arg = bot_module.on_raw_reaction_add, build_reaction(world, event)
+            if event.get("g") is None:
+                question = event["m"]
+        else:
+            continue
+
+        if speed:
+            delay = event["t"] / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        # как gateway: каждое событие — отдельная задача
+        tasks.append(asyncio.create_task(run(kind, handler, arg, question)))
+        await asyncio.sleep(0)
+
+    await asyncio.gather(*tasks)
+    # анкеты из очереди допуска, ответы у обработчиков и действия по завершённым анкетам
+    while applications._background_tasks:
+        await asyncio.gather(*applications._background_tasks)
+    if backend:
+        await drain_handoff(backend, handoff)
+    if processes:
+        await stop_worker_processes(processes, world)
+        relay.cancel()
+    await outbox.drain_outbox()
+    return len(tasks), time.perf_counter() - started, latencies
+
+
+async def final_state(world: FakeWorld) -> dict:
+    """
+    Итоговое состояние бота в JSON-совместимом виде (для --dump / --expect).
+    """
+    sessions = applications.user_progress
+    if applications.state_backend is not None:
+        sessions = {}
+        for uid in await applications.state_backend.session_ids():
+            sessions[uid], _ = await applications.state_backend.get_session(uid)
+    archived = []
+    for guild_id in guild_configs:
+        for row in archive.iter_applications(guild_id):
+            archived.append(
+                {
+                    "uid": row["uid"],
+                    "verdict": row["verdict"],
+                    "score": row["score"],
+                    "msg_id": row["msg_id"],
+                }
+            )
+    return {
+        "sessions": {
+            str(uid): {"index": entry.get("index"), "answers": entry.get("answers")}
+            for uid, entry in sorted(sessions.items())
+        },
+        "processed_messages": sorted(applications.processed_messages),
+        "declined": {
+            str(gid): sorted(load_ids(config["declined_file"]))
+            for gid, config in guild_configs.items()
+        },
+        "archive": sorted(archived, key=lambda row: (row["uid"], row["msg_id"] or 0)),
+        "rest_calls": dict(sorted(world.rest.calls.items())),
+    }
+
+
+def diff_states(expected, actual, path="") -> list[str]:
+    """
+    Построчный diff двух состояний: "путь: ожидалось → получено".
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        lines = []
+        for key in sorted(set(expected) | set(actual)):
+            lines += diff_states(
+                expected.get(key), actual.get(key), f"{path}/{key}"
+            )
+        return lines
+    if expected != actual:
+        return [f"{path or '/'}: {json.dumps(expected, ensure_ascii=False)} → "
+                f"{json.dumps(actual, ensure_ascii=False)}"]
+    return []
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def print_report(count, elapsed, latencies, state, world):
+    finished = sum(row["verdict"] != "Заброшена" for row in state["archive"])
+    print(
+        f"\n📊 Событий: {count} за {elapsed:.2f} с → {count / elapsed:.1f} соб/с "
+        f"(анкет завершено: {finished}, не завершено: {len(state['sessions'])}; "
+        f"ядер: {os.cpu_count()})"
+    )
+    if world.unanswerable:
+        print(f"⚠️ Ответов, чей вопрос так и не был отправлен: {world.unanswerable}")
+    cache = bot_module.bot._connection._messages
+    print(
+        f"🧠 Процесс: CPU {time.process_time():.2f} с, пиковый RSS "
+        f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} МБ, "
+        f"кэш сообщений: {'выключен' if cache is None else f'{len(cache)}/{cache.maxlen}'}"
+        f"{' (LEAN_INTENTS)' if bot_module.LEAN_INTENTS else ''}"
+    )
+    for kind, values in sorted(latencies.items()):
+        print(
+            f"   {kind:<6} n={len(values):<6} "
+            f"p50={percentile(values, 0.5) * 1e3:.2f} мс  "
+            f"p95={percentile(values, 0.95) * 1e3:.2f} мс  "
+            f"p99={percentile(values, 0.99) * 1e3:.2f} мс  "
+            f"max={max(values) * 1e3:.2f} мс"
+        )
+    print("🌐 REST-вызовы: " + ", ".join(f"{k}={v}" for k, v in state["rest_calls"].items()))
+    verdicts = Counter(row["verdict"] for row in state["archive"])
+    print(f"📋 Незавершённых анкет: {len(state['sessions'])}, в архиве: {dict(verdicts)}")
+
+
+# -------------------- Сценарий: дубликаты заявок --------------------
+async def check_duplicates(world: FakeWorld, rounds: int = 5) -> list[str]:
+    """
+    Одна заявка приходит дважды (повторная доставка gateway), её же подхватывает
+    догоняющий проход on_ready (заявка без реакций в истории канала), а следом
+    приходит вторая заявка того же кандидата. В каждом раунде live-события
+    сдвинуты относительно on_ready, чтобы попасть в разные окна гонки.
+    Возвращает нарушения: у кандидата должна быть ровно одна анкета и ровно
+    одно ЛС с 1-м вопросом.
+    """
+    config = guild_configs[GUILD_ID]
+    channel_id = config["target_channel_id"]
+    problems = []
+
+    async def live(message, delay):
+        await asyncio.sleep(delay)
+        await bot_module.on_message(message)
+
+    for n in range(rounds):
+        uid = 700_000_000_000_100_000 + n
+        tag = f"duplicate{n}"
+        world.members_by_tag[tag] = uid
+        first, second = (
+            build_message(world, {
+                "id": 800_000_000_000_100_000 + 2 * n + k, "ch": channel_id,
+                "ct": discord.ChannelType.text.value, "a": 2, "an": "webhook", "c": "",
+                "e": [{"d": "Новая заявка", "f": [["Ваш DISCORD", tag]]}],
+            })
+            for k in (0, 1)
+        )
+        world.backlog[channel_id] = [first]
+        delay = n * world.rest.latency
+        await asyncio.gather(
+            bot_module.on_ready(),
+            live(first, delay),
+            live(first, delay),
+            live(second, 2 * delay),
+        )
+        while applications._background_tasks:
+            await asyncio.gather(*applications._background_tasks)
+
+        sessions = (await final_state(world))["sessions"]
+        asked = sum(
+            1 for dm_uid, text in world.dm_log
+            if dm_uid == uid and (text or "").startswith("**Вопрос 1/")
+        )
+        if str(uid) not in sessions:
+            problems.append(f"раунд {n}: анкета {uid} не запущена")
+        if asked != 1:
+            problems.append(f"раунд {n}: ЛС с 1-м вопросом у {uid}: {asked}")
+    world.backlog.clear()
+    return problems
+
+
+# -------------------- Синтетический trace --------------------
+async def synthesize(path: str, applicants: int, window: float, seed: int = 0):
+    """
+    Генерирует всплеск заявок: applicants кандидатов за window секунд,
+    каждый проходит анкету целиком с паузами «на подумать».
+    """
+    rng = random.Random(seed)
+    config = guild_configs[GUILD_ID]
+    events = []
+    next_id = 800_000_000_000_000_000
+
+    for i in range(applicants):
+        uid = 700_000_000_000_000_000 + i
+        tag = f"applicant{i}"
+        t = rng.uniform(0, window)
+        next_id += 1
+        events.append({
+            "k": "msg", "t": t, "id": next_id, "ch": config["target_channel_id"],
+            "ct": discord.ChannelType.text.value, "g": GUILD_ID, "a": 2, "an": "webhook",
+            "c": "", "e": [{"d": "Новая заявка", "f": [["Ваш DISCORD", tag]]}],
+        })
+        events.append({"k": "member", "t": t, "tag": tag, "u": uid})
+
+        index, answers = 0, []
+        while index < len(applications.questions):
+            next_id += 1
+            events.append({"k": "dm", "t": t, "u": uid, "m": next_id, "q": index})
+            t += rng.uniform(2, 20)
+            options = applications.questions[index].get("options")
+            if options:
+                emoji = rng.choice(list(options))
+                answers.append(options[emoji])
+                events.append({"k": "react", "t": t, "u": uid, "m": next_id,
+                               "ch": 0, "g": None, "e": emoji})
+            else:
+                answers.append(f"Имя{i}")
+                events.append({
+                    "k": "msg", "t": t, "id": next_id + 500_000, "ch": 0,
+                    "ct": discord.ChannelType.private.value, "g": None, "a": uid,
+                    "an": tag, "c": f"Имя{i}", "e": [],
+                })
+            index = await get_next_index(index, answers)
+
+    events.sort(key=lambda e: e["t"])
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+    print(f"🧪 Синтетический trace: {applicants} кандидатов, {len(events)} событий → {path}")
+
+
+# -------------------- Запуск --------------------
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Воспроизведение trace-файла BellBot")
+    parser.add_argument("trace", nargs="?", help="trace-файл (.jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="ускорение: 1 — реальное время, 10 — в 10 раз быстрее, 0 — без пауз")
+    parser.add_argument("--rest-latency", type=float, default=0, help="задержка REST, мс")
+    parser.add_argument("--dump", help="сохранить итоговое состояние в JSON")
+    parser.add_argument("--expect", help="сравнить итоговое состояние с JSON")
+    parser.add_argument("--verbose", action="store_true", help="не глушить вывод бота")
+    parser.add_argument("--synthesize", type=int, metavar="N",
+                        help="сгенерировать trace со всплеском из N заявок")
+    parser.add_argument("--window", type=float, default=3600, help="окно всплеска, с")
+    parser.add_argument("--out", default="synthetic.jsonl.gz", help="файл для --synthesize")
+    parser.add_argument("--fast", action="store_true",
+                        help="профиль производительности (msgspec/orjson + uvloop)")
+    parser.add_argument("--handoff", type=int, default=0, metavar="N",
+                        help="шлюз + N обработчиков через общее RESP-хранилище")
+    parser.add_argument("--processes", action="store_true",
+                        help="обработчики --handoff — отдельными процессами")
+    parser.add_argument("--allow-unfinished", action="store_true",
+                        help="не считать ошибкой анкеты, оставшиеся незавершёнными")
+    parser.add_argument("--worker-process", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--store-port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--check-duplicates", action="store_true",
+                        help="сценарий: повторная заявка и догоняющий проход on_ready")
+    args = parser.parse_args(argv)
+
+    if args.check_duplicates:
+        # без задержки REST гонке негде случиться
+        world = FakeWorld(FakeRest(max(args.rest_latency, 5) / 1000), {}, defaultdict(deque))
+        install_world(world)
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(
+            open(os.devnull, "w")
+        )
+        with output:
+            outbox.start_outbox_workers(bot_module.bot)
+            if args.handoff:
+                await start_handoff(args.handoff)
+            problems = await check_duplicates(world)
+        if problems:
+            print(f"❌ Дубликаты заявок: нарушений {len(problems)}")
+            for line in problems:
+                print("   " + line)
+            return 1
+        print("✅ Дубликаты заявок: одна анкета и одно ЛС с 1-м вопросом на кандидата")
+        return 0
+
+    if args.synthesize:
+        await synthesize(os.path.join(CWD, args.out), args.synthesize, args.window)
+        return 0
+    if not args.trace:
+        parser.error("нужен trace-файл или --synthesize")
+
+    trace_path = os.path.join(CWD, args.trace)
+    members_by_tag, dm_ids, question_dms = scan_trace(trace_path)
+    first_id = FIRST_ID
+    if args.worker_process is not None:
+        first_id += (args.worker_process + 1) * 10**15
+    world = FakeWorld(
+        FakeRest(args.rest_latency / 1000, first_id), members_by_tag, dm_ids, question_dms
+    )
+    install_world(world)
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(
+        open(os.devnull, "w")
+    )
+    if args.worker_process is not None:
+        with output:
+            await run_worker_process(world, args.handoff, args.worker_process, args.store_port)
+        return 0
+
+    processes = None
+    if args.processes and args.handoff:
+        worker_args = ["--rest-latency", str(args.rest_latency)]
+        worker_args += ["--fast"] * args.fast + ["--verbose"] * args.verbose
+        processes = await start_worker_processes(trace_path, args.handoff, worker_args)
+    try:
+        with output:
+            count, elapsed, latencies = await replay(
+                trace_path, args.speed, world, args.handoff, processes
+            )
+        state = await final_state(world)
+    finally:
+        if processes:
+            processes.store.terminate()
+            processes.store.wait()
+    print_report(count, elapsed, latencies, state, world)
+
+    if args.dump:
+        with open(os.path.join(CWD, args.dump), "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        print(f"💾 Состояние сохранено: {args.dump}")
+
+    if args.expect:
+        with open(os.path.join(CWD, args.expect), "r", encoding="utf-8") as f:
+            expected = json.load(f)
+        diff = diff_states(expected, state)
+        if diff:
+            print(f"❌ Отличий от {args.expect}: {len(diff)}")
+            for line in diff[:50]:
+                print("   " + line)
+            return 1
+        print(f"✅ Состояние совпадает с {args.expect}")
+
+    # часть ответов не принята — соб/с не сравнимы с прогоном, где приняты все
+    if state["sessions"] and not args.allow_unfinished:
+        print(
+            f"❌ Незавершённых анкет: {len(state['sessions'])} "
+            f"(trace обрывается посреди анкет — --allow-unfinished)"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    if "--fast" in sys.argv:
+        print(f"⚡ Профиль производительности: {perf.enable_fast_profile()}")
+    sys.exit(perf.run(main()))
@@ -0,0 +1,350 @@
+"""
+respstore.py — локальная замена Redis для проверки бота в несколько процессов
+
+Сервер протокола RESP в памяти, поддерживает ровно те команды, которые
+использует RedisStateBackend (cogs/state.py): GET / SET (с NX и PX) / DEL,
+множества, sorted set (ZADD / ZREM / ZRANGEBYSCORE), списки с BLPOP и
+транзакции WATCH / MULTI / EXEC. Данные не сохраняются.
+
+    python benchmarks/respstore.py                 # 127.0.0.1:6379
+    python benchmarks/respstore.py --port 6380
+
+    STATE_BACKEND=redis://127.0.0.1:6380/0 HANDOFF_WORKERS=2 python bot.py
+    STATE_BACKEND=redis://127.0.0.1:6380/0 HANDOFF_WORKERS=2 python worker.py 0
+
+В тестах и бенчмарках — start_store() внутри своего event loop.
+"""
+
+import argparse
+import asyncio
+import bisect
+import time
+from collections import defaultdict, deque
+
+
+class SortedSet:
+    """
+    Sorted set: {member: score} и список (score, member) по возрастанию.
+    """
+
+    def __init__(self):
+        self.scores: dict[bytes, float] = {}
+        self.order: list[tuple[float, bytes]] = []
+
+    def add(self, member: bytes, score: float) -> int:
+        added = self.discard(member) ^ 1
+        self.scores[member] = score
+        bisect.insort(self.order, (score, member))
+        return added
+
+    def discard(self, member: bytes) -> int:
+        score = self.scores.pop(member, None)
+        if score is None:
+            return 0
+        del self.order[bisect.bisect_left(self.order, (score, member))]
+        return 1
+
+    def range_by_score(self, low: float, high: float) -> list[bytes]:
+        start = bisect.bisect_left(self.order, (low, b""))
+        result = []
+        for score, member in self.order[start:]:
+            if score > high:
+                break
+            result.append(member)
+        return result
+
+
+class RespStore:
+    """
+    Данные и команды. Каждая запись увеличивает версию ключа — по ней EXEC
+    узнаёт, менялись ли ключи после WATCH.
+    """
+
+    def __init__(self):
+        self.data: dict[bytes, object] = {}  # bytes | set | deque | SortedSet
+        self.versions: defaultdict[bytes, int] = defaultdict(int)
+        self.waiters: defaultdict[bytes, deque] = defaultdict(deque)  # BLPOP
+        self.expires: dict[bytes, float] = {}  # {key: до monotonic} — SET ... PX
+
+    def _touch(self, key: bytes):
+        self.versions[key] += 1
+
+    def _expire(self, key: bytes):
+        """Удаляет ключ, если его срок вышел (лениво, при обращении)."""
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            del self.expires[key]
+            self.data.pop(key, None)
+            self._touch(key)
+
+    def _typed(self, key: bytes, kind: type):
+        self._expire(key)
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, kind):
+            raise TypeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    # --- команды (аргументы — bytes) ---
+    def ping(self, *args):
+        return "PONG"
+
+    def select(self, db):
+        return "OK"
+
+    def get(self, key):
+        return self._typed(key, bytes)
+
+    def set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        self._expire(key)
+        if b"NX" in options and key in self.data:
+            return None
+        self.expires.pop(key, None)
+        if b"PX" in options:
+            ttl = int(options[options.index(b"PX") + 1]) / 1000
+            self.expires[key] = time.monotonic() + ttl
+        self.data[key] = value
+        self._touch(key)
+        return "OK"
+
+    def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            self._expire(key)
+            self.expires.pop(key, None)
+            if self.data.pop(key, None) is not None:
+                removed += 1
+                self._touch(key)
+        return removed
+
+    def mget(self, *keys):
+        return [self._typed(key, bytes) for key in keys]
+
+    def sadd(self, key, *members):
+        items = self._typed(key, set)
+        if items is None:
+            items = self.data[key] = set()
+        before = len(items)
+        items.update(members)
+        self._touch(key)
+        return len(items) - before
+
+    def srem(self, key, *members):
+        items = self._typed(key, set) or set()
+        before = len(items)
+        items.difference_update(members)
+        if not items:
+            self.data.pop(key, None)
+        self._touch(key)
+        return before - len(items)
+
+    def smembers(self, key):
+        return list(self._typed(key, set) or ())
+
+    def sismember(self, key, member):
+        return int(member in (self._typed(key, set) or ()))
+
+    def zadd(self, key, *pairs):
+        items = self._typed(key, SortedSet)
+        if items is None:
+            items = self.data[key] = SortedSet()
+        added = sum(
+            items.add(member, float(score)) for score, member in zip(pairs[::2], pairs[1::2])
+        )
+        self._touch(key)
+        return added
+
+    def zrem(self, key, *members):
+        items = self._typed(key, SortedSet)
+        if items is None:
+            return 0
+        removed = sum(items.discard(member) for member in members)
+        if not items.scores:
+            self.data.pop(key, None)
+        self._touch(key)
+        return removed
+
+    def zrangebyscore(self, key, low, high):
+        items = self._typed(key, SortedSet)
+        if items is None:
+            return []
+        return items.range_by_score(float(low), float(high))
+
+    def rpush(self, key, *values):
+        items = self._typed(key, deque)
+        for value in values:
+            # ждущий BLPOP получает значение сразу, мимо списка
+            waiters = self.waiters[key]
+            while waiters and waiters[0].done():
+                waiters.popleft()
+            if waiters:
+                waiters.popleft().set_result(value)
+                continue
+            if items is None:
+                items = self.data[key] = deque()
+            items.append(value)
+        self._touch(key)
+        return len(items or ())
+
+    def lpop(self, key):
+        items = self._typed(key, deque)
+        if not items:
+            return None
+        value = items.popleft()
+        if not items:
+            self.data.pop(key, None)
+        self._touch(key)
+        return value
+
+    def llen(self, key):
+        return len(self._typed(key, deque) or ())
+
+    async def blpop(self, key, timeout):
+        """BLPOP с одним ключом (так его вызывает RedisStateBackend)."""
+        value = self.lpop(key)
+        if value is not None:
+            return [key, value]
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[key].append(waiter)
+        try:
+            value = await asyncio.wait_for(waiter, float(timeout) or None)
+        except asyncio.TimeoutError:
+            return None
+        return [key, value]
+
+
+COMMANDS = {
+    b"PING": "ping",
+    b"SELECT": "select",
+    b"GET": "get",
+    b"SET": "set",
+    b"DEL": "delete",
+    b"MGET": "mget",
+    b"SADD": "sadd",
+    b"SREM": "srem",
+    b"SMEMBERS": "smembers",
+    b"SISMEMBER": "sismember",
+    b"ZADD": "zadd",
+    b"ZREM": "zrem",
+    b"ZRANGEBYSCORE": "zrangebyscore",
+    b"RPUSH": "rpush",
+    b"LPOP": "lpop",
+    b"LLEN": "llen",
+}
+
+
+# -------------------- Протокол --------------------
+def encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, Exception):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()  # inline-команда (redis-cli / telnet)
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+async def serve_client(store: RespStore, reader, writer):
+    """
+    Одно соединение: команды по очереди; WATCH / MULTI / EXEC — состояние соединения.
+    """
+    watched: dict[bytes, int] = {}
+    queued: list | None = None  # команды после MULTI
+    try:
+        while (args := await read_command(reader)) is not None:
+            if not args:
+                continue
+            name, rest = args[0].upper(), args[1:]
+            if name == b"WATCH":
+                for key in rest:
+                    watched[key] = store.versions[key]
+                reply = "OK"
+            elif name == b"UNWATCH":
+                watched.clear()
+                reply = "OK"
+            elif name == b"MULTI":
+                queued = []
+                reply = "OK"
+            elif name == b"DISCARD":
+                queued = None
+                watched.clear()
+                reply = "OK"
+            elif name == b"EXEC":
+                if queued is None:
+                    reply = Exception("ERR EXEC without MULTI")
+                elif any(store.versions[key] != v for key, v in watched.items()):
+                    reply = None  # ключи изменились после WATCH
+                else:
+                    reply = [_call(store, n, a) for n, a in queued]
+                queued = None
+                watched.clear()
+            elif queued is not None:
+                queued.append((name, rest))
+                reply = "QUEUED"
+            elif name == b"BLPOP":
+                reply = await store.blpop(rest[0], rest[-1])
+            else:
+                reply = _call(store, name, rest)
+            writer.write(encode(reply))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+        pass  # клиент отключился / сервер останавливается
+    finally:
+        writer.close()
+
+
+def _call(store: RespStore, name: bytes, args: list[bytes]):
+    method = COMMANDS.get(name)
+    if method is None:
+        return Exception(f"ERR unknown command '{name.decode(errors='replace')}'")
+    try:
+        return getattr(store, method)(*args)
+    except TypeError as e:
+        return Exception(str(e) if "WRONGTYPE" in str(e) else f"ERR wrong arguments for '{name.decode()}'")
+
+
+async def start_store(host: str = "127.0.0.1", port: int = 0):
+    """
+    Запускает сервер в текущем event loop. Возвращает (server, port).
+    port=0 — свободный порт.
+    """
+    store = RespStore()
+    server = await asyncio.start_server(
+        lambda r, w: serve_client(store, r, w), host, port
+    )
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="RESP-хранилище в памяти (замена Redis)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args(argv)
+    server, port = await start_store(args.host, args.port)
+    print(f"✅ RESP-хранилище слушает {args.host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -16,6 +16,10 @@ from dotenv import load_dotenv
 import sys
 import os
 import asyncio
+import io
+import tempfile
+import time
+from datetime import datetime
 
 
 # Импорты из модулей (cogs)
@@ -24,23 +28,56 @@ from cogs.applications import (
     questions,
     load_progress,
     save_progress,
-    finish_form,
-    ask_question,
     process_application_message,
+    answer_reaction,
+    answer_text,
+    start_session_expiry,
+    load_admission_queue,
+    drain_admission_queue,
     user_progress,
+    use_state_backend,
+    hold_session,
+    pull_session,
+    push_session,
+    release_session,
 )
 
+from cogs.archive import find_applications, export_applications
+from cogs.guilds import (
+    guild_configs,
+    get_guild_config,
+    guild_for_channel,
+    load_guild_configs,
+    channel_marks,
+    mark_channel,
+)
+from cogs.monitoring import start_loop_monitor, profile_loop
+from cogs.stats import start_stats_checkpoints, save_stats, format_stats
+from cogs.snapshot import load_snapshot, mark_snapshot_ready, save_snapshot, start_snapshots
+from cogs.outbox import start_outbox_workers
+from cogs.backfill import load_checkpoints, start_backfill, stop_backfill
+from cogs.state import create_backend, answer_queue
+from cogs import perf
+from cogs.trace import (
+    start_recording,
+    stop_recording,
+    record_message,
+    record_reaction,
+)
 from cogs.helpers import (
-    fetch_app_message,
+    add_blacklist_ids,
+    blacklist_ids,
+    BLACKLIST_ID_RE,
     extract_lines,
-    get_next_index,
     load_blacklist_from_channel,
+    send_dm,
+    resolver_stats,
+    resolver_hit_ratio,
 )
 from configuration import (
-    GUILD_ID,
-    TARGET_CHANNEL_ID,
-    REVIEW_ROLES,
     CONFIG_PATH,
+    PROFILE_CHANNEL_ID,
+    BLACKLIST_RESYNC_INTERVAL,
 )
 
 # Глобальная блокировка для работы с прогрессом
@@ -50,6 +87,26 @@ progress_lock = asyncio.Lock()
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 
+# PERF_PROFILE=1 — быстрый JSON-кодек (msgspec / orjson) и uvloop, если установлены
+if os.getenv("PERF_PROFILE") == "1":
+    print(f"⚡ Профиль производительности: {perf.enable_fast_profile()}")
+
+# Несколько процессов: HANDOFF_WORKERS процессов worker.py отвечают на анкеты,
+# этот процесс (шлюз) только принимает события Discord и передаёт ответы им.
+# Анкеты и blacklist — в общем хранилище STATE_BACKEND (redis://host:port/db).
+HANDOFF_WORKERS = int(os.getenv("HANDOFF_WORKERS") or 0)
+state_backend = None
+_resync_task: asyncio.Task | None = None  # периодическое полное чтение канала ЧС
+if HANDOFF_WORKERS:
+    if not os.getenv("STATE_BACKEND", "local").startswith("redis://"):
+        raise RuntimeError("❌ Для HANDOFF_WORKERS нужно общее хранилище STATE_BACKEND=redis://...")
+    state_backend = create_backend(os.getenv("STATE_BACKEND"))
+    use_state_backend(state_backend)
+
+# Запись событий для офлайн-воспроизведения (benchmarks/replay.py)
+if os.getenv("TRACE_FILE"):
+    start_recording(os.getenv("TRACE_FILE"))
+
 # Определяем базовую директорию (exe или py)
 if getattr(sys, "frozen", False):  # если exe
     BASE_DIR = os.path.dirname(sys.executable)
@@ -57,14 +114,41 @@ else:  # если py
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
-# Настройка intents для работы с контентом сообщений, реакциями и участниками
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-intents.reactions = True
-
-# Создание экземпляра бота
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Настройка intents для работы с контентом сообщений, реакциями и участниками.
+#
+# Что боту реально нужно:
+#   guilds          — кэш серверов, каналов и ролей (get_channel, get_role, ветки);
+#   members         — get_member_named / get_member по тегу из анкеты (privileged);
+#   guild_messages  — заявки, канал ЧС и команды;
+#   message_content — текст и эмбеды заявок, команды (privileged);
+#   dm_messages     — текстовые ответы анкеты;
+#   dm_reactions    — ответы анкеты реакциями.
+# Не нужны: presences, voice_states, typing, emojis_and_stickers, invites,
+# webhooks, integrations, scheduled_events, moderation, auto_moderation и
+# guild_reactions (реакции на сервере бот не обрабатывает, галочки в логах
+# дедлайнов читаются из истории).
+# LEAN_INTENTS=1 в .env включает только нужные intents, отключает кэш
+# сообщений и кэширует участников только по событию join (без voice).
+LEAN_INTENTS = os.getenv("LEAN_INTENTS") == "1"
+
+if LEAN_INTENTS:
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.members = True
+    intents.guild_messages = True
+    intents.message_content = True
+    intents.dm_messages = True
+    intents.dm_reactions = True
+    bot_options = {
+        "member_cache_flags": discord.MemberCacheFlags.from_intents(intents),
+        "max_messages": None,
+    }
+else:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    intents.reactions = True
+    bot_options = {}
 
 # Проверяем наличие конфига
 if not os.path.exists(CONFIG_PATH):
@@ -72,8 +156,41 @@ if not os.path.exists(CONFIG_PATH):
         f"❌ Файл {CONFIG_PATH} не найден! Создай config.json рядом с exe"
     )
 
+# Дополнительные серверы из config.json → "GUILDS"
+load_guild_configs()
+
+# Создание экземпляра бота (для нескольких серверов — с автоматическим шардингом)
+AUTO_SHARD = os.getenv("AUTO_SHARD") == "1" or len(guild_configs) > 1
+bot_class = commands.AutoShardedBot if AUTO_SHARD else commands.Bot
+bot = bot_class(command_prefix="!", intents=intents, **bot_options)
+
 
 # -------------------- События --------------------
+async def remind_unfinished(uid: int, entry: dict) -> bool:
+    """
+    Напоминает о незавершённой анкете после перезапуска.
+    False — ЛС не отправилось, анкету нужно удалить.
+    """
+    index = entry.get("index", 0)
+    if index >= len(questions):  # анкета завершена
+        return True
+    try:
+        print(f"⏩ У {uid} есть незавершённая анкета (вопрос {index + 1})")
+
+        # ЛС через кэш ID каналов — без fetch_user / create_dm
+        await send_dm(
+            bot,
+            uid,
+            f"📌 У вас есть незавершённая анкета. "
+            f"Вы остановились на вопросе {index + 1}. "
+            f"Просто ответьте на сообщение-анкеты реакцией.",
+        )
+        return True
+    except Exception as e:
+        print(f"⚠️ Ошибка восстановления анкеты {uid}: {e}")
+        return False
+
+
 @bot.event
 async def on_ready():
     """
@@ -82,158 +199,223 @@ async def on_ready():
     - Восстанавливает прогресс анкет
     - Напоминает пользователям о незавершённых анкетах
     - Проверяет дедлайны
+    С загруженным снимком состояния из Discord читается только новое.
     """
-    global user_progress  # ⬅️ вот тут "съехал" отступ (скорее всего таб, а не 4 пробела)
-
-    # Загружаем чёрный список
+    started = time.perf_counter()
+    # Сторож задержки event loop
+    start_loop_monitor()
+    # Загружаем чёрный список (и отдаём его процессам-обработчикам)
     await load_blacklist_from_channel(bot)
-
-    # загружаем сохранённый прогресс
-    user_progress = await load_progress()
-
-    # восстановление незавершённых анкет
-    for uid, entry in list(user_progress.items()):
-        index = entry.get("index", 0)
-        if index < len(questions):  # анкета не завершена
-            try:
-                user = await bot.fetch_user(uid)
-                print(f"⏩ У {user} есть незавершённая анкета (вопрос {index + 1})")
-
-                dm = user.dm_channel or await user.create_dm()
-                await dm.send(
-                    f"📌 У вас есть незавершённая анкета. "
-                    f"Вы остановились на вопросе {index + 1}. "
-                    f"Просто ответьте на сообщение-анкеты реакцией."
-                )
-
-            except Exception as e:
-                print(f"⚠️ Ошибка восстановления анкеты {uid}: {e}")
+    if state_backend is not None:
+        for guild_id, ids in blacklist_ids.items():
+            await state_backend.set_blacklist(guild_id, ids)
+
+    # загружаем сохранённый прогресс (обновляет общий user_progress на месте)
+    await load_progress()
+
+    # восстановление незавершённых анкет (с общим хранилищем — анкеты из него,
+    # каждая под арендой, чтобы не пересечься с ответом у обработчика)
+    if state_backend is None:
+        for uid, entry in list(user_progress.items()):
+            if not await remind_unfinished(uid, entry):
                 user_progress.pop(uid, None)
+    else:
+        for uid in await state_backend.session_ids():
+            async with hold_session(uid):
+                entry = await pull_session(uid)
+                if entry is None:
+                    continue
+                if await remind_unfinished(uid, entry):
+                    release_session(uid)
+                else:
+                    user_progress.pop(uid, None)
+                    await push_session(uid)  # удаляет анкету из хранилища
 
     await save_progress()
     print(f"✅ Logged in as {bot.user}")
 
-    # Проверяем канал с анкетами (ищем новые сообщения без реакций)
-    guild = bot.get_guild(GUILD_ID)
-    if guild is None:
-        return
-    channel = bot.get_channel(TARGET_CHANNEL_ID)
-    if channel is None:
-        return
+    # Продолжаем очередь допуска, прерванную перезапуском
+    load_admission_queue()
+    drain_admission_queue(bot)
 
-    async for message in channel.history(limit=10):
-        if message.reactions:
+    # Действия по завершённым анкетам (в том числе не выполненные до перезапуска)
+    start_outbox_workers(bot)
+
+    for guild_id, state in load_checkpoints().items():
+        print(
+            f"⏸ Переобработка заявок сервера {guild_id} прервана на ID "
+            f"{state['resume_after']} — продолжить: !reprocess resume"
+        )
+
+    # Фоновая очистка заброшенных анкет, полное перечитывание ЧС и статистика
+    start_session_expiry(bot)
+    global _resync_task
+    if _resync_task is None:
+        _resync_task = asyncio.create_task(blacklist_resync_loop())
+    start_stats_checkpoints()
+    start_snapshots()
+
+    rebuilt = True  # всё состояние для снимка дочитано из Discord
+    for guild_id, config in guild_configs.items():
+        # Проверяем канал с анкетами (ищем новые сообщения без реакций)
+        guild = bot.get_guild(guild_id)
+        if guild is None:
             continue
-        full_text = message.content or ""
-        if message.embeds:
-            embed = message.embeds[0]
-            if embed.description:
-                full_text += "\n" + embed.description
-            for field in embed.fields:
-                full_text += f"\n{field.name}\n{field.value}"
-
-        if "Ваш DISCORD" in full_text:
-            await process_application_message(bot, message)
-
-    # Проверяем дедлайны
-    try:
-        await check_deadlines(bot, GUILD_ID, REVIEW_ROLES)
-    except Exception as e:
-        print(f"⚠️ Ошибка при проверке дедлайнов: {e}")
+        channel = bot.get_channel(config["target_channel_id"])
+        if channel is not None:
+            # после снимка — все заявки с последней учтённой, иначе 10 последних
+            mark = channel_marks.get(channel.id)
+            if mark:
+                history = channel.history(limit=None, after=discord.Object(mark))
+            else:
+                history = channel.history(limit=10)
+            async for message in history:
+                mark_channel(channel.id, message.id)
+                if message.reactions:
+                    continue
+                full_text = message.content or ""
+                if message.embeds:
+                    embed = message.embeds[0]
+                    if embed.description:
+                        full_text += "\n" + embed.description
+                    for field in embed.fields:
+                        full_text += f"\n{field.name}\n{field.value}"
+
+                if "Ваш DISCORD" in full_text:
+                    await process_application_message(bot, message)
+
+        # Проверяем дедлайны
+        try:
+            await check_deadlines(bot, guild_id, config["review_roles"])
+        except Exception as e:
+            print(f"⚠️ Ошибка при проверке дедлайнов ({guild_id}): {e}")
+            rebuilt = False
 
+    # без снимка — сохранять можно только полностью собранное состояние
+    if rebuilt:
+        mark_snapshot_ready()
+    print(f"⏱ Готов к работе за {time.perf_counter() - started:.2f} с")
 
-@bot.event
-async def on_message(message):
+
+# -------------------- Полное перечитывание ЧС --------------------
+async def resync_blacklist(guild_id: int | None = None):
     """
-    Обработчик всех входящих сообщений.
-    Логика:
-      1. Сообщения в канале заявок → запуск обработки анкеты.
-      2. Сообщения в личке (DM) → продолжение диалога по анкете.
+    Читает канал ЧС заново целиком (без guild_id — всех серверов) и отдаёт
+    blacklist процессам-обработчикам.
     """
-    global user_progress
+    await load_blacklist_from_channel(bot, guild_id, full=True)
+    if state_backend is not None:
+        for gid in [guild_id] if guild_id is not None else list(blacklist_ids):
+            await state_backend.set_blacklist(gid, blacklist_ids.get(gid, set()))
 
-    # Игнорируем свои же сообщения
-    if message.author == bot.user:
-        return
 
-    # ==============================
-    # === Сообщения в канале заявок
-    # ==============================
-    if message.channel.id == TARGET_CHANNEL_ID:
-        lines = extract_lines(message)
+async def blacklist_resync_loop():
+    """
+    Фоновая задача: раз в BLACKLIST_RESYNC_INTERVAL перечитывает канал ЧС
+    целиком — со снимком при запуске читаются только новые сообщения, а
+    удалённые, пока бот был выключен, так уходят из blacklist.
+    """
+    while True:
+        await asyncio.sleep(BLACKLIST_RESYNC_INTERVAL)
+        try:
+            await resync_blacklist()
+        except Exception as e:
+            print(f"⚠️ Ошибка при перечитывании канала ЧС: {e}")
 
-        # Проверяем, содержит ли сообщение признаки анкеты
-        if any("ваш discord" in line.lower() for line in lines):
-            await process_application_message(bot, message)
-        return
 
-    # ==============================
-    # === Сообщения в личке (DM)
-    # ==============================
-    if isinstance(message.channel, discord.DMChannel):
-        uid = message.author.id
+# -------------------- Маршрутизация сообщений --------------------
+async def handle_application_channel(message):
+    """
+    Сообщение в канале заявок → запуск обработки анкеты.
+    """
+    lines = extract_lines(message)
 
-        # Загружаем прогресс пользователя (если его ещё нет в памяти)
-        if uid not in user_progress:
-            loaded = await load_progress()
-            user_progress.update(loaded)
+    # Проверяем, содержит ли сообщение признаки анкеты
+    if any("ваш discord" in line.lower() for line in lines):
+        await process_application_message(bot, message)
+    mark_channel(message.channel.id, message.id)
 
-            # Если анкета всё ещё не найдена — игнорируем сообщение
-            if uid not in user_progress:
-                return
 
-        # Обновляем прогресс из файла (актуализация)
-        user_progress = await load_progress()
-        entry = user_progress[uid]
+async def handle_blacklist_channel(message):
+    """
+    Сообщение в канале ЧС → новые ID сразу попадают в blacklist сервера.
+    """
+    guild_id = guild_for_channel(message.channel.id)
+    added = add_blacklist_ids(guild_id, message.content)
+    mark_channel(message.channel.id, message.id)
+    if added and state_backend is not None:
+        await state_backend.add_blacklist(
+            guild_id, set(BLACKLIST_ID_RE.findall(message.content))
+        )
+    if added:
+        print(f"⛔ В ЧС добавлено {added} ID из сообщения {message.id}")
 
-        answers = entry.get("answers", [])
-        index = entry.get("index", 0)
 
-        # Проверяем, не вышел ли индекс за пределы списка вопросов
-        if index >= len(questions):
-            return
+async def handle_dm(message):
+    """
+    Сообщение в личке (DM) → продолжение диалога по анкете.
+    """
+    uid = message.author.id
 
-        q = questions[index]
+    # Анкетами занимаются процессы-обработчики → передаём ответ им
+    if HANDOFF_WORKERS:
+        await state_backend.push(
+            answer_queue(uid, HANDOFF_WORKERS),
+            {"kind": "text", "uid": uid, "content": message.content},
+        )
+        return
 
-        # ==============================
-        # === Текстовый вопрос
-        # ==============================
-        if not q.get("options"):  # если вопрос без вариантов ответа
-            answers.append(message.content)
+    # Текстовый вопрос → принимаем ответ (повторы во время перехода отбрасываются)
+    try:
+        await answer_text(bot, uid, message.content, user=message.author)
+    except Exception as e:
+        print(f"⚠️ Не удалось задать следующий вопрос {uid}: {e}")
 
-            # Переходим к следующему вопросу
-            new_index = await get_next_index(index, answers)
 
-            # Защита от зацикливания: если индекс не изменился — двигаем вручную
-            if new_index <= index:
-                new_index = index + 1
+# Обработчики по ID канала (строятся из настроек серверов) и по типу канала
+channel_handlers: dict = {}
+type_handlers = {discord.ChannelType.private: handle_dm}
 
-            entry["index"] = new_index
-            entry["answers"] = answers
 
-            # --- Есть ещё вопросы → задаём следующий
-            if new_index < len(questions):
-                try:
-                    new_qmsg = await ask_question(bot, message.author, new_index)
-                except Exception:
-                    return
+def build_channel_handlers():
+    """
+    Заполняет channel_handlers: канал заявок и канал ЧС каждого сервера.
+    """
+    channel_handlers.clear()
+    for config in guild_configs.values():
+        if config.get("target_channel_id"):
+            channel_handlers[config["target_channel_id"]] = handle_application_channel
+        if config.get("blacklist_channel_id"):
+            channel_handlers[config["blacklist_channel_id"]] = handle_blacklist_channel
 
-                entry["qmsg_id"] = new_qmsg.id if new_qmsg else None
-                user_progress[uid] = entry
-                await save_progress()
 
-            # --- Вопросы закончились → завершаем анкету
-            else:
-                msg_obj = await fetch_app_message(bot, entry.get("msg_id"))
-                await finish_form(bot, uid, answers, msg_obj)
-                await save_progress()
+build_channel_handlers()
+
+
+@bot.event
+async def on_message(message):
+    """
+    Обработчик всех входящих сообщений.
+    Сообщение из канала без обработчика отбрасывается после одного поиска
+    в словаре (и проверки префикса команды на сервере).
+    """
+    # Команды (!app и т.д.) — только на сервере
+    if message.guild is not None and message.content.startswith("!"):
+        if message.author.id != bot.user.id:
+            await bot.process_commands(message)
+
+    handler = channel_handlers.get(message.channel.id) or type_handlers.get(
+        message.channel.type
+    )
+    if handler is None:
+        return
+
+    # Игнорируем свои же сообщения
+    if message.author.id == bot.user.id:
+        return
 
-        # ==============================
-        # === Вопрос с вариантами
-        # ==============================
-        else:
-            # На такие вопросы ожидаются реакции, поэтому в DM ничего не делаем
-            return
+    record_message(message)
+    await handler(message)
 
 
 @bot.event
@@ -243,49 +425,172 @@ async def on_raw_reaction_add(payload):
     - Сохраняет выбранный вариант ответа
     - Переходит к следующему вопросу
     """
-    user_progress = await load_progress()
     if payload.user_id == bot.user.id:
         return
 
+    record_reaction(payload)
     uid = payload.user_id
-    emoji = str(payload.emoji)
 
-    entry = user_progress.get(uid)
-    if not entry:
-        print(f"[DEBUG] У {uid} нет активной анкеты")
+    # Анкеты идут в ЛС → реакции на сервере передавать обработчикам незачем
+    if HANDOFF_WORKERS:
+        if payload.guild_id is None:
+            await state_backend.push(
+                answer_queue(uid, HANDOFF_WORKERS),
+                {
+                    "kind": "reaction",
+                    "uid": uid,
+                    "message_id": payload.message_id,
+                    "emoji": str(payload.emoji),
+                },
+            )
+        return
 
-    index = entry.get("index", 0)
-    qmsg_id = entry.get("qmsg_id")
-    # Проверяем, что реакция поставлена на актуальное сообщение с вопросом
-    if payload.message_id != qmsg_id:
-        print(
-            f"[DEBUG] Игнорируем реакцию — сообщение не совпадает ({payload.message_id} != {qmsg_id})"
+    # сохраняем ответ и переходим дальше (повторные клики отбрасываются)
+    try:
+        await answer_reaction(
+            bot, uid, payload.message_id, str(payload.emoji), user=payload.member
         )
-        return
+    except Exception as e:
+        print(f"⚠️ Не удалось задать следующий вопрос {uid}: {e}")
+
 
-    q = questions[index]
-    options = q.get("options")
-    if not options or emoji not in options:
+@bot.event
+async def on_raw_message_delete(payload):
+    """
+    Удалено сообщение в канале ЧС → blacklist сервера перечитывается целиком
+    (тот же ID мог быть и в другом сообщении, поэтому не просто вычитаем).
+    """
+    if channel_handlers.get(payload.channel_id) is handle_blacklist_channel:
+        await resync_blacklist(guild_for_channel(payload.channel_id))
+
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    if channel_handlers.get(payload.channel_id) is handle_blacklist_channel:
+        await resync_blacklist(guild_for_channel(payload.channel_id))
+
+
+# -------------------- Команды --------------------
+def is_reviewer():
+    """
+    Проверка команды: у автора есть одна из ролей проверяющих своего сервера.
+    """
+
+    async def predicate(ctx):
+        review_roles = set(get_guild_config(ctx.guild.id)["review_roles"])
+        return any(role.id in review_roles for role in ctx.author.roles)
+
+    return commands.check(predicate)
+
+
+@bot.command(name="app")
+@commands.guild_only()
+@is_reviewer()
+async def app_lookup(ctx, *, query: str):
+    """
+    Поиск завершённых анкет в архиве по UID / ID анкеты / имени.
+    Отвечает из локального индекса, без чтения истории каналов.
+    """
+    rows = find_applications(query, ctx.guild.id, limit=5)
+    if not rows:
+        await ctx.reply(f"🔍 По запросу `{query}` анкет не найдено.")
         return
 
-    # сохраняем ответ
-    entry["answers"].append(options[emoji])
-    entry["index"] = await get_next_index(index, entry["answers"])
-    user_progress[uid] = entry
-    await save_progress()
+    blocks = []
+    for row in rows:
+        finished = datetime.fromtimestamp(row["finished_at"]).strftime("%Y-%m-%d %H:%M")
+        thread = f"<#{row['thread_id']}>" if row["thread_id"] else "—"
+        blocks.append(
+            f"📋 <@{row['uid']}> (`{row['uid']}`) — **{row['verdict']}**\n"
+            f"Баллы: {row['score'] if row['score'] is not None else '—'} | "
+            f"Дата: {finished}\n"
+            f"UID анкеты: `{row['msg_id']}` | Ветка: {thread}"
+        )
+    await ctx.reply("\n\n".join(blocks))
+
+
+@bot.command(name="app_export")
+@commands.guild_only()
+@is_reviewer()
+async def app_export(ctx):
+    """
+    Выгружает весь архив анкет в CSV (построчно, без загрузки архива в память).
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "applications.csv")
+        count = await asyncio.to_thread(export_applications, path, ctx.guild.id)
+        await ctx.reply(
+            f"📦 Выгружено анкет: {count}", file=discord.File(path)
+        )
+
+
+@bot.command(name="stats")
+@commands.guild_only()
+@is_reviewer()
+async def stats_command(ctx):
+    """
+    Воронка анкет: где бросают, сколько отвечают на вопрос, вердикты и баллы.
+    """
+    await ctx.reply(format_stats(len(questions)))
+
+
+@bot.command(name="profile")
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def profile(ctx, seconds: int = 10):
+    """
+    Сэмплирующий профайлер живого бота (только для админов).
+    Файл collapsed stacks уходит в PROFILE_CHANNEL_ID (или в ЛС админу).
+    """
+    seconds = max(1, min(seconds, 120))
+    await ctx.reply(f"🔬 Профилирую {seconds} с...")
+    data = await profile_loop(seconds)
+
+    filename = f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+    target = bot.get_channel(PROFILE_CHANNEL_ID) if PROFILE_CHANNEL_ID else None
+    target = target or ctx.author
+    await target.send(
+        f"🔬 Профиль за {seconds} с (flamegraph.pl / speedscope)",
+        file=discord.File(io.BytesIO(data), filename=filename),
+    )
 
-    user = await bot.fetch_user(uid)
 
-    # Следующий вопрос или завершение анкеты
-    if entry["index"] < len(questions):
-        new_qmsg = await ask_question(bot, user, entry["index"])
-        if new_qmsg:
-            entry["qmsg_id"] = new_qmsg.id
-            user_progress[uid] = entry
-            await save_progress()
+@bot.command(name="reprocess")
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def reprocess(ctx, start: str, end: int | None = None):
+    """
+    Повторная обработка заявок канала заявок (только для админов):
+    !reprocess <from_id> [to_id] — диапазон ID сообщений (включительно);
+    !reprocess resume — продолжить прерванную; !reprocess stop — остановить.
+    """
+    if start == "stop":
+        stopped = stop_backfill(ctx.guild.id)
+        if not stopped:
+            await ctx.reply("🔍 Переобработка не запущена")
+        return
+
+    if start == "resume":
+        error = start_backfill(bot, ctx.guild.id, ctx.channel)
+    elif start.isdigit():
+        error = start_backfill(bot, ctx.guild.id, ctx.channel, int(start), end)
     else:
-        msg_obj = await fetch_app_message(entry.get("msg_id"))
-        await finish_form(bot, uid, entry["answers"], msg_obj)
+        error = "Использование: `!reprocess <from_id> [to_id]`, `resume` или `stop`"
+    if error:
+        await ctx.reply(error)
+
+
+@bot.command(name="cachestats")
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def cachestats(ctx):
+    """
+    Статистика кэша пользователей: сколько запросов обошлось без REST.
+    """
+    stats = ", ".join(f"{k}: {v}" for k, v in resolver_stats.items())
+    await ctx.reply(
+        f"👥 Кэш пользователей — попаданий {resolver_hit_ratio():.1%}\n{stats}"
+    )
 
 
 # -------------------- Запуск --------------------
@@ -294,14 +599,22 @@ async def run_bot():
     Запускает бота с автоматическим перезапуском
     при ошибках подключения.
     """
+    # Снимок состояния: из Discord догружается только новое
+    load_snapshot()
 
-    while True:
-        try:
-            await bot.start(TOKEN)
-        except Exception as e:
-            print(f"❌ Ошибка при запуске: {e}")
-            print("⏳ Жду 30 секунд и пробую снова...")
-            await asyncio.sleep(30)
+    try:
+        while True:
+            try:
+                await bot.start(TOKEN)
+            except Exception as e:
+                print(f"❌ Ошибка при запуске: {e}")
+                print("⏳ Жду 30 секунд и пробую снова...")
+                await asyncio.sleep(30)
+    finally:
+        stop_recording()
+        save_stats()
+        save_snapshot()
 
 
-asyncio.run(run_bot())
+if __name__ == "__main__":
+    perf.run(run_bot())
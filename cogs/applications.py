@@ -5,37 +5,75 @@ applications.py — управление заявками (анкеты HR-бо
 - Ведение прогресса анкет (загрузка/сохранение)
 - Задавание вопросов в ЛС и сбор ответов
 - Проверка ЧС / отклонённых
-- Присвоение ролей и изменение ника
-- Создание веток для рассмотрения заявок
+- Решение по анкете; роли, ник, ЛС и ветка для заявки — через outbox
+- Анкеты в общем хранилище (cogs/state.py), если бот работает в несколько процессов
 """
 
 import os
 import discord
 import json
 import asyncio
-from cogs.deadlines import (
-    log_deadline,
-)
+import contextlib
+import secrets
+import time
+from collections import OrderedDict, deque
+from weakref import WeakValueDictionary
+from cogs import perf, stats
+from cogs.archive import archive_application
+from cogs.outbox import new_job, add_effect, commit_job
+from cogs.guilds import get_guild_config, guild_for_channel
+from cogs.trace import record_member
 from cogs.helpers import (
     extract_lines,
+    fetch_app_message,
+    get_next_index,
     load_config,
     is_blacklisted,
     is_declined,
     calculate_score,
+    load_ids,
     save_id,
+    send_dm,
+    resolve_member,
 )
 
 from configuration import (
     GUILD_ID,
-    ROLE_IDS,
-    REVIEW_ROLES,
-    DECLINED_FILE,
     PROGRESS_FILE,
+    PROCESSED_FILE,
+    SESSION_TTL,
+    SESSION_REMINDER_AFTER,
+    SESSION_SWEEP_INTERVAL,
+    QUEUE_FILE,
+    MAX_CONCURRENT_ONBOARDING,
+    SESSION_LEASE_TTL,
 )
 
 # -------------------------Глобальные переменные -------------------------
 progress_lock = asyncio.Lock()  # блокировка для синхронного доступа к файлу прогресса
-user_progress = {}  # {uid: {answers, index, msg_id, qmsg_id}}
+user_progress = {}  # {uid: {answers, index, msg_id, qmsg_id, guild_id, name, last_active}}
+processed_messages: set[str] = load_ids(PROCESSED_FILE)  # ID обработанных заявок
+handling_messages: set[str] = set()  # ID заявок, которые сейчас обрабатываются
+onboarding_uids: set[int] = set()  # пользователи, которым сейчас отправляется 1-й вопрос
+answering: set[tuple[int, int]] = set()  # (uid, index) — переход по вопросу уже идёт
+
+# Очередь допуска: заявки ждут, пока освободится место для запуска анкеты
+admission_queue: deque[dict] = deque()  # [{uid, msg_id, guild_id}]
+queued_uids: set[int] = set()
+_queue_loaded = False
+_background_tasks: set[asyncio.Task] = set()
+
+# Индексы истечения анкет: {uid: last_active}, упорядочены по last_active
+# (старые в начале). Удаление ленивое — устаревшие записи пропускаются при обходе.
+reminder_index: OrderedDict[int, float] = OrderedDict()
+expiry_index: OrderedDict[int, float] = OrderedDict()
+_expiry_task: asyncio.Task | None = None
+
+# Общее хранилище анкет (cogs/state.py). None — анкеты живут только в user_progress
+# этого процесса; иначе user_progress — рабочие копии на время обработки события
+state_backend = None
+session_versions: dict[int, int] = {}  # {uid: версия анкеты при чтении из хранилища}
+session_locks: WeakValueDictionary[int, asyncio.Lock] = WeakValueDictionary()
 
 
 # Список вопросов анкеты
@@ -82,71 +120,387 @@ async def load_progress():
     """
     Загружает прогресс анкет из PROGRESS_FILE.
     Формат файла: { "uid": {answers, index, msg_id, qmsg_id} }
+    С общим хранилищем анкеты из файла переносятся в него, user_progress пуст.
     """
     global user_progress
+    if state_backend is not None:
+        await _migrate_progress()
+        return {}
     async with progress_lock:
         if os.path.exists(PROGRESS_FILE):
             try:
-                with open(PROGRESS_FILE, "r", encoding="utf-8") as f:
-                    data = json.load(f)
+                with open(PROGRESS_FILE, "rb") as f:
+                    data = perf.load_progress(f.read())
                     user_progress.clear()
-                    user_progress.update({int(uid): v for uid, v in data.items()})
-                    return {int(uid): v for uid, v in data.items()}
+                    user_progress.update(data)
+                    rebuild_expiry_index()
+                    return dict(data)
             except Exception as e:
                 print(f"⚠️ Ошибка при загрузке прогресса: {e}")
         return {}
 
 
+async def _migrate_progress():
+    """
+    Переносит анкеты из PROGRESS_FILE в общее хранилище (первый запуск в
+    несколько процессов) и переименовывает файл, чтобы не перенести их повторно.
+    """
+    if not os.path.exists(PROGRESS_FILE):
+        return
+    try:
+        with open(PROGRESS_FILE, "rb") as f:
+            data = perf.load_progress(f.read())
+        moved = 0
+        now = time.time()
+        for uid, entry in data.items():
+            entry.setdefault("last_active", now)  # как rebuild_expiry_index
+            # версия 0 — только если в хранилище анкеты ещё нет
+            if await state_backend.cas_session(uid, 0, entry) is not None:
+                moved += 1
+        os.replace(PROGRESS_FILE, PROGRESS_FILE + ".migrated")
+        print(f"✅ В общее хранилище перенесено анкет: {moved}")
+    except Exception as e:
+        print(f"⚠️ Ошибка при переносе прогресса в хранилище: {e}")
+
+
 async def save_progress():
     """
     Сохраняет user_progress в PROGRESS_FILE.
+    С общим хранилищем не нужно — анкеты записываются в него (push_session).
     """
+    if state_backend is not None:
+        return
     async with progress_lock:
         try:
-            data = {str(uid): v for uid, v in user_progress.items()}
-            with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            data = perf.dump_progress(user_progress)
+            with open(PROGRESS_FILE, "wb") as f:
+                f.write(data)
         except Exception as e:
             print(f"⚠️ Ошибка при сохранении прогресса: {e}")
 
 
-# -------------------------Основная логика анкеты-------------------------
-async def finish_form(bot, uid, answers, msg):
+# -------------------------Общее хранилище анкет-------------------------
+def use_state_backend(backend):
     """
-    Завершает обработку анкеты:
-    - Проверяет ЧС / отклонённых
-    - Считает баллы
-    - Присваивает роли и ник
-    - Создаёт ветку для заявки
-    - Чистит прогресс
+    Подключает общее хранилище анкет (бот в несколько процессов, см. worker.py).
+    """
+    global state_backend
+    state_backend = backend
+
+
+def session_lock(uid: int) -> asyncio.Lock:
+    """
+    Блокировка анкеты пользователя в этом процессе: пока одно событие держит
+    рабочую копию, другое событие того же пользователя ждёт.
+    """
+    lock = session_locks.get(uid)
+    if lock is None:
+        lock = session_locks[uid] = asyncio.Lock()
+    return lock
+
+
+async def pull_session(uid: int) -> dict | None:
+    """
+    Читает анкету из общего хранилища в user_progress (рабочая копия) и
+    запоминает её версию. Без хранилища — просто анкета из user_progress.
+    """
+    if state_backend is None:
+        return user_progress.get(uid)
+    entry, version = await state_backend.get_session(uid)
+    session_versions[uid] = version
+    if entry is None:
+        user_progress.pop(uid, None)
+    else:
+        user_progress[uid] = entry
+    return entry
+
+
+def _merge_session(ours: dict | None, theirs: dict | None) -> dict | None:
+    """
+    Слияние при конфликте записи (аренда истекла, пока процесс ждал Discord).
+    Побеждает копия с более поздним переходом (last_active обновляет каждый
+    заданный вопрос): в ней qmsg_id вопроса, который пользователь видит последним.
+    Напоминание (reminded) переходом не считается и сохраняется из любой копии.
     """
-    guild = bot.get_guild(GUILD_ID)
-    member = None
-    if guild:
+    if ours is None or theirs is None:
+        # завершение / удаление анкеты — окончательное решение одного из процессов
+        return None
+    if ours.get("last_active", 0) < theirs.get("last_active", 0):
+        return theirs
+    if ours.get("last_active") == theirs.get("last_active") and theirs.get("reminded"):
+        ours["reminded"] = True
+    return ours
+
+
+async def push_session(uid: int) -> bool:
+    """
+    Записывает рабочую копию анкеты в общее хранилище (compare-and-set по версии
+    из pull_session) и отпускает её. Если анкеты больше нет в user_progress —
+    она удаляется из хранилища.
+    Если анкету за это время изменил другой процесс, она перечитывается и
+    записывается слияние (_merge_session). Возвращает False, если записать
+    так и не удалось (хранилище недоступно).
+    """
+    if state_backend is None:
+        return True
+    entry = user_progress.pop(uid, None)
+    version = session_versions.pop(uid, 0)
+    if entry is None and version == 0:
+        return True  # анкеты не было и нет
+    try:
+        for _ in range(3):
+            if await state_backend.cas_session(uid, version, entry) is not None:
+                return True
+            theirs, version = await state_backend.get_session(uid)
+            merged = _merge_session(entry, theirs)
+            print(
+                f"⚠️ Анкету {uid} изменил другой процесс — "
+                f"{'оставлена его версия' if merged is theirs else 'записано слияние'}"
+            )
+            if merged is theirs:
+                return True
+            entry = merged
+    except Exception as e:
+        print(f"⚠️ Не удалось записать анкету {uid} в хранилище: {e}")
+        return False
+    print(f"⚠️ Анкету {uid} не удалось записать: хранилище всё время меняется")
+    return False
+
+
+def release_session(uid: int):
+    """
+    Отпускает рабочую копию анкеты без записи (она не менялась).
+    """
+    if state_backend is not None:
+        user_progress.pop(uid, None)
+        session_versions.pop(uid, None)
+
+
+@contextlib.asynccontextmanager
+async def hold_session(uid: int):
+    """
+    Исключительный доступ к анкете: session_lock в этом процессе и, с общим
+    хранилищем, аренда анкеты между процессами на всё время от чтения до записи
+    (вместе с отправкой вопросов в Discord). Аренда истекает сама через
+    SESSION_LEASE_TTL, если процесс упал.
+    """
+    async with session_lock(uid):
+        if state_backend is None:
+            yield
+            return
+        token = secrets.token_hex(8)
+        while not await state_backend.acquire_lease(uid, token, SESSION_LEASE_TTL):
+            await asyncio.sleep(0.05)
         try:
-            member = guild.get_member(uid) or await guild.fetch_member(uid)
-        except Exception:
-            member = None
+            yield
+        finally:
+            try:
+                await state_backend.release_lease(uid, token)
+            except Exception as e:
+                print(f"⚠️ Не удалось отпустить аренду анкеты {uid}: {e}")
+
 
-    async def safe_send(target_member, text):
-        """Отправка ЛС пользователю (если закрыто — ставим реакцию в анкете)."""
+@contextlib.asynccontextmanager
+async def shared_session(uid: int):
+    """
+    Анкета пользователя на время обработки события: под hold_session
+    читается из хранилища, по выходе записывается обратно.
+    """
+    async with hold_session(uid):
         try:
-            if isinstance(target_member, (discord.Member, discord.User)):
-                await target_member.send(text)
-            else:
-                user = await bot.fetch_user(uid)
-                await user.send(text)
-        except discord.Forbidden:
-            if msg:
-                try:
-                    await msg.add_reaction("🚷")
-                    await msg.reply(
-                        "🚷 Этот пользователь закрыл ЛС или вышел. DM не отправлен."
-                    )
-                except Exception:
-                    pass
+            yield await pull_session(uid)
+        finally:
+            await push_session(uid)
+
+
+# -------------------------Истечение заброшенных анкет-------------------------
+def touch_session(uid: int):
+    """
+    Отмечает активность пользователя: обновляет last_active и переносит его
+    в конец обоих индексов истечения (O(1)). С общим хранилищем индексы
+    ведёт оно само (cas_session), локальные не заполняются.
+    """
+    now = time.time()
+    entry = user_progress[uid]
+    entry["last_active"] = now
+    entry.pop("reminded", None)
+    if state_backend is not None:
+        return
+    for index in (reminder_index, expiry_index):
+        index[uid] = now
+        index.move_to_end(uid)
+
+
+def rebuild_expiry_index():
+    """
+    Перестраивает индексы истечения после загрузки прогресса с диска.
+    Анкетам без last_active (старый формат) отсчёт начинается с текущего момента.
+    """
+    now = time.time()
+    reminder_index.clear()
+    expiry_index.clear()
+    for uid, entry in sorted(
+        user_progress.items(), key=lambda item: item[1].setdefault("last_active", now)
+    ):
+        if not entry.get("reminded"):
+            reminder_index[uid] = entry["last_active"]
+        expiry_index[uid] = entry["last_active"]
+
+
+def _pop_due(index: OrderedDict, age: float, now: float):
+    """
+    Снимает с начала индекса записи старше age и отдаёт актуальные (uid, entry).
+    Стоимость — O(истёкших), остальные записи не просматриваются.
+    """
+    while index:
+        uid, last_active = next(iter(index.items()))
+        if last_active + age > now:
+            return
+        index.popitem(last=False)
+        entry = user_progress.get(uid)
+        if entry is not None and entry.get("last_active") == last_active:
+            yield uid, entry
+
+
+async def _remind_session(bot, uid: int, entry: dict):
+    """
+    Напоминает пользователю о незаконченной анкете (один раз).
+    """
+    entry["reminded"] = True
+    try:
+        await send_dm(
+            bot,
+            uid,
+            f"⏰ Вы не закончили анкету (вопрос {entry.get('index', 0) + 1}). "
+            f"Если не ответить, она будет удалена через "
+            f"{round((SESSION_TTL - SESSION_REMINDER_AFTER) / 3600)} ч.",
+        )
+    except Exception as e:
+        print(f"⚠️ Не удалось напомнить {uid} об анкете: {e}")
+
+
+def _evict_session(uid: int, entry: dict):
+    """
+    Удаляет заброшенную анкету, архивируя частичные ответы.
+    """
+    archive_application(
+        uid,
+        None,
+        "Заброшена",
+        None,
+        entry.get("answers", []),
+        msg_id=entry.get("msg_id"),
+        guild_id=entry.get("guild_id"),
+    )
+    user_progress.pop(uid, None)
+    stats.record_abandoned(entry.get("index", 0))
+    print(f"🗑️ Анкета {uid} удалена по истечении срока (вопрос {entry.get('index', 0) + 1})")
+
+
+async def evict_expired_sessions(bot):
+    """
+    Один проход по индексам истечения:
+    - напоминает (один раз) тем, кто молчит дольше SESSION_REMINDER_AFTER;
+    - удаляет анкеты старше SESSION_TTL, архивируя частичные ответы.
+    """
+    if state_backend is not None:
+        await evict_shared_sessions(bot)
+        return
+    now = time.time()
+
+    reminded = []
+    if SESSION_REMINDER_AFTER:
+        for uid, entry in list(_pop_due(reminder_index, SESSION_REMINDER_AFTER, now)):
+            if entry["last_active"] + SESSION_TTL <= now:
+                entry["reminded"] = True
+                continue  # всё равно удаляется в этом же проходе
+            await _remind_session(bot, uid, entry)
+            reminded.append(uid)
+
+    evicted = list(_pop_due(expiry_index, SESSION_TTL, now))
+    for uid, entry in evicted:
+        _evict_session(uid, entry)
+
+    # флаг reminded тоже сохраняем — иначе после перезапуска напоминание повторится
+    if evicted or reminded:
+        await save_progress()
+
+
+async def evict_shared_sessions(bot):
+    """
+    Проход истечения по анкетам общего хранилища (выполняет один процесс).
+    Кандидатов отдают индексы истечения хранилища (due_sessions) — O(истёкших),
+    остальные анкеты не читаются и не арендуются. Кандидат перечитывается под
+    hold_session (аренда держится и во время отправки напоминания); если его
+    успели продвинуть, он отпускается без записи.
+    """
+    now = time.time()
+    due = set(await state_backend.due_sessions("expiry", now - SESSION_TTL))
+    if SESSION_REMINDER_AFTER:
+        due.update(await state_backend.due_sessions("remind", now - SESSION_REMINDER_AFTER))
+    for uid in due:
+        async with hold_session(uid):
+            entry = await pull_session(uid)
+            if entry is None:
+                continue
+            stamped = "last_active" not in entry  # старый формат: отсчёт с этого прохода
+            last_active = entry.setdefault("last_active", now)
+            if last_active + SESSION_TTL <= now:
+                _evict_session(uid, entry)
+            elif (
+                SESSION_REMINDER_AFTER
+                and not entry.get("reminded")
+                and last_active + SESSION_REMINDER_AFTER <= now
+            ):
+                await _remind_session(bot, uid, entry)
+            elif not stamped:
+                release_session(uid)
+                continue
+            await push_session(uid)  # новое место в индексах (или удаление)
+
+
+async def session_expiry_loop(bot):
+    """
+    Фоновая задача: раз в SESSION_SWEEP_INTERVAL удаляет заброшенные анкеты.
+    """
+    while True:
+        try:
+            await evict_expired_sessions(bot)
         except Exception as e:
-            print(f"⚠️ Не удалось отправить DM {uid}: {e}")
+            print(f"⚠️ Ошибка при очистке заброшенных анкет: {e}")
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+
+
+def start_session_expiry(bot):
+    """
+    Запускает session_expiry_loop (повторные вызовы из on_ready игнорируются).
+    """
+    global _expiry_task
+    if _expiry_task is None:
+        _expiry_task = asyncio.create_task(session_expiry_loop(bot))
+
+
+# -------------------------Основная логика анкеты-------------------------
+async def finish_form(bot, uid, answers, msg_id=None):
+    """
+    Завершает обработку анкеты:
+    - Проверяет ЧС / отклонённых
+    - Считает баллы и выносит решение
+    - Одной атомарной записью кладёт в outbox все действия: реакцию, роли и ник,
+      ЛС, лог дедлайна, ветку для заявки и запись в архив
+    - Чистит прогресс
+
+    Действия в Discord выполняют фоновые обработчики outbox (с повторами и после
+    перезапуска) — завершение анкеты не ждёт сети.
+    """
+    guild_id = user_progress.get(uid, {}).get("guild_id", GUILD_ID)
+    guild_config = get_guild_config(guild_id)
+    guild = bot.get_guild(guild_id)
+    member = guild.get_member(uid) if guild else None  # только кэш — без REST
+    # без кэша участников (worker.py) — имя, запомненное при запуске анкеты
+    name = member.display_name if member else user_progress.get(uid, {}).get("name")
+    mention = member.mention if member else f"`{uid}`"
+    job = new_job(uid, guild_id, msg_id)
 
     # --- загружаем конфиг ---
     config = {}
@@ -157,28 +511,27 @@ async def finish_form(bot, uid, answers, msg):
     THRESHOLDS = config.get("THRESHOLDS", {})
 
     # --- проверка ЧС / отклонённых ---
-    if is_blacklisted(uid) or is_declined(uid):
-        if msg:
-            try:
-                await msg.add_reaction("❌")
-                thread = await msg.create_thread(
-                    name=f"❌ {member.display_name if member else uid}"
-                )
-                await thread.send(
-                    f"📋 Заявка {member.mention if member else f'`{uid}`'}\n"
-                    f"Статус: **Отклонено** (ранее)\n"
-                    f"Причина: Пользователь в ЧС или уже отклонён\n\n"
-                    f"UID анкеты: `{msg.id}`"
-                )
-            except Exception as e:
-                print(f"⚠️ Ошибка при создании ветки для {uid}: {e}")
-
-        await safe_send(
-            member,
-            "🚫 Ваша заявка отклонена. Вы либо в ЧС, либо уже отклонялись ранее. 🙏",
+    if is_blacklisted(uid, guild_id) or is_declined(uid, guild_id):
+        status, score = "Отклонено (ранее)", None
+        add_effect(job, "react", emoji="❌")
+        add_effect(
+            job,
+            "thread",
+            name=f"❌ {name or uid}",
+            body=(
+                f"📋 Заявка {mention}\n"
+                f"Статус: **Отклонено** (ранее)\n"
+                f"Причина: Пользователь в ЧС или уже отклонён\n\n"
+                f"UID анкеты: `{msg_id}`"
+            ),
         )
-        user_progress.pop(uid, None)
-        await save_progress()
+        add_effect(
+            job,
+            "dm",
+            text="🚫 Ваша заявка отклонена. Вы либо в ЧС, либо уже отклонялись ранее. 🙏",
+        )
+        add_effect(job, "archive", name=name, verdict=status, score=score, answers=answers)
+        await _complete_form(uid, job, status, score)
         return
 
     # --- подсчёт баллов ---
@@ -193,49 +546,41 @@ async def finish_form(bot, uid, answers, msg):
     # --- принят ---
     if score >= THRESHOLDS.get("accept", 99999):
         status, reason = "Принят", "Достаточный возраст и опыт"
-        if msg:
-            await msg.add_reaction("✅")
-
-        if member and guild:
-            # выдаём роли
-            roles = [guild.get_role(rid) for rid in ROLE_IDS if guild.get_role(rid)]
-            if roles:
-                try:
-                    await member.add_roles(*roles)
-                except discord.Forbidden:
-                    print(f"❌ Нет прав выдать роли {member}")
-                except Exception as e:
-                    print(f"⚠️ Ошибка при выдаче ролей {member}: {e}")
-
-            # меняем ник
-            new_nick = f"{answers[6]} | {answers[7]}"
-            try:
-                await member.edit(nick=new_nick)
-            except Exception as e:
-                print(f"⚠️ Ошибка при смене ника {member}: {e}")
-            await safe_send(
-                member,
+        add_effect(job, "react", emoji="✅")
+
+        # роли, ник, ЛС и дедлайн — только если пользователь на сервере
+        new_nick = f"{answers[6]} | {answers[7]}"
+        add_effect(job, "add_roles")
+        add_effect(job, "set_nick", nick=new_nick)
+        add_effect(
+            job,
+            "dm",
+            member_only=True,
+            text=(
                 f"🎉 Поздравляем, вы прошли отбор!\n\n"
                 f"Ваш ник должен быть 👉 **{new_nick}**\n"
                 f"⚠️ В течение 7 суток смените фамилию на **Bell** и пришлите скриншот в любой в чат на канале Bell.\n"
                 f"❌ Нарушение = исключение.\n\n"
-                f"💡 Совет: не нарушайте правила, будьте онлайн при контрактах.\n",
-            )
-            await log_deadline(bot, member, days=7)
+                f"💡 Совет: не нарушайте правила, будьте онлайн при контрактах.\n"
+            ),
+        )
+        add_effect(job, "log_deadline", days=7)
 
     # --- отклонён ---
     elif score <= THRESHOLDS.get("decline", 0):
         status, reason = "Отклонено", "Возраст или опыт ниже допустимого"
-        if msg:
-            await msg.add_reaction("❌")
-        if not is_declined(uid):
-            await safe_send(
-                member,
-                "🚫 К сожалению, ваша заявка отклонена по внутренним причинам.\n"
-                "🙏 Просьба отнестись с пониманием и не донимать Даню по пустякам.\n"
-                "Хорошей игры на GTA5RP!",
+        add_effect(job, "react", emoji="❌")
+        if not is_declined(uid, guild_id):
+            add_effect(
+                job,
+                "dm",
+                text=(
+                    "🚫 К сожалению, ваша заявка отклонена по внутренним причинам.\n"
+                    "🙏 Просьба отнестись с пониманием и не донимать Даню по пустякам.\n"
+                    "Хорошей игры на GTA5RP!"
+                ),
             )
-            save_id(DECLINED_FILE, uid)
+            add_effect(job, "mark_declined")
 
     # --- спорные ---
     else:
@@ -243,12 +588,14 @@ async def finish_form(bot, uid, answers, msg):
             "На рассмотрении",
             "Ответы спорные, требуется проверка. Если считаете отклонен, попросите Даню, пусть id добавит в файлик отклоненных",
         )
-        if msg:
-            await msg.add_reaction("❓")
-        await safe_send(
-            member,
-            "❓ Ваша заявка требует дополнительного рассмотрения.\n"
-            "Пожалуйста, дождитесь решения руководства.",
+        add_effect(job, "react", emoji="❓")
+        add_effect(
+            job,
+            "dm",
+            text=(
+                "❓ Ваша заявка требует дополнительного рассмотрения.\n"
+                "Пожалуйста, дождитесь решения руководства."
+            ),
         )
 
     # --- собираем анкету ---
@@ -259,45 +606,57 @@ async def finish_form(bot, uid, answers, msg):
     ]
     full_form = "\n\n".join(answers_text)
 
-    # --- создаём ветку ---
-    if msg:
-        try:
-            display_name = member.display_name if member else f"UID:{uid}"
-            mention = member.mention if member else f"`{uid}`"
-            thread = await msg.create_thread(name=f"{status} {display_name}")
-
-            mentions = ""
-            if status == "На рассмотрении" and guild:
-                roles = [
-                    guild.get_role(rid) for rid in REVIEW_ROLES if guild.get_role(rid)
-                ]
-                mentions = " ".join([r.mention for r in roles])
-
-            await thread.send(
-                f"📋 Заявка {mention}\n"
-                f"Статус: **{status}**\n"
-                f"Причина: {reason}\n"
-                f"Баллы: {score}\n\n"
-                f"{'🔔 ' + mentions if mentions else ''}\n\n"
-                f"**Анкета:**\n{full_form}"
-            )
-        except Exception as e:
-            print(f"⚠️ Ошибка при создании ветки для {uid}: {e}")
+    # --- ветка ---
+    mentions = ""
+    if status == "На рассмотрении" and guild:
+        roles = [
+            guild.get_role(rid)
+            for rid in guild_config["review_roles"]
+            if guild.get_role(rid)
+        ]
+        mentions = " ".join([r.mention for r in roles])
+    add_effect(
+        job,
+        "thread",
+        name=f"{status} {name or f'UID:{uid}'}",
+        body=(
+            f"📋 Заявка {mention}\n"
+            f"Статус: **{status}**\n"
+            f"Причина: {reason}\n"
+            f"Баллы: {score}\n\n"
+            f"{'🔔 ' + mentions if mentions else ''}\n\n"
+            f"**Анкета:**\n{full_form}"
+        ),
+    )
+
+    # --- архивируем ---
+    add_effect(job, "archive", name=name, verdict=status, score=score, answers=answers)
+    await _complete_form(uid, job, status, score)
 
-    # --- чистим прогресс ---
+
+async def _complete_form(uid, job, status, score):
+    """
+    Фиксирует решение: задание в outbox (одна атомарная запись), статистика,
+    удаление анкеты из прогресса.
+    """
+    if commit_job(job):
+        stats.record_finished(status, score)
+    else:
+        print(f"⏭️ Анкета {uid} уже завершена ранее (задание {job['key']})")
     user_progress.pop(uid, None)
     await save_progress()
 
 
-async def ask_question(bot, user, index):
+async def ask_question(bot, user, index, msg_id=None, guild_id=None):
     """
-    Отправляет пользователю вопрос анкеты в ЛС.
+    Отправляет пользователю (объект или ID) вопрос анкеты в ЛС.
     Сохраняет прогресс (номер вопроса и id сообщения).
+    msg_id, guild_id — сообщение заявки в канале и его сервер (для новой анкеты).
     """
     if index >= len(questions):
         return None
 
-    dm = user.dm_channel or await user.create_dm()
+    uid = user if isinstance(user, int) else user.id
     q = questions[index]
 
     # Формируем текст с вариантами
@@ -309,7 +668,7 @@ async def ask_question(bot, user, index):
         )
         text += f"\n\n{opts_text}"
 
-    qmsg = await dm.send(text)
+    qmsg = await send_dm(bot, user, text)
 
     # Добавляем реакции-ответы
     for emoji in options.keys():
@@ -320,23 +679,125 @@ async def ask_question(bot, user, index):
 
     # ⚡ обновляем прогресс
     entry = user_progress.get(
-        user.id,
+        uid,
         {
             "answers": [],
             "index": 0,
-            "msg_id": None,
+            "msg_id": msg_id,
             "qmsg_id": None,
+            "guild_id": guild_id or GUILD_ID,
+            "name": None if isinstance(user, int) else user.display_name,
         },
     )
 
     entry["index"] = index
     entry["qmsg_id"] = qmsg.id
-    user_progress[user.id] = entry
+    user_progress[uid] = entry
+    touch_session(uid)
+    stats.record_asked(index)
 
     await save_progress()
     return qmsg
 
 
+async def submit_answer(bot, uid, index, answer, user=None):
+    """
+    Принимает ответ пользователя на вопрос index и переводит анкету дальше:
+    задаёт следующий вопрос или завершает анкету.
+
+    Первый ответ выигрывает: повторные реакции / сообщения по тому же вопросу,
+    пришедшие во время перехода, отбрасываются без обращения к Discord и диску.
+    На один переход — одно сохранение прогресса и одно исходящее сообщение.
+    Возвращает True, если ответ принят.
+    """
+    entry = user_progress.get(uid)
+    key = (uid, index)
+    if entry is None or entry.get("index", 0) != index:
+        return False
+    if key in answering:
+        stats.record_duplicate()
+        return False
+
+    answering.add(key)
+    # время ответа — до перехода: ask_question обновляет last_active
+    elapsed = time.time() - entry.get("last_active", time.time())
+    try:
+        answers = entry.setdefault("answers", [])
+        # длина до ответа: у старых сессий len(answers) может быть меньше index
+        answered = len(answers)
+        answers.append(answer)
+
+        # Защита от зацикливания: если индекс не изменился — двигаем вручную
+        new_index = await get_next_index(index, answers)
+        if new_index <= index:
+            new_index = index + 1
+        entry["index"] = new_index
+
+        # Пропущенные вопросы заполняем прочерком, чтобы answers[i] всегда
+        # соответствовал questions[i] (по позициям считаются баллы и ник)
+        answers.extend(["—"] * (new_index - index - 1))
+
+        # --- Вопросы закончились → завершаем анкету
+        if new_index >= len(questions):
+            await finish_form(bot, uid, answers, entry.get("msg_id"))
+            stats.record_answered(index, elapsed)
+            return True
+
+        # --- Есть ещё вопросы → задаём следующий
+        try:
+            await ask_question(bot, user or uid, new_index)
+        except Exception:
+            # откатываем ответ с прочерками, чтобы пользователь мог ответить повторно
+            del answers[answered:]
+            entry["index"] = index
+            raise
+        # считаем только принятый ответ: после отката пользователь ответит ещё раз
+        stats.record_answered(index, elapsed)
+        return True
+    finally:
+        answering.discard(key)
+
+
+async def answer_reaction(bot, uid, message_id, emoji, user=None) -> bool:
+    """
+    Реакция в ЛС → ответ на текущий вопрос, если она поставлена на актуальное
+    сообщение с вопросом и это один из вариантов ответа.
+    """
+    entry = user_progress.get(uid)
+    if not entry:
+        return False
+
+    index = entry.get("index", 0)
+    if message_id != entry.get("qmsg_id") or index >= len(questions):
+        return False
+
+    options = questions[index].get("options")
+    if not options or emoji not in options:
+        return False
+
+    # сохраняем ответ и переходим дальше (повторные клики отбрасываются)
+    return await submit_answer(bot, uid, index, options[emoji], user=user)
+
+
+async def answer_text(bot, uid, content, user=None) -> bool:
+    """
+    Сообщение в ЛС → ответ на текущий текстовый вопрос.
+    """
+    entry = user_progress.get(uid)
+    if entry is None:
+        return False
+
+    index = entry.get("index", 0)
+    if index >= len(questions):
+        return False
+
+    # На вопросы с вариантами ожидаются реакции, поэтому сообщение игнорируем
+    if questions[index].get("options"):
+        return False
+
+    return await submit_answer(bot, uid, index, content, user=user)
+
+
 # -------------------------Обработка новых сообщений-заявок-------------------------
 async def process_application_message(bot, message):
     """
@@ -344,6 +805,28 @@ async def process_application_message(bot, message):
     - Ищет поле 'Ваш DISCORD'
     - Проверяет пользователя
     - Запускает или продолжает анкету
+
+    ID заявки сохраняется в PROCESSED_FILE только после того, как анкета
+    запущена или поставлена в очередь (или заявка отклонена): если процесс
+    упадёт раньше, заявка обработается заново. Повторную доставку, пока
+    заявка обрабатывается, отсекает handling_messages.
+    """
+    key = str(message.id)
+    if key in processed_messages or key in handling_messages:
+        return
+    handling_messages.add(key)
+    try:
+        if await _process_application(bot, message):
+            processed_messages.add(key)
+            save_id(PROCESSED_FILE, message.id)
+    finally:
+        handling_messages.discard(key)
+
+
+async def _process_application(bot, message) -> bool:
+    """
+    Тело process_application_message. False — анкету не удалось запустить,
+    заявку стоит обработать повторно.
     """
     lines = extract_lines(message)
 
@@ -357,14 +840,21 @@ async def process_application_message(bot, message):
 
     if not discord_tag:
         print(f"⚠️ Не найден 'Ваш DISCORD' в сообщении {message.id}")
-        return
+        return True
 
-    guild = bot.get_guild(GUILD_ID)
+    # сервер определяем по каналу заявки
+    guild_id = guild_for_channel(message.channel.id) or (
+        message.guild.id if message.guild else GUILD_ID
+    )
+    guild_config = get_guild_config(guild_id)
+    guild = bot.get_guild(guild_id)
     member = guild.get_member_named(discord_tag)
+    if member:
+        record_member(discord_tag, member.id)
     if not member:
         await message.add_reaction("❌")
         thread = await message.create_thread(name=f"❌ {discord_tag}")
-        roles = [guild.get_role(rid) for rid in REVIEW_ROLES]
+        roles = [guild.get_role(rid) for rid in guild_config["review_roles"]]
         mentions = " ".join([r.mention for r in roles if r])
         await thread.send(
             f"⚠️ Пользователь **{discord_tag}** не найден на сервере.\n"
@@ -372,10 +862,10 @@ async def process_application_message(bot, message):
             f"Анкета остаётся без проверки\n\n"
             f"{mentions}"
         )
-        return
+        return True
 
     # Проверка ЧС
-    if is_blacklisted(member.id):
+    if is_blacklisted(member.id, guild_id):
         await message.add_reaction("❌")
         thread = await message.create_thread(name=f"❌ {member.display_name}")
         await thread.send(
@@ -384,16 +874,18 @@ async def process_application_message(bot, message):
             f"Заявка автоматически отклонена."
         )
         try:
-            await member.send(
+            await send_dm(
+                bot,
+                member,
                 "🚫 Ваша заявка отклонена, так как вы находитесь в **ЧС Bell**.\n"
-                "Просьба не пытаться подавать заявку повторно 🙏"
+                "Просьба не пытаться подавать заявку повторно 🙏",
             )
         except discord.Forbidden:
             pass
-        return
+        return True
 
     # отклонён ранее
-    if is_declined(member.id):
+    if is_declined(member.id, guild_id):
         await message.add_reaction("❌")
         thread = await message.create_thread(name=f"❌ {member.display_name}")
         await thread.send(
@@ -402,50 +894,213 @@ async def process_application_message(bot, message):
             f"Заявка автоматически отклонена."
         )
         try:
-            await member.send(
+            await send_dm(
+                bot,
+                member,
                 "🚫 Вы уже получали отказ по заявке ранее.\n"
-                "Повторные попытки приёма невозможны 🙏"
+                "Повторные попытки приёма невозможны 🙏",
             )
         except discord.Forbidden:
             print(f"❌ Не удалось отправить ЛС {member}")
+        return True
+
+    # анкета уже идёт → напоминаем
+    async with session_lock(member.id):
+        entry = await pull_session(member.id)
+        release_session(member.id)
+    if entry is not None and entry.get("guild_id", GUILD_ID) != guild_id:
+        # анкета идёт для другого сервера — эту заявку не теряем молча
+        await _report_busy_applicant(bot, message, member, guild_id, entry)
+        return True
+    if entry is not None:
+        idx = entry.get("index", 0)
+        try:
+            await send_dm(
+                bot,
+                member,
+                f"📌 Вы остановились на вопросе {idx + 1}. Просто ответьте на него реакцией.",
+            )
+        except Exception as e:
+            print(f"⚠️ Не удалось напомнить {member}: {e}")
+        return True
+
+    # анкета уже запускается или ждёт в очереди → дубликат
+    if member.id in onboarding_uids or member.id in queued_uids:
+        print(f"⏭️ Анкета для {member} уже запускается, заявка {message.id} пропущена")
+        return True
+
+    # Если анкеты нет → запускаем с первого вопроса (через очередь допуска)
+    return await admit_application(bot, member, message, guild_id)
+
+
+# -------------------------Очередь допуска-------------------------
+def load_admission_queue():
+    """
+    Загружает очередь допуска из QUEUE_FILE (один раз за запуск процесса).
+    """
+    global _queue_loaded
+    if _queue_loaded:
+        return
+    _queue_loaded = True
+    if not os.path.exists(QUEUE_FILE):
+        return
+    try:
+        with open(QUEUE_FILE, "r", encoding="utf-8") as f:
+            items = json.load(f)
+    except Exception as e:
+        print(f"⚠️ Ошибка при загрузке очереди заявок: {e}")
         return
+    admission_queue.extend(items)
+    queued_uids.update(item["uid"] for item in items)
+    print(f"✅ В очереди заявок: {len(admission_queue)}")
 
-    # продолжаем или запускаем анкету
+
+def save_admission_queue():
+    """
+    Сохраняет очередь допуска в QUEUE_FILE.
+    """
     try:
-        if member.id in user_progress:
-            entry = user_progress[member.id]
-            idx = entry.get("index", 0)
+        with open(QUEUE_FILE, "w", encoding="utf-8") as f:
+            json.dump(list(admission_queue), f)
+    except Exception as e:
+        print(f"⚠️ Ошибка при сохранении очереди заявок: {e}")
 
-            try:
-                user = await bot.fetch_user(member.id)
-                dm = user.dm_channel or await user.create_dm()
-                await dm.send(
-                    f"📌 Вы остановились на вопросе {idx + 1}. Просто ответьте на него реакцией."
-                )
-            except Exception as e:
-                print(f"⚠️ Не удалось напомнить {member}: {e}")
 
-            return
+async def admit_application(bot, member, message, guild_id) -> bool:
+    """
+    Запускает анкету сразу, если одновременно запускается меньше
+    MAX_CONCURRENT_ONBOARDING анкет, иначе ставит кандидата в очередь (FIFO)
+    и один раз сообщает ему позицию. False — анкету запустить не удалось.
+    """
+    if len(onboarding_uids) < MAX_CONCURRENT_ONBOARDING and not admission_queue:
+        onboarding_uids.add(member.id)
+        return await _onboard(bot, member, message.id, guild_id, message)
 
-        # Если анкеты нет → запускаем с первого вопроса
-        qmsg = await ask_question(bot, member, 0)
-        entry = {
-            "index": 0,
-            "answers": [],
-            "msg_id": message.id if message else None,  # сообщение заявки в канале
-            "qmsg_id": qmsg.id if qmsg else None,  # текущее сообщение-вопрос в ЛС
-        }
-        user_progress[member.id] = entry
-        await save_progress()
-        print(f"✅ Анкета для {member} успешно запущена (UID анкеты {message.id})")
+    admission_queue.append({"uid": member.id, "msg_id": message.id, "guild_id": guild_id})
+    queued_uids.add(member.id)
+    save_admission_queue()
+    print(f"⏳ {member} в очереди заявок (позиция {len(admission_queue)})")
+    try:
+        await send_dm(
+            bot,
+            member,
+            f"⏳ Заявка получена! Сейчас много кандидатов — вы в очереди, "
+            f"позиция {len(admission_queue)}. Первый вопрос придёт сюда автоматически.",
+        )
+    except Exception as e:
+        print(f"⚠️ Не удалось сообщить {member} позицию в очереди: {e}")
+    return True
+
+
+def drain_admission_queue(bot):
+    """
+    Запускает анкеты из очереди, пока есть свободные места.
+    """
+    changed = False
+    while admission_queue and len(onboarding_uids) < MAX_CONCURRENT_ONBOARDING:
+        item = admission_queue.popleft()
+        queued_uids.discard(item["uid"])
+        changed = True
+        if item["uid"] in user_progress or item["uid"] in onboarding_uids:
+            continue
+        onboarding_uids.add(item["uid"])
+        task = asyncio.create_task(
+            _onboard(bot, item["uid"], item["msg_id"], item["guild_id"])
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    if changed:
+        save_admission_queue()
 
+
+async def _onboard(bot, user, msg_id, guild_id, message=None) -> bool:
+    """
+    Отправляет первый вопрос и освобождает место в очереди допуска.
+    user — участник или его ID (для заявок из очереди). False — анкету
+    запустить не удалось (кроме закрытых ЛС: о них уже сообщено).
+    """
+    uid = user if isinstance(user, int) else user.id
+    try:
+        async with hold_session(uid):
+            if await pull_session(uid) is not None:
+                release_session(uid)  # анкету уже запустила другая заявка
+                return True
+            try:
+                await ask_question(bot, user, 0, msg_id=msg_id, guild_id=guild_id)
+            finally:
+                await push_session(uid)
+        stats.record_started()
+        print(f"✅ Анкета для {user} успешно запущена (UID анкеты {msg_id})")
+        return True
     except discord.Forbidden:
         # закрыты ЛС
+        message = message or await fetch_app_message(bot, msg_id, guild_id)
+        await _report_closed_dm(bot, message, uid, guild_id)
+        return True
+    except Exception as e:
+        print(f"⚠️ Не удалось начать анкету {uid}: {e}")
+        return False
+    finally:
+        onboarding_uids.discard(uid)
+        drain_admission_queue(bot)
+
+
+async def _report_busy_applicant(bot, message, member, guild_id, entry):
+    """
+    Заявка на сервер, пока у пользователя идёт анкета другого сервера: анкета
+    одна на пользователя, поэтому заявка не запускается. Помечает её ⏸,
+    создаёт ветку для проверяющих и просит пользователя подать заявку повторно.
+    """
+    print(
+        f"⏸ Заявка {message.id} ({member}) не запущена: идёт анкета "
+        f"сервера {entry.get('guild_id')}"
+    )
+    guild = bot.get_guild(guild_id)
+    roles = [guild.get_role(rid) for rid in get_guild_config(guild_id)["review_roles"]]
+    mentions = " ".join([r.mention for r in roles if r])
+    try:
+        await message.add_reaction("⏸")
+        thread = await message.create_thread(name=f"⏸ {member.display_name}")
+        await thread.send(
+            f"⚠️ Пользователь {member.mention} сейчас проходит анкету другого сервера "
+            f"(вопрос {entry.get('index', 0) + 1}).\n"
+            f"UID анкеты: `{message.id}`\n"
+            f"Анкета по этой заявке не начата — пользователь подаст заявку повторно.\n\n"
+            f"{mentions}"
+        )
+    except Exception as e:
+        print(f"⚠️ Ошибка при создании ветки для {member}: {e}")
+    try:
+        await send_dm(
+            bot,
+            member,
+            "⏸ Ваша новая заявка получена, но сейчас вы проходите другую анкету. "
+            "Закончите её и подайте новую заявку повторно 🙏",
+        )
+    except Exception as e:
+        print(f"⚠️ Не удалось сообщить {member} о второй заявке: {e}")
+
+
+async def _report_closed_dm(bot, message, uid, guild_id):
+    """
+    Помечает заявку ❌ и создаёт ветку: пользователь закрыл ЛС.
+    """
+    print(f"❌ Не удалось отправить ЛС {uid} (закрыты сообщения)")
+    if message is None:
+        return
+    guild = bot.get_guild(guild_id)
+    review_roles = get_guild_config(guild_id)["review_roles"]
+    role = guild.get_role(review_roles[0]) if guild and review_roles else None
+    member = await resolve_member(guild, uid) if guild else None
+    mention = member.mention if member else f"`{uid}`"
+    try:
         await message.add_reaction("❌")
-        role = guild.get_role(1389184170739240970)
-        thread = await message.create_thread(name=f"❌ {member.display_name}")
+        thread = await message.create_thread(
+            name=f"❌ {member.display_name if member else uid}"
+        )
         await thread.send(
-            f"⚠️ Пользователь {member.mention} закрыл личные сообщения. Анкета не начата.\n\n"
+            f"⚠️ Пользователь {mention} закрыл личные сообщения. Анкета не начата.\n\n"
             f"{role.mention if role else ''}"
         )
-        print(f"❌ Не удалось отправить ЛС {discord_tag} (закрыты сообщения)")
+    except Exception as e:
+        print(f"⚠️ Ошибка при создании ветки для {uid}: {e}")
@@ -0,0 +1,199 @@
+"""
+archive.py — локальный архив завершённых анкет
+
+Задачи:
+- Сохранение каждой завершённой анкеты (вердикт, баллы, ответы, ID сообщений)
+  во встроенную базу SQLite с индексами
+- Быстрый поиск заявок по UID / имени без обращения к истории каналов
+- Постраничная (потоковая) выгрузка архива без загрузки его целиком в память
+"""
+
+import csv
+import json
+import sqlite3
+import time
+
+from configuration import ARCHIVE_FILE, GUILD_ID
+
+# -------------------------Глобальные переменные -------------------------
+_conn: sqlite3.Connection | None = None  # ленивое подключение к базе
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS applications (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid         INTEGER NOT NULL,
+    name        TEXT,
+    name_lower  TEXT,
+    verdict     TEXT NOT NULL,
+    score       INTEGER,
+    msg_id      INTEGER,
+    thread_id   INTEGER,
+    answers     TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    guild_id    INTEGER,
+    outbox_key  TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_applications_uid ON applications (uid, finished_at);
+CREATE INDEX IF NOT EXISTS idx_applications_name ON applications (name_lower);
+CREATE INDEX IF NOT EXISTS idx_applications_msg ON applications (msg_id);
+"""
+
+# Миграции для архивов, созданных старыми версиями
+_MIGRATIONS = {
+    "guild_id": (
+        "ALTER TABLE applications ADD COLUMN guild_id INTEGER",
+        f"UPDATE applications SET guild_id = {GUILD_ID} WHERE guild_id IS NULL",
+    ),
+    "outbox_key": ("ALTER TABLE applications ADD COLUMN outbox_key TEXT",),
+}
+
+# Индексы по колонкам из миграций (создаются после них)
+_INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_applications_outbox_key
+    ON applications (outbox_key);
+"""
+
+EXPORT_COLUMNS = [
+    "id",
+    "uid",
+    "name",
+    "verdict",
+    "score",
+    "msg_id",
+    "thread_id",
+    "answers",
+    "finished_at",
+    "guild_id",
+]
+
+
+# -------------------------Подключение-------------------------
+def get_connection() -> sqlite3.Connection:
+    """
+    Возвращает подключение к ARCHIVE_FILE (создаёт таблицы при первом вызове).
+    """
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(ARCHIVE_FILE, check_same_thread=False)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in _conn.execute("PRAGMA table_info(applications)")}
+        with _conn:
+            for column, statements in _MIGRATIONS.items():
+                if column not in columns:
+                    for statement in statements:
+                        _conn.execute(statement)
+        _conn.executescript(_INDEXES)
+    return _conn
+
+
+# -------------------------Запись-------------------------
+def archive_application(
+    uid: int,
+    name: str | None,
+    verdict: str,
+    score: int | None,
+    answers: list,
+    msg_id: int | None = None,
+    thread_id: int | None = None,
+    guild_id: int | None = None,
+    key: str | None = None,
+):
+    """
+    Добавляет завершённую анкету в архив.
+    key — ключ задания outbox: повторная запись с тем же ключом игнорируется.
+    Ошибки не пробрасываются — архив не должен ломать завершение анкеты.
+    """
+    try:
+        conn = get_connection()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO applications "
+                "(uid, name, name_lower, verdict, score, msg_id, thread_id, answers, "
+                "finished_at, guild_id, outbox_key) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    uid,
+                    name,
+                    name.lower() if name else None,
+                    verdict,
+                    score,
+                    msg_id,
+                    thread_id,
+                    json.dumps(answers, ensure_ascii=False),
+                    time.time(),
+                    guild_id or GUILD_ID,
+                    key,
+                ),
+            )
+    except Exception as e:
+        print(f"⚠️ Ошибка при записи анкеты {uid} в архив: {e}")
+
+
+# -------------------------Поиск-------------------------
+def find_applications(
+    query: str, guild_id: int = GUILD_ID, limit: int = 10
+) -> list[sqlite3.Row]:
+    """
+    Ищет анкеты сервера guild_id в архиве:
+    - число / упоминание → по UID пользователя или ID сообщения анкеты;
+    - текст → по началу имени (без учёта регистра).
+    Последние анкеты идут первыми.
+    """
+    conn = get_connection()
+    query = query.strip()
+    digits = query.strip("<@!>")
+    if digits.isdigit():
+        value = int(digits)
+        return conn.execute(
+            "SELECT * FROM applications WHERE uid = ? AND guild_id = ? "
+            "UNION ALL SELECT * FROM applications "
+            "WHERE msg_id = ? AND uid != ? AND guild_id = ? "
+            "ORDER BY finished_at DESC LIMIT ?",
+            (value, guild_id, value, value, guild_id, limit),
+        ).fetchall()
+
+    prefix = query.lower()
+    return conn.execute(
+        "SELECT * FROM applications "
+        "WHERE name_lower >= ? AND name_lower < ? AND guild_id = ? "
+        "ORDER BY finished_at DESC LIMIT ?",
+        (prefix, prefix + "\U0010ffff", guild_id, limit),
+    ).fetchall()
+
+
+# -------------------------Выгрузка-------------------------
+def iter_applications(guild_id: int = GUILD_ID, page_size: int = 500):
+    """
+    Потоково отдаёт все строки архива сервера страницами по page_size
+    (keyset-пагинация по id — в памяти одновременно только одна страница).
+    """
+    conn = get_connection()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT * FROM applications WHERE id > ? AND guild_id = ? "
+            "ORDER BY id LIMIT ?",
+            (last_id, guild_id, page_size),
+        ).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1]["id"]
+
+
+def export_applications(path: str, guild_id: int = GUILD_ID, page_size: int = 500) -> int:
+    """
+    Выгружает архив сервера в CSV-файл построчно.
+    Возвращает количество выгруженных анкет.
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in iter_applications(guild_id, page_size):
+            writer.writerow([row[col] for col in EXPORT_COLUMNS])
+            count += 1
+    return count
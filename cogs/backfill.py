@@ -0,0 +1,211 @@
+"""
+backfill.py — повторная обработка заявок за диапазон сообщений (!reprocess)
+
+Задачи:
+- Потоковое чтение истории канала заявок от старых сообщений к новым
+  (страницами, без загрузки диапазона в память)
+- Пропуск уже обработанных сообщений (в processed.txt или с реакциями)
+  и сообщений без анкеты
+- Не больше BACKFILL_CONCURRENCY заявок в обработке одновременно
+- Живой прогресс (обработано / пропущено / ошибок / скорость) в сообщении-статусе
+- Контрольная точка в BACKFILL_FILE: прерванную переобработку можно продолжить
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import discord
+
+from configuration import (
+    BACKFILL_FILE,
+    BACKFILL_CONCURRENCY,
+    BACKFILL_PROGRESS_INTERVAL,
+)
+from cogs.applications import process_application_message, processed_messages
+from cogs.guilds import get_guild_config
+from cogs.helpers import extract_lines
+
+# -------------------------Глобальные переменные -------------------------
+running: dict[int, asyncio.Task] = {}  # {guild_id: задача переобработки}
+
+
+# -------------------------Контрольные точки-------------------------
+def load_checkpoints() -> dict[int, dict]:
+    """
+    Загружает незавершённые переобработки: {guild_id: состояние}.
+    Состояние: from_id, to_id, resume_after, processed, skipped, failed, status_channel_id.
+    """
+    if not os.path.exists(BACKFILL_FILE):
+        return {}
+    try:
+        with open(BACKFILL_FILE, "r", encoding="utf-8") as f:
+            return {int(gid): state for gid, state in json.load(f).items()}
+    except Exception as e:
+        print(f"⚠️ Ошибка при загрузке {BACKFILL_FILE}: {e}")
+        return {}
+
+
+def save_checkpoint(guild_id: int, state: dict | None):
+    """
+    Сохраняет (или удаляет при state=None) контрольную точку сервера.
+    """
+    checkpoints = load_checkpoints()
+    if state is None:
+        checkpoints.pop(guild_id, None)
+    else:
+        checkpoints[guild_id] = state
+    tmp = BACKFILL_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({str(gid): s for gid, s in checkpoints.items()}, f)
+    os.replace(tmp, BACKFILL_FILE)
+
+
+# -------------------------Переобработка-------------------------
+def _is_application(message) -> bool:
+    """
+    Сообщение похоже на анкету (как в обработчике канала заявок).
+    """
+    return any("ваш discord" in line.lower() for line in extract_lines(message))
+
+
+def _format_status(state: dict, rate: float, title: str) -> str:
+    return (
+        f"{title}\n"
+        f"Диапазон: `{state['from_id']}` → `{state['to_id'] or 'последнее'}`\n"
+        f"✅ Обработано: {state['processed']} | ⏭️ Пропущено: {state['skipped']} | "
+        f"⚠️ Ошибок: {state['failed']}\n"
+        f"⚡ {rate:.1f} сообщ/с | Готово до ID `{state['resume_after']}`"
+    )
+
+
+async def run_backfill(bot, guild_id: int, state: dict, status_channel):
+    """
+    Прогоняет сообщения канала заявок после state["resume_after"] (до to_id
+    включительно) через process_application_message.
+    Контрольная точка сохраняется вместе с прогрессом; при отмене (!reprocess stop)
+    начатые заявки дообрабатываются, а точка остаётся для !reprocess resume.
+    """
+    channel = bot.get_channel(get_guild_config(guild_id)["target_channel_id"])
+    status = await status_channel.send(_format_status(state, 0, "🔄 Переобработка заявок"))
+    state["status_channel_id"] = status_channel.id
+
+    in_flight: dict[asyncio.Task, int] = {}  # {задача: ID сообщения}
+    last_seen = state["resume_after"]
+    started = last_report = time.monotonic()
+    counted_before = state["processed"] + state["skipped"] + state["failed"]
+
+    async def handle(message):
+        try:
+            await process_application_message(bot, message)
+            state["processed"] += 1
+        except Exception as e:
+            state["failed"] += 1
+            print(f"⚠️ Переобработка: ошибка на сообщении {message.id}: {e}")
+
+    def prune():
+        for task in [task for task in in_flight if task.done()]:
+            in_flight.pop(task)
+
+    def checkpoint():
+        # всё до самой старой незавершённой заявки уже обработано
+        prune()
+        state["resume_after"] = min(in_flight.values()) - 1 if in_flight else last_seen
+        save_checkpoint(guild_id, state)
+
+    async def report(title):
+        elapsed = time.monotonic() - started
+        counted = state["processed"] + state["skipped"] + state["failed"] - counted_before
+        try:
+            await status.edit(content=_format_status(state, counted / max(elapsed, 1e-9), title))
+        except discord.HTTPException as e:
+            print(f"⚠️ Не удалось обновить статус переобработки: {e}")
+
+    history = channel.history(
+        limit=None,
+        after=discord.Object(state["resume_after"]),
+        before=discord.Object(state["to_id"] + 1) if state["to_id"] else None,
+        oldest_first=True,
+    )
+    try:
+        async for message in history:
+            last_seen = message.id
+            # как в on_ready: реакция на заявке — её уже разобрал бот (до
+            # processed.txt) или проверяющие вручную
+            if (
+                str(message.id) in processed_messages
+                or message.reactions
+                or not _is_application(message)
+            ):
+                state["skipped"] += 1
+            else:
+                if len(in_flight) >= BACKFILL_CONCURRENCY:
+                    await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    prune()
+                in_flight[asyncio.create_task(handle(message))] = message.id
+
+            if time.monotonic() - last_report >= BACKFILL_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                checkpoint()
+                await report("🔄 Переобработка заявок")
+
+        if in_flight:
+            await asyncio.wait(in_flight)
+    except asyncio.CancelledError:
+        if in_flight:
+            await asyncio.wait(in_flight)
+        checkpoint()
+        await report("⏸ Переобработка остановлена — продолжить: `!reprocess resume`")
+        raise
+    except Exception as e:
+        checkpoint()
+        await report(f"❌ Переобработка прервана: {e} — продолжить: `!reprocess resume`")
+        raise
+
+    in_flight.clear()
+    state["resume_after"] = last_seen
+    save_checkpoint(guild_id, None)
+    await report("✅ Переобработка завершена")
+
+
+def start_backfill(bot, guild_id: int, status_channel, from_id=None, to_id=None) -> str | None:
+    """
+    Запускает переобработку сервера: с from_id (включительно) до to_id, либо
+    (from_id=None) продолжает сохранённую. Возвращает текст ошибки или None.
+    """
+    task = running.get(guild_id)
+    if task and not task.done():
+        return "⏳ Переобработка уже идёт. Остановить: `!reprocess stop`"
+    if bot.get_channel(get_guild_config(guild_id)["target_channel_id"]) is None:
+        return "❌ Канал заявок не найден"
+
+    if from_id is None:
+        state = load_checkpoints().get(guild_id)
+        if state is None:
+            return "🔍 Нет прерванной переобработки"
+    else:
+        if to_id and to_id < from_id:
+            return "❌ Конец диапазона раньше начала"
+        state = {
+            "from_id": from_id,
+            "to_id": to_id,
+            "resume_after": from_id - 1,
+            "processed": 0,
+            "skipped": 0,
+            "failed": 0,
+        }
+
+    running[guild_id] = asyncio.create_task(run_backfill(bot, guild_id, state, status_channel))
+    return None
+
+
+def stop_backfill(guild_id: int) -> bool:
+    """
+    Останавливает переобработку сервера (контрольная точка сохраняется).
+    """
+    task = running.get(guild_id)
+    if task is None or task.done():
+        return False
+    task.cancel()
+    return True
@@ -5,81 +5,155 @@
 - Логирование дедлайна для конкретного участника.
 - Проверка всех записей логов и отправка оповещений в канал-аларм.
 - Пометка обработанных сообщений галочкой (✅), чтобы не проверять повторно.
+- Незакрытые записи хранятся в памяти (и в снимке состояния), из канала логов
+  читаются только новые сообщения; запись с истёкшим сроком перед алармом
+  перечитывается (её могли удалить или закрыть ✅ вручную).
 """
 
 import discord
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
-# 🔧 Настройки каналов и ролей
-LOG_CHANNEL_ID = 1414026815873486868
-ALARM_CHANNEL_ID = 1414027547016040559
-ROLE_TO_CHECK = 1389184190989467677  # роль, которую проверяем
+from cogs.guilds import get_guild_config, channel_marks, mark_channel
 
+# {guild_id: {msg_id: (uid, дедлайн в UTC timestamp)}} — записи без ✅
+pending_deadlines: dict[int, dict[int, tuple[int, float]]] = {}
 
-async def log_deadline(bot: discord.Client, member: discord.Member, days: int = 7):
+# 🔧 Каналы логов/аларма и проверяемая роль задаются для каждого сервера
+#    (log_channel_id, alarm_channel_id, role_to_check в cogs/guilds.py)
+
+
+async def log_deadline(
+    bot: discord.Client, member: discord.Member, days: int = 7, nonce: str | None = None
+):
     """
     Логирует срок смены фамилии в канал логов.
 
     :param bot: Discord клиент
-    :param member: участник гильдии
+    :param member: участник гильдии (канал логов берётся из настроек его сервера)
     :param days: количество дней до дедлайна (по умолчанию 7)
+    :param nonce: nonce сообщения — Discord отбрасывает повтор с ним в течение
+        нескольких минут
+    :return: отправленное сообщение (None, если канала логов нет)
     """
-    channel = bot.get_channel(LOG_CHANNEL_ID)
+    config = get_guild_config(member.guild.id)
+    channel = bot.get_channel(config["log_channel_id"])
     if not channel:
         return
 
-    deadline = (datetime.utcnow() + timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
-    await channel.send(f"{member.id} {deadline}")
+    deadline = datetime.utcnow() + timedelta(days=days)
+    sent = await channel.send(f"{member.id} {deadline:%Y-%m-%d %H:%M:%S}", nonce=nonce)
+    pending_deadlines.setdefault(member.guild.id, {})[sent.id] = (
+        member.id,
+        deadline.replace(microsecond=0, tzinfo=timezone.utc).timestamp(),
+    )
+    return sent
+
+
+def track_deadline(guild_id: int, message: discord.Message):
+    """
+    Добавляет уже отправленную запись лога в pending_deadlines
+    (outbox нашёл её после сбоя и не отправляет повторно).
+    """
+    pending_deadlines.setdefault(guild_id, {})[message.id] = _parse_entry(message.content)
+
+
+def _parse_entry(content: str) -> tuple[int, float]:
+    """
+    Разбирает запись лога "uid YYYY-mm-dd HH:MM:SS" → (uid, UTC timestamp).
+    """
+    uid_str, deadline_str = content.split(" ", 1)
+    deadline = datetime.strptime(deadline_str, "%Y-%m-%d %H:%M:%S")
+    return int(uid_str), deadline.replace(tzinfo=timezone.utc).timestamp()
+
+
+async def sync_deadlines(log_channel, guild_id: int) -> set[int]:
+    """
+    Догружает записи из канала логов в pending_deadlines.
+    Если канал уже читался (снимок или прошлый запуск) — только новые сообщения,
+    иначе вся история. Возвращает ID прочитанных сейчас сообщений.
+    """
+    pending = pending_deadlines.setdefault(guild_id, {})
+    fresh = set()
+    mark = channel_marks.get(log_channel.id)
+    if mark:
+        history = log_channel.history(limit=None, after=discord.Object(mark))
+    else:
+        history = log_channel.history(limit=None)
+
+    async for msg in history:
+        mark_channel(log_channel.id, msg.id)
+        fresh.add(msg.id)
+        # 🔹 Пропускаем сообщения, где уже стоит ✅
+        if any(r.emoji == "✅" for r in msg.reactions):
+            pending.pop(msg.id, None)
+            continue
+        try:
+            pending[msg.id] = _parse_entry(msg.content)
+        except Exception as e:
+            print(f"⚠️ Ошибка при разборе записи в логах: {msg.content} → {e}")
+    return fresh
+
+
+async def _still_open(log_channel, msg_id: int) -> bool:
+    """
+    Перечитывает запись лога, прочитанную до последней синхронизации:
+    False, если её удалили или на ней уже стоит ✅.
+    """
+    try:
+        msg = await log_channel.fetch_message(msg_id)
+    except discord.NotFound:
+        return False
+    return not any(r.emoji == "✅" for r in msg.reactions)
 
 
 async def check_deadlines(bot: discord.Client, guild_id: int, review_roles=None):
     """
-    Проверяет все записи в канале LOG_CHANNEL_ID и кидает аларм, если срок вышел.
+    Проверяет незакрытые записи канала логов сервера и кидает аларм, если срок вышел.
     После отправки аларма ставит ✅ на сообщение, чтобы не проверять повторно.
     review_roles — список ID ролей, которые нужно упомянуть.
     """
-    log_channel = bot.get_channel(LOG_CHANNEL_ID)
-    alarm_channel = bot.get_channel(ALARM_CHANNEL_ID)
+    config = get_guild_config(guild_id)
+    log_channel = bot.get_channel(config["log_channel_id"])
+    alarm_channel = bot.get_channel(config["alarm_channel_id"])
     guild = bot.get_guild(guild_id)
 
     if not log_channel or not alarm_channel or not guild:
         print("❌ Не найден один из каналов (лог/аларм) или гильдия")
         return
 
-    now = datetime.utcnow()
+    fresh = await sync_deadlines(log_channel, guild_id)
+    pending = pending_deadlines[guild_id]
+    now = datetime.now(timezone.utc).timestamp()
 
-    async for msg in log_channel.history(limit=None):
-        # 🔹 Пропускаем сообщения, где уже стоит ✅
-        if any(r.emoji == "✅" for r in msg.reactions):
+    for msg_id, (uid, deadline) in list(pending.items()):
+        if now < deadline:
             continue
-
         try:
-            uid_str, deadline_str = msg.content.split(" ", 1)
-            uid = int(uid_str)
-            deadline = datetime.strptime(deadline_str, "%Y-%m-%d %H:%M:%S")
-
-            if now >= deadline:
-                member = guild.get_member(uid)
-                if member and any(r.id == ROLE_TO_CHECK for r in member.roles):
-                    mentions = ""
-                    if review_roles:
-                        roles = [
-                            guild.get_role(rid)
-                            for rid in review_roles
-                            if guild.get_role(rid)
-                        ]
-                        mentions = " ".join(r.mention for r in roles)
-                        if mentions:
-                            mentions = f"\n🔔 {mentions}"
-
-                    await alarm_channel.send(
-                        f"⚠️ Срок смены фамилии истёк!\n"
-                        f"Пользователь: {member.mention} (`{uid}`)\n"
-                        f"Проверьте, что он состоит в орге и изменил фамилию."
-                        f"{mentions}"
-                    )
-                    # ✅ ставим галочку на сообщении, чтобы больше не проверять
-                    await msg.add_reaction("✅")
+            if msg_id not in fresh and not await _still_open(log_channel, msg_id):
+                pending.pop(msg_id, None)
+                continue
+            member = guild.get_member(uid)
+            if member and any(r.id == config["role_to_check"] for r in member.roles):
+                mentions = ""
+                if review_roles:
+                    roles = [
+                        guild.get_role(rid)
+                        for rid in review_roles
+                        if guild.get_role(rid)
+                    ]
+                    mentions = " ".join(r.mention for r in roles)
+                    if mentions:
+                        mentions = f"\n🔔 {mentions}"
+
+                await alarm_channel.send(
+                    f"⚠️ Срок смены фамилии истёк!\n"
+                    f"Пользователь: {member.mention} (`{uid}`)\n"
+                    f"Проверьте, что он состоит в орге и изменил фамилию."
+                    f"{mentions}"
+                )
+                # ✅ ставим галочку на сообщении, чтобы больше не проверять
+                await log_channel.get_partial_message(msg_id).add_reaction("✅")
+                pending.pop(msg_id, None)
 
         except Exception as e:
-            print(f"⚠️ Ошибка при разборе записи в логах: {msg.content} → {e}")
+            print(f"⚠️ Ошибка при проверке дедлайна {uid} (запись {msg_id}): {e}")
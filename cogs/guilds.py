@@ -0,0 +1,120 @@
+"""
+guilds.py — настройки и маршрутизация для нескольких серверов
+
+Задачи:
+- Хранение конфигурации каждого сервера (каналы, роли, файл отклонённых)
+- Подгрузка дополнительных серверов из config.json → "GUILDS"
+- Поиск сервера по ID канала за один поиск в словаре (O(1))
+- Отметки последнего учтённого сообщения в каналах (для догрузки только нового)
+"""
+
+import json
+import os
+
+from configuration import (
+    GUILD_ID,
+    TARGET_CHANNEL_ID,
+    ROLE_IDS,
+    REVIEW_ROLES,
+    BLACKLIST_CHANNEL_ID,
+    LOG_CHANNEL_ID,
+    ALARM_CHANNEL_ID,
+    ROLE_TO_CHECK,
+    DECLINED_FILE,
+    CONFIG_PATH,
+)
+
+# -------------------------Глобальные переменные -------------------------
+# {guild_id: {target_channel_id, role_ids, review_roles, blacklist_channel_id,
+#             log_channel_id, alarm_channel_id, role_to_check, declined_file}}
+guild_configs: dict[int, dict] = {}
+channel_routes: dict[int, int] = {}  # {channel_id: guild_id}
+channel_marks: dict[int, int] = {}  # {channel_id: ID последнего учтённого сообщения}
+
+# Каналы сервера, по которым маршрутизируются события
+ROUTED_CHANNELS = ("target_channel_id", "blacklist_channel_id", "log_channel_id")
+
+
+def _default_config(guild_id: int) -> dict:
+    """
+    Настройки по умолчанию для сервера (файл отклонённых — свой у каждого).
+    """
+    return {
+        "target_channel_id": None,
+        "role_ids": [],
+        "review_roles": [],
+        "blacklist_channel_id": None,
+        "log_channel_id": None,
+        "alarm_channel_id": None,
+        "role_to_check": None,
+        "declined_file": f"declined_{guild_id}.txt",
+    }
+
+
+def register_guild(guild_id: int, config: dict):
+    """
+    Добавляет (или обновляет) сервер и его каналы в таблице маршрутизации.
+    """
+    guild_id = int(guild_id)
+    merged = guild_configs.get(guild_id) or _default_config(guild_id)
+    merged.update(config)
+    guild_configs[guild_id] = merged
+    for key in ROUTED_CHANNELS:
+        if merged.get(key):
+            channel_routes[int(merged[key])] = guild_id
+
+
+def load_guild_configs():
+    """
+    Подгружает дополнительные серверы из config.json → "GUILDS":
+    { "<guild_id>": { "target_channel_id": ..., "role_ids": [...], ... } }
+    """
+    if not os.path.exists(CONFIG_PATH):
+        return
+    try:
+        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+            extra = json.load(f).get("GUILDS", {})
+    except Exception as e:
+        print(f"⚠️ Не удалось прочитать GUILDS из config.json: {e}")
+        return
+    for guild_id, config in extra.items():
+        register_guild(int(guild_id), config)
+    print(f"✅ Серверов в конфигурации: {len(guild_configs)}")
+
+
+def get_guild_config(guild_id: int | None) -> dict:
+    """
+    Возвращает настройки сервера (для неизвестного / None — основной сервер).
+    """
+    return guild_configs.get(guild_id) or guild_configs[GUILD_ID]
+
+
+def guild_for_channel(channel_id: int) -> int | None:
+    """
+    Возвращает ID сервера, которому принадлежит канал, или None.
+    """
+    return channel_routes.get(channel_id)
+
+
+def mark_channel(channel_id: int, msg_id: int):
+    """
+    Запоминает, что сообщения канала до msg_id включительно уже учтены.
+    """
+    if msg_id > channel_marks.get(channel_id, 0):
+        channel_marks[channel_id] = msg_id
+
+
+# Основной сервер из configuration.py
+register_guild(
+    GUILD_ID,
+    {
+        "target_channel_id": TARGET_CHANNEL_ID,
+        "role_ids": ROLE_IDS,
+        "review_roles": REVIEW_ROLES,
+        "blacklist_channel_id": BLACKLIST_CHANNEL_ID,
+        "log_channel_id": LOG_CHANNEL_ID,
+        "alarm_channel_id": ALARM_CHANNEL_ID,
+        "role_to_check": ROLE_TO_CHECK,
+        "declined_file": DECLINED_FILE,
+    },
+)
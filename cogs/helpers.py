@@ -6,23 +6,32 @@ helpers.py
 - работа с blacklist и declined;
 - парсинг сообщений и эмбедов;
 - вычисление баллов анкеты;
+- отправка ЛС через кэш ID личных каналов;
+- получение пользователей/участников через общий кэш (минимум REST-запросов);
 - вспомогательные утилиты.
 """
 
 import discord
 import os
-import json
 import re
+import time
+import asyncio
+from collections import OrderedDict
 
 from configuration import (
-    TARGET_CHANNEL_ID,
+    GUILD_ID,
     CONFIG_PATH,
-    DECLINED_FILE,
-    BLACKLIST_CHANNEL_ID,
+    DM_CACHE_FILE,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
 )
+from cogs.guilds import guild_configs, get_guild_config, channel_marks, mark_channel
+from cogs import perf
+from cogs.trace import record_dm
 
 # -------------------- Глобальные переменные --------------------
-blacklist_ids: set[str] = set()
+blacklist_ids: dict[int, set[str]] = {}  # {guild_id: {uid, ...}}
+BLACKLIST_ID_RE = re.compile(r"\b\d{17,20}\b")  # Discord ID в тексте
 
 
 # -------------------- Работа с конфигами --------------------
@@ -36,8 +45,8 @@ def load_config():
             f"❌ Файл {CONFIG_PATH} не найден! Создай config.json рядом с exe"
         )
 
-    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(CONFIG_PATH, "rb") as f:
+        return perf.loads(f.read())
 
 
 # -------------------- Работа с ID --------------------
@@ -60,57 +69,260 @@ def save_id(filename: str, uid: int):
         f.write(f"{uid}\n")
 
 
-def is_blacklisted(uid: int) -> bool:
+def is_blacklisted(uid: int, guild_id: int = GUILD_ID) -> bool:
     """
-    Проверяет, находится ли пользователь в blacklist.
+    Проверяет, находится ли пользователь в blacklist сервера.
     """
-    blocked = str(uid) in blacklist_ids
+    blocked = str(uid) in blacklist_ids.get(guild_id, ())
     print(f"[DEBUG] Проверка ЧС для {uid}: {blocked}")
     return blocked
 
 
-def is_declined(uid: int) -> bool:
+def is_declined(uid: int, guild_id: int = GUILD_ID) -> bool:
     """
-    Проверяет, отклонялся ли пользователь ранее.
+    Проверяет, отклонялся ли пользователь ранее на этом сервере.
     """
-    declined = load_ids(DECLINED_FILE)
+    declined = load_ids(get_guild_config(guild_id)["declined_file"])
     was = str(uid) in declined
     print(f"[DEBUG] Проверка отклонённых для {uid}: {was}")
     return was
 
 
+# -------------------- Пользователи и участники --------------------
+# {(guild_id или None, uid): (истекает_в, объект)} — от старых к новым
+_user_cache: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+_user_inflight: dict[tuple, asyncio.Task] = {}  # идущие REST-запросы
+resolver_stats = {"gateway": 0, "cache": 0, "merged": 0, "rest": 0}
+
+
+async def _resolve_cached(key: tuple, fetch):
+    """
+    Берёт объект из LRU/TTL-кэша, иначе делает один REST-запрос fetch().
+    Одновременные запросы одного и того же key ждут общий запрос.
+    """
+    now = time.monotonic()
+    cached = _user_cache.get(key)
+    if cached and cached[0] > now:
+        _user_cache.move_to_end(key)
+        resolver_stats["cache"] += 1
+        return cached[1]
+
+    task = _user_inflight.get(key)
+    if task is not None:
+        resolver_stats["merged"] += 1
+        return await task
+
+    task = asyncio.ensure_future(fetch())
+    _user_inflight[key] = task
+    try:
+        obj = await task
+    finally:
+        _user_inflight.pop(key, None)
+    resolver_stats["rest"] += 1
+
+    _user_cache[key] = (time.monotonic() + USER_CACHE_TTL, obj)
+    _user_cache.move_to_end(key)
+    while len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
+    return obj
+
+
+async def resolve_user(bot, uid: int, member=None):
+    """
+    Возвращает пользователя: member из события → кэш gateway → LRU-кэш → REST.
+    """
+    user = member or bot.get_user(uid)
+    if user is not None:
+        resolver_stats["gateway"] += 1
+        return user
+    return await _resolve_cached((None, uid), lambda: bot.fetch_user(uid))
+
+
+async def resolve_member(guild, uid: int, member=None):
+    """
+    Возвращает участника сервера: member из события → кэш гильдии → LRU-кэш → REST.
+    """
+    member = member or guild.get_member(uid)
+    if member is not None:
+        resolver_stats["gateway"] += 1
+        return member
+    return await _resolve_cached((guild.id, uid), lambda: guild.fetch_member(uid))
+
+
+def resolver_hit_ratio() -> float:
+    """
+    Доля запросов, обслуженных без REST (0..1).
+    """
+    total = sum(resolver_stats.values())
+    return 1 - resolver_stats["rest"] / total if total else 1.0
+
+
+# -------------------- Личные сообщения --------------------
+dm_channels: dict[int, int] = {}  # {uid: dm_channel_id}
+_dm_cache_offset = 0  # сколько байт DM_CACHE_FILE уже прочитано
+
+
+def refresh_dm_cache(filename: str = DM_CACHE_FILE) -> bool:
+    """
+    Дочитывает в dm_channels новые строки "uid channel_id" из файла кэша.
+    Файл общий для процессов бота (шлюз и обработчики дописывают в конец),
+    поэтому при промахе кэша сначала читается то, что добавили другие, и только
+    потом идёт запрос к API. При повторах действует последняя запись.
+    Возвращает True, если прочитано что-то новое.
+    """
+    global _dm_cache_offset
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        return False
+    if size < _dm_cache_offset:
+        _dm_cache_offset = 0  # файл пересоздан
+    if size == _dm_cache_offset:
+        return False
+    with open(filename, "rb") as f:
+        f.seek(_dm_cache_offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1  # недописанную строку дочитаем в следующий раз
+    _dm_cache_offset += end
+    for line in data[:end].decode("utf-8", errors="replace").splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+            dm_channels[int(parts[0])] = int(parts[1])
+    return end > 0
+
+
+refresh_dm_cache()
+
+
+def remember_dm_channel(uid: int, channel_id: int):
+    """
+    Запоминает ID ЛС-канала пользователя (в памяти и в DM_CACHE_FILE).
+    """
+    if dm_channels.get(uid) == channel_id:
+        return
+    dm_channels[uid] = channel_id
+    with open(DM_CACHE_FILE, "a", encoding="utf-8") as f:
+        f.write(f"{uid} {channel_id}\n")
+
+
+async def _open_dm(bot, user):
+    """
+    Открывает ЛС-канал через API (create_dm) и запоминает его ID.
+    user — объект пользователя или его ID.
+    """
+    if isinstance(user, int):
+        user = await resolve_user(bot, user)
+    dm = user.dm_channel or await user.create_dm()
+    remember_dm_channel(user.id, dm.id)
+    return dm
+
+
+async def get_dm_channel(bot, user):
+    """
+    Возвращает канал для ЛС пользователю (объект или ID).
+    Если ID канала уже известен — без запросов к API (PartialMessageable).
+    """
+    uid = user if isinstance(user, int) else user.id
+    if not isinstance(user, int) and user.dm_channel:
+        remember_dm_channel(uid, user.dm_channel.id)
+        return user.dm_channel
+    channel_id = dm_channels.get(uid)
+    if channel_id is None and refresh_dm_cache():
+        channel_id = dm_channels.get(uid)  # канал мог открыть другой процесс
+    if channel_id:
+        return bot.get_partial_messageable(channel_id, type=discord.ChannelType.private)
+    return await _open_dm(bot, user)
+
+
+async def send_dm(bot, user, content=None, **kwargs) -> discord.Message:
+    """
+    Отправляет ЛС пользователю (объект или ID) через кэш ID каналов.
+    Если закэшированный канал устарел (NotFound) — открывает ЛС заново и повторяет.
+    discord.Forbidden (закрытые ЛС) пробрасывается как раньше.
+    """
+    uid = user if isinstance(user, int) else user.id
+    channel = await get_dm_channel(bot, user)
+    try:
+        sent = await channel.send(content, **kwargs)
+    except discord.NotFound:
+        if not isinstance(channel, discord.PartialMessageable):
+            raise
+        print(f"⚠️ ЛС-канал {channel.id} пользователя {uid} устарел, открываем заново")
+        dm_channels.pop(uid, None)
+        channel = await _open_dm(bot, user)
+        sent = await channel.send(content, **kwargs)
+    record_dm(uid, sent.id)
+    return sent
+
+
 # -------------------- Blacklist из канала --------------------
-async def load_blacklist_from_channel(bot):
+async def load_blacklist_from_channel(bot, guild_id: int | None = None, full: bool = False):
     """
     Загружает ID из канала ЧС (поиск чисел в сообщениях).
+    Без guild_id — для всех серверов из конфигурации.
+    Если blacklist сервера уже есть (снимок или прошлый on_ready) — читаются
+    только сообщения после последнего учтённого. full=True — канал читается
+    заново целиком (так уходят ID из удалённых сообщений).
     """
-    print("✅ Загружаем ID из канала ЧС")
-    global blacklist_ids
-    channel = bot.get_channel(BLACKLIST_CHANNEL_ID)
+    if guild_id is None:
+        for gid in list(guild_configs):
+            await load_blacklist_from_channel(bot, gid, full)
+        return blacklist_ids
+
+    print(f"✅ Загружаем ID из канала ЧС сервера {guild_id}")
+    channel_id = get_guild_config(guild_id)["blacklist_channel_id"]
+    channel = bot.get_channel(channel_id)
     if channel is None:
-        print(f"❌ Канал ЧС {BLACKLIST_CHANNEL_ID} не найден")
+        print(f"❌ Канал ЧС {channel_id} не найден")
         return set()
 
-    ids = set()
-    async for msg in channel.history(limit=1000):  # лимит можно увеличить
+    mark = channel_marks.get(channel_id)
+    previous = None  # blacklist до полного чтения
+    if mark and guild_id in blacklist_ids and not full:
+        ids = blacklist_ids[guild_id]
+        before = len(ids)
+        history = channel.history(limit=None, after=discord.Object(mark))
+    else:
+        previous = set(blacklist_ids.get(guild_id, ()))
+        ids = set()
+        before = 0
+        history = channel.history(limit=1000)  # лимит можно увеличить
+
+    async for msg in history:
         if msg.content:
-            found = re.findall(r"\b\d{17,20}\b", msg.content)
-            ids.update(found)
+            ids.update(BLACKLIST_ID_RE.findall(msg.content))
+        mark_channel(channel_id, msg.id)
 
-    blacklist_ids = ids
-    print(f"✅ Загружено {len(ids)} ID из канала ЧС")
+    if previous is not None:
+        # ID, добавленные on_message, пока канал читался, не теряем
+        ids.update(blacklist_ids.get(guild_id, set()) - previous)
+    blacklist_ids[guild_id] = ids
+    print(f"✅ Загружено {len(ids) - before} ID из канала ЧС (всего {len(ids)})")
     return ids
 
 
+def add_blacklist_ids(guild_id: int, text: str) -> int:
+    """
+    Добавляет ID из нового сообщения канала ЧС в blacklist сервера.
+    Возвращает количество новых ID.
+    """
+    if not text:
+        return 0
+    ids = blacklist_ids.setdefault(guild_id, set())
+    before = len(ids)
+    ids.update(BLACKLIST_ID_RE.findall(text))
+    return len(ids) - before
+
+
 # -------------------- Работа с сообщениями --------------------
-async def fetch_app_message(bot, msg_id):
+async def fetch_app_message(bot, msg_id, guild_id: int = GUILD_ID):
     """
-    Возвращает объект сообщения анкеты по ID.
+    Возвращает объект сообщения анкеты по ID (из канала заявок сервера).
     Если сообщение не найдено → None.
     """
     if not msg_id:
         return None
-    channel = bot.get_channel(TARGET_CHANNEL_ID)
+    channel = bot.get_channel(get_guild_config(guild_id)["target_channel_id"])
     if channel is None:
         return None
     try:
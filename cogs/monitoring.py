@@ -0,0 +1,120 @@
+"""
+monitoring.py — диагностика event loop в работающем боте
+
+Задачи:
+- Сторож задержки event loop: измеряет опоздание планировщика и, если loop
+  заблокирован дольше порога, печатает стек кода, который его держит
+- Сэмплирующий профайлер главного потока по запросу (формат collapsed stacks,
+  готов для flamegraph.pl / speedscope)
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from configuration import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
+
+# -------------------------Глобальные переменные -------------------------
+_loop_thread_id: int | None = None  # поток, в котором крутится event loop
+_last_tick = 0.0  # time.monotonic() последнего срабатывания heartbeat
+_monitor_task: asyncio.Task | None = None
+max_lag = 0.0  # максимальная замеченная задержка (сек)
+
+
+# -------------------------Сторож задержки-------------------------
+async def _heartbeat(interval: float, threshold: float):
+    """
+    Засыпает на interval и меряет, насколько позже loop её разбудил.
+    """
+    global _last_tick, max_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = loop.time() - expected
+        _last_tick = time.monotonic()
+        max_lag = max(max_lag, lag)
+        if lag > threshold:
+            print(f"⚠️ Event loop опоздал на {lag * 1000:.0f} мс")
+
+
+def _watchdog(interval: float, threshold: float):
+    """
+    Фоновый поток: если heartbeat не срабатывал дольше interval + threshold,
+    loop заблокирован — печатаем стек главного потока (один раз на блокировку).
+    """
+    reported = False
+    while True:
+        time.sleep(threshold / 2)
+        stalled = time.monotonic() - _last_tick - interval
+        if stalled <= threshold:
+            reported = False
+            continue
+        if reported:
+            continue
+        reported = True
+        frame = sys._current_frames().get(_loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else "<нет стека>"
+        print(
+            f"🐢 Event loop заблокирован уже {stalled * 1000:.0f} мс. Стек:\n{stack}"
+        )
+
+
+def start_loop_monitor(
+    interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD
+):
+    """
+    Запускает heartbeat-задачу и поток-сторож (повторные вызовы игнорируются,
+    т.к. on_ready может срабатывать несколько раз).
+    """
+    global _loop_thread_id, _last_tick, _monitor_task
+    if _monitor_task is not None:
+        return
+    _loop_thread_id = threading.get_ident()
+    _last_tick = time.monotonic()
+    _monitor_task = asyncio.create_task(_heartbeat(interval, threshold))
+    threading.Thread(
+        target=_watchdog, args=(interval, threshold), name="loop-watchdog", daemon=True
+    ).start()
+    print(f"✅ Мониторинг event loop запущен (порог {threshold * 1000:.0f} мс)")
+
+
+# -------------------------Профайлер-------------------------
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample_stacks(thread_id: int, seconds: float, interval: float) -> Counter:
+    """
+    Снимает стек потока thread_id каждые interval секунд в течение seconds.
+    Возвращает {"a;b;c": количество сэмплов}.
+    """
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        if stack:
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+async def profile_loop(seconds: float, interval: float = 0.005) -> bytes:
+    """
+    Профилирует поток event loop в течение seconds (сэмплер работает в
+    отдельном потоке и не блокирует бота).
+    Возвращает collapsed stacks: строки "frame;frame;frame count".
+    """
+    thread_id = _loop_thread_id or threading.get_ident()
+    counts = await asyncio.to_thread(_sample_stacks, thread_id, seconds, interval)
+    lines = [f"{stack} {n}" for stack, n in counts.most_common()]
+    return ("\n".join(lines) + "\n").encode("utf-8")
@@ -0,0 +1,428 @@
+"""
+outbox.py — надёжная очередь действий после завершения анкеты
+
+Задачи:
+- Решение по анкете и список действий в Discord (реакция, роли, ник, ЛС,
+  лог дедлайна, ветка, архив) записываются на диск одной атомарной записью
+- Фоновые обработчики выполняют действия по порядку, с повторами при сбоях
+  сети / Discord (пауза растёт вдвое с каждой попыткой)
+- Каждое действие выполняется хотя бы один раз, в том числе после перезапуска.
+  Выполнение действия с ID отправленного сообщения записывается на диск (fsync)
+  до перехода к следующему
+- Сообщения (ЛС, лог дедлайна, ветка) сами по себе не идемпотентны: nonce
+  защищает от дубликата только несколько минут, а повторы идут дольше и после
+  перезапуска. Поэтому повтор такого действия (после ошибки или перезапуска)
+  сначала ищет сообщение бота, отправленное прошлой попыткой, и шлёт новое,
+  только если его нет. Реакции, роли, ник, отклонённые и архив (по ключу
+  задания) повторять безопасно
+- Ключи выполненных заданий хранятся в OUTBOX_DONE_FILE: анкета, завершённая
+  повторно после сбоя, не запускает действия ещё раз
+
+Формат OUTBOX_FILE: { key: {uid, guild_id, msg_id, created, results,
+                             effects: [{op, args, attempts, next_try, done,
+                                        message_id, resumed}]} }
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+import discord
+
+from configuration import (
+    OUTBOX_FILE,
+    OUTBOX_DONE_FILE,
+    OUTBOX_WORKERS,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_DELAY,
+)
+from cogs import perf
+from cogs.archive import archive_application
+from cogs.deadlines import log_deadline, track_deadline
+from cogs.guilds import get_guild_config
+from cogs.helpers import load_ids, save_id, send_dm, get_dm_channel, resolve_member
+
+# -------------------------Глобальные переменные -------------------------
+jobs: dict[str, dict] = {}  # незавершённые задания {key: job}
+done_keys: set[str] = set()  # ключи выполненных заданий
+_queue: asyncio.Queue = asyncio.Queue()  # ключи заданий, готовых к выполнению
+_loaded = False
+_workers: list[asyncio.Task] = []
+_EFFECTS = {}  # {op: async def (bot, job, nonce, retry, **args) -> ID сообщения | None}
+
+THREAD_ALREADY_EXISTS = 160004  # код ошибки Discord: у сообщения уже есть ветка
+
+
+# -------------------------Задания-------------------------
+def new_job(uid: int, guild_id: int, msg_id: int | None) -> dict:
+    """
+    Создаёт пустое задание. Ключ — ID сообщения-заявки: одна заявка даёт
+    одно задание, даже если анкету завершили повторно после сбоя.
+    """
+    created = time.time()
+    return {
+        "key": str(msg_id) if msg_id else f"u{uid}-{int(created)}",
+        "uid": uid,
+        "guild_id": guild_id,
+        "msg_id": msg_id,
+        "created": created,
+        "results": {},
+        "effects": [],
+    }
+
+
+def add_effect(job: dict, op: str, **args):
+    """
+    Добавляет действие в конец задания (выполняются строго по порядку).
+    """
+    job["effects"].append(
+        {"op": op, "args": args, "attempts": 0, "next_try": 0, "done": False}
+    )
+
+
+def commit_job(job: dict) -> bool:
+    """
+    Атомарно записывает задание в OUTBOX_FILE и ставит его в очередь.
+    Возвращает False, если задание с таким ключом уже есть или уже выполнено (повтор).
+    """
+    load_outbox()
+    if job["key"] in jobs or job["key"] in done_keys:
+        return False
+    jobs[job["key"]] = job
+    save_outbox(durable=True)
+    _queue.put_nowait(job["key"])
+    return True
+
+
+# -------------------------Хранение-------------------------
+def save_outbox(durable: bool = False):
+    """
+    Сохраняет задания в OUTBOX_FILE (через временный файл — без порчи при сбое).
+    durable=True — с fsync: новое задание и отправленное сообщение не должны
+    потеряться. Остальные отметки пишутся без fsync — в худшем случае
+    идемпотентное действие повторится.
+    """
+    tmp = OUTBOX_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(perf.dumps(jobs))
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, OUTBOX_FILE)
+
+
+def load_outbox():
+    """
+    Загружает незавершённые задания из OUTBOX_FILE и ставит их в очередь (один раз).
+    Первое невыполненное действие задания могло выполниться до перезапуска,
+    не успев записаться, — оно помечается resumed (проверить перед повтором).
+    """
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    done_keys.update(load_ids(OUTBOX_DONE_FILE))
+    if not os.path.exists(OUTBOX_FILE):
+        return
+    try:
+        with open(OUTBOX_FILE, "rb") as f:
+            data = perf.loads(f.read())
+    except Exception as e:
+        print(f"⚠️ Ошибка при загрузке outbox: {e}")
+        return
+    for key, job in data.items():
+        for step in job["effects"]:
+            if not step["done"]:
+                step["resumed"] = True
+                break
+        jobs[key] = job
+        _queue.put_nowait(key)
+    if jobs:
+        print(f"📬 В outbox незавершённых заданий: {len(jobs)}")
+
+
+# -------------------------Выполнение-------------------------
+def _is_permanent(error: Exception) -> bool:
+    """
+    Ошибка, которую повтор не исправит (нет прав, объект удалён, 4xx кроме 429).
+    """
+    if isinstance(error, (discord.Forbidden, discord.NotFound)):
+        return True
+    return (
+        isinstance(error, discord.HTTPException)
+        and 400 <= error.status < 500
+        and error.status != 429
+    )
+
+
+def _schedule(key: str, delay: float):
+    """
+    Возвращает задание в очередь через delay секунд.
+    """
+    asyncio.get_running_loop().call_later(max(delay, 0), _queue.put_nowait, key)
+
+
+async def _run_job(bot, key: str):
+    """
+    Выполняет невыполненные действия задания по порядку. Если действие нужно
+    повторить позже — задание откладывается целиком (следующие действия
+    могут зависеть от его результата, например архив — от ветки).
+    """
+    job = jobs.get(key)
+    if job is None:
+        return
+    for n, step in enumerate(job["effects"]):
+        if step["done"]:
+            continue
+        wait = step["next_try"] - time.time()
+        if wait > 0:
+            _schedule(key, wait)
+            return
+
+        nonce = f"{job['msg_id'] or job['uid']}{n:02d}"  # ≤ 25 символов
+        # прошлая попытка могла отправить сообщение, но не дождаться ответа
+        # или записи в outbox
+        retry = step["attempts"] > 0 or step.get("resumed", False)
+        try:
+            message_id = await _EFFECTS[step["op"]](bot, job, nonce, retry, **step["args"])
+        except Exception as e:
+            step["attempts"] += 1
+            if _is_permanent(e) or step["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+                print(f"⚠️ Действие {step['op']} для {job['uid']} не выполнено: {e}")
+            else:
+                delay = OUTBOX_RETRY_DELAY * 2 ** (step["attempts"] - 1)
+                step["next_try"] = time.time() + delay
+                print(
+                    f"🔁 Действие {step['op']} для {job['uid']} — повтор через "
+                    f"{delay:.0f} с ({e})"
+                )
+                save_outbox()
+                _schedule(key, delay)
+                return
+        step["done"] = True
+        step.pop("resumed", None)
+        if message_id:
+            step["message_id"] = message_id
+        save_outbox(durable=message_id is not None)
+
+    # ключ — до удаления задания: после сбоя между ними задание просто доработает
+    done_keys.add(key)
+    save_id(OUTBOX_DONE_FILE, key)
+    jobs.pop(key, None)
+    save_outbox()
+
+
+async def outbox_worker(bot):
+    """
+    Фоновый обработчик: берёт задания из очереди и выполняет их.
+    """
+    while True:
+        key = await _queue.get()
+        try:
+            await _run_job(bot, key)
+        except Exception as e:
+            print(f"⚠️ Ошибка при выполнении задания {key}: {e}")
+        finally:
+            _queue.task_done()
+
+
+def start_outbox_workers(bot):
+    """
+    Загружает outbox и запускает OUTBOX_WORKERS обработчиков (один раз).
+    """
+    load_outbox()
+    if not _workers:
+        for _ in range(OUTBOX_WORKERS):
+            _workers.append(asyncio.create_task(outbox_worker(bot)))
+
+
+async def drain_outbox():
+    """
+    Ждёт, пока очередь заданий опустеет (для воспроизведения и выключения).
+    """
+    await _queue.join()
+
+
+# -------------------------Действия-------------------------
+def effect(op: str):
+    """
+    Регистрирует обработчик действия op.
+    """
+
+    def decorator(func):
+        _EFFECTS[op] = func
+        return func
+
+    return decorator
+
+
+async def _find_sent(bot, channel, job: dict, match, limit: int = 100):
+    """
+    Сообщение бота в channel после создания задания, подходящее под match,
+    или None. Так повтор узнаёт, что прошлая попытка уже отправила сообщение.
+    """
+    created = datetime.fromtimestamp(job["created"], timezone.utc)
+    after = discord.Object(discord.utils.time_snowflake(created))
+    async for message in channel.history(limit=limit, after=after):
+        if message.author.id == bot.user.id and match(message):
+            return message
+    return None
+
+
+def _app_message(bot, job: dict):
+    """
+    Сообщение-заявка без запроса к API (PartialMessage) или None.
+    """
+    if not job["msg_id"]:
+        return None
+    channel = bot.get_channel(get_guild_config(job["guild_id"])["target_channel_id"])
+    return channel.get_partial_message(job["msg_id"]) if channel else None
+
+
+async def _member(bot, job: dict):
+    """
+    Участник сервера из задания или None, если его нет на сервере.
+    """
+    guild = bot.get_guild(job["guild_id"])
+    if guild is None:
+        return None
+    try:
+        return await resolve_member(guild, job["uid"])
+    except discord.NotFound:
+        return None
+
+
+@effect("react")
+async def _react(bot, job, nonce, retry, emoji):
+    msg = _app_message(bot, job)
+    if msg:
+        await msg.add_reaction(emoji)
+
+
+@effect("add_roles")
+async def _add_roles(bot, job, nonce, retry):
+    member = await _member(bot, job)
+    if member is None:
+        return
+    guild = member.guild
+    roles = [
+        guild.get_role(rid)
+        for rid in get_guild_config(job["guild_id"])["role_ids"]
+        if guild.get_role(rid)
+    ]
+    if not roles:
+        return
+    try:
+        await member.add_roles(*roles)
+    except discord.Forbidden:
+        print(f"❌ Нет прав выдать роли {member}")
+
+
+@effect("set_nick")
+async def _set_nick(bot, job, nonce, retry, nick):
+    member = await _member(bot, job)
+    if member:
+        await member.edit(nick=nick)
+
+
+@effect("dm")
+async def _dm(bot, job, nonce, retry, text, member_only=False):
+    """
+    ЛС пользователю (если закрыто — ставим реакцию в анкете).
+    member_only — только если пользователь всё ещё на сервере.
+    """
+    member = await _member(bot, job) if member_only else None
+    if member_only and member is None:
+        return None
+    try:
+        if retry:
+            channel = await get_dm_channel(bot, member or job["uid"])
+            sent = await _find_sent(bot, channel, job, lambda m: m.content == text.strip())
+            if sent:
+                return sent.id
+        return (await send_dm(bot, member or job["uid"], text, nonce=nonce)).id
+    except discord.Forbidden:
+        msg = _app_message(bot, job)
+        if msg is None:
+            return None
+        await msg.add_reaction("🚷")
+        if retry:
+            sent = await _find_sent(
+                bot,
+                msg.channel,
+                job,
+                lambda m: m.reference is not None and m.reference.message_id == msg.id,
+            )
+            if sent:
+                return sent.id
+        reply = await msg.reply(
+            "🚷 Этот пользователь закрыл ЛС или вышел. DM не отправлен.",
+            nonce=nonce,
+        )
+        return reply.id
+
+
+@effect("log_deadline")
+async def _log_deadline(bot, job, nonce, retry, days):
+    member = await _member(bot, job)
+    if member is None:
+        return None
+    if retry:
+        channel = bot.get_channel(get_guild_config(job["guild_id"])["log_channel_id"])
+        sent = channel and await _find_sent(
+            bot, channel, job, lambda m: m.content.startswith(f"{member.id} ")
+        )
+        if sent:
+            track_deadline(job["guild_id"], sent)
+            return sent.id
+    sent = await log_deadline(bot, member, days=days, nonce=nonce)
+    return sent.id if sent else None
+
+
+@effect("mark_declined")
+async def _mark_declined(bot, job, nonce, retry):
+    filename = get_guild_config(job["guild_id"])["declined_file"]
+    if str(job["uid"]) not in load_ids(filename):
+        save_id(filename, job["uid"])
+
+
+@effect("thread")
+async def _thread(bot, job, nonce, retry, name, body):
+    """
+    Ветка к заявке. Если она уже создана прошлой попыткой — пишем в неё
+    (ID ветки из сообщения совпадает с ID сообщения), если бот ещё ничего
+    в ней не написал.
+    """
+    msg = _app_message(bot, job)
+    if msg is None:
+        return None
+    try:
+        thread = await msg.create_thread(name=name)
+        existed = False
+    except discord.HTTPException as e:
+        if e.code != THREAD_ALREADY_EXISTS:
+            raise
+        thread = bot.get_channel(msg.id) or bot.get_partial_messageable(msg.id)
+        existed = True
+    job["results"]["thread_id"] = thread.id
+    if existed:
+        sent = await _find_sent(bot, thread, job, lambda m: True)
+        if sent:
+            return sent.id
+    return (await thread.send(body, nonce=nonce)).id
+
+
+@effect("archive")
+async def _archive(bot, job, nonce, retry, name, verdict, score, answers):
+    archive_application(
+        job["uid"],
+        name,
+        verdict,
+        score,
+        answers,
+        msg_id=job["msg_id"],
+        thread_id=job["results"].get("thread_id"),
+        guild_id=job["guild_id"],
+        key=job["key"],
+    )
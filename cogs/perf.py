@@ -0,0 +1,141 @@
+"""
+perf.py — профиль производительности (PERF_PROFILE=1 в .env)
+
+Задачи:
+- Быстрый JSON-кодек для прогресса анкет, config.json и outbox:
+  msgspec (записи анкет декодируются по схеме SessionRecord) → orjson → json
+- Event loop на uvloop (не установлен / Windows → стандартный asyncio)
+
+Без профиля или без библиотек всё работает как раньше: стандартные json и asyncio.
+Файлы совместимы между профилями — это обычный JSON в UTF-8.
+"""
+
+import asyncio
+import json
+from typing import TypedDict
+
+
+class SessionRecord(TypedDict, total=False):
+    """
+    Запись анкеты в progress.json. msgspec проверяет типы при загрузке и
+    отбрасывает неизвестные ключи — новые поля анкеты нужно добавлять сюда.
+    """
+
+    answers: list[str]
+    index: int
+    msg_id: int | None
+    qmsg_id: int | None
+    guild_id: int
+    name: str | None
+    last_active: float
+    reminded: bool
+
+
+# -------------------------Глобальные переменные -------------------------
+codec = "json"  # json | orjson | msgspec
+loop_backend = "asyncio"  # asyncio | uvloop
+_msgspec = None
+_orjson = None
+_uvloop = None
+_encoder = None
+_decoder = None
+_progress_decoder = None
+
+
+def enable_fast_profile() -> str:
+    """
+    Включает самые быстрые из установленных кодека и event loop.
+    Возвращает описание выбранного, например "msgspec + uvloop".
+    """
+    global codec, loop_backend, _msgspec, _orjson, _uvloop
+    global _encoder, _decoder, _progress_decoder
+    try:
+        import msgspec
+
+        _msgspec = msgspec
+        _encoder = msgspec.json.Encoder()
+        _decoder = msgspec.json.Decoder()
+        _progress_decoder = msgspec.json.Decoder(dict[int, SessionRecord])
+        codec = "msgspec"
+    except ImportError:
+        try:
+            import orjson
+
+            _orjson = orjson
+            codec = "orjson"
+        except ImportError:
+            pass
+
+    try:
+        import uvloop
+
+        _uvloop = uvloop
+        loop_backend = "uvloop"
+    except ImportError:
+        pass
+    return f"{codec} + {loop_backend}"
+
+
+# -------------------------JSON-------------------------
+def dumps(obj) -> bytes:
+    """
+    Кодирует объект в компактный JSON (UTF-8). Ключи-числа → строки.
+    """
+    if codec == "msgspec":
+        return _encoder.encode(obj)
+    if codec == "orjson":
+        return _orjson.dumps(obj, option=_orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: bytes | str):
+    """
+    Декодирует JSON.
+    """
+    if codec == "msgspec":
+        return _decoder.decode(data)
+    if codec == "orjson":
+        return _orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_progress(progress: dict) -> bytes:
+    """
+    Кодирует user_progress для PROGRESS_FILE.
+    Без профиля — как раньше, с отступами (файл удобно читать глазами).
+    """
+    if codec == "json":
+        data = {str(uid): entry for uid, entry in progress.items()}
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return dumps(progress)
+
+
+def load_progress(data: bytes) -> dict[int, dict]:
+    """
+    Декодирует PROGRESS_FILE в {uid: запись анкеты}.
+    С msgspec записи проверяются по SessionRecord; если файл не подходит под
+    схему — читается без проверки (с предупреждением), чтобы не потерять анкеты.
+    """
+    if codec == "msgspec":
+        try:
+            return _progress_decoder.decode(data)
+        except _msgspec.ValidationError as e:
+            print(f"⚠️ progress.json не совпадает со схемой ({e}) — читаю без проверки")
+    return {int(uid): entry for uid, entry in loads(data).items()}
+
+
+# -------------------------Event loop-------------------------
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Новый event loop выбранного типа.
+    """
+    return _uvloop.new_event_loop() if _uvloop else asyncio.new_event_loop()
+
+
+def run(main):
+    """
+    asyncio.run(main) на выбранном event loop.
+    """
+    if _uvloop:
+        asyncio.set_event_loop_policy(_uvloop.EventLoopPolicy())
+    return asyncio.run(main)
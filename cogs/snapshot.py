@@ -0,0 +1,207 @@
+"""
+snapshot.py — снимок состояния для быстрого перезапуска
+
+Задачи:
+- Один бинарный файл со всем состоянием, которое иначе собирается из истории
+  Discord: blacklist серверов, незакрытые дедлайны, отметки последнего
+  учтённого сообщения в каналах
+- Атомарная запись (временный файл + os.replace) при выключении и периодически
+- Чтение через mmap при запуске; после него из Discord догружается только то,
+  что появилось после отметок
+
+Прогресс анкет, обработанные заявки и кэш ЛС-каналов живут в своих файлах и
+сохраняются при каждом изменении — в снимок они не входят.
+
+Формат (little-endian, версия FORMAT_VERSION):
+    заголовок   magic 8s | версия H | время сохранения d | отметок I | серверов I
+    отметки     (channel_id Q, msg_id Q) × отметок
+    сервер      guild_id Q | ID в ЧС I | прочих записей ЧС I | дедлайнов I
+                ID в ЧС Q × n | (длина H, запись UTF-8) × n |
+                (msg_id Q, uid Q, дедлайн d) × n
+    хвост       crc32 всего, что выше, I
+
+Прочие записи ЧС — то, что не записать как Q без потерь (20 цифр, ведущий
+ноль): хранятся строкой, чтобы не пропасть при перезапуске.
+"""
+
+import asyncio
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from configuration import SNAPSHOT_FILE, SNAPSHOT_INTERVAL, SNAPSHOT_MAX_AGE
+from cogs.deadlines import pending_deadlines
+from cogs.guilds import channel_marks
+from cogs.helpers import blacklist_ids
+
+MAGIC = b"BELLSNAP"
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct("<8sHdII")
+_MARK = struct.Struct("<QQ")
+_GUILD = struct.Struct("<QIII")
+_ID = struct.Struct("<Q")
+_STR_LEN = struct.Struct("<H")
+_DEADLINE = struct.Struct("<QQd")
+_CRC = struct.Struct("<I")
+
+# -------------------------Глобальные переменные -------------------------
+_ready = False  # состояние загружено/собрано — можно сохранять
+_task: asyncio.Task | None = None
+
+
+def build_snapshot() -> bytes:
+    """
+    Собирает снимок текущего состояния в байты.
+    """
+    guild_ids = set(blacklist_ids) | set(pending_deadlines)
+    buf = bytearray(
+        _HEADER.pack(MAGIC, FORMAT_VERSION, time.time(), len(channel_marks), len(guild_ids))
+    )
+    for channel_id, msg_id in channel_marks.items():
+        buf += _MARK.pack(channel_id, msg_id)
+    for guild_id in guild_ids:
+        # в ЧС попадают любые числа из 17–20 цифр; до 19 цифр без ведущего нуля —
+        # всегда < 2**64 и переживает str(int(...)), остальное пишем строкой
+        entries = blacklist_ids.get(guild_id, set())
+        ids = [
+            uid for uid in entries
+            if len(uid) < 20 and uid.isascii() and uid.isdigit() and uid[0] != "0"
+        ]
+        others = entries.difference(ids) if len(ids) != len(entries) else ()
+        deadlines = pending_deadlines.get(guild_id, {})
+        buf += _GUILD.pack(guild_id, len(ids), len(others), len(deadlines))
+        buf += struct.pack(f"<{len(ids)}Q", *map(int, ids))
+        for uid in others:
+            raw = uid.encode("utf-8")
+            buf += _STR_LEN.pack(len(raw)) + raw
+        for msg_id, (uid, deadline) in deadlines.items():
+            buf += _DEADLINE.pack(msg_id, uid, deadline)
+    buf += _CRC.pack(zlib.crc32(buf))
+    return bytes(buf)
+
+
+def save_snapshot(path: str = SNAPSHOT_FILE):
+    """
+    Атомарно записывает снимок (через временный файл — без порчи при сбое).
+    До загрузки/сборки состояния ничего не пишет, чтобы не затереть снимок пустым.
+    """
+    if not _ready:
+        return
+    data = build_snapshot()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _parse(view: memoryview) -> tuple[float, dict, dict, dict]:
+    """
+    Разбирает снимок. Ошибка формата → ValueError.
+    """
+    if len(view) < _HEADER.size + _CRC.size:
+        raise ValueError("файл слишком короткий")
+    (crc,) = _CRC.unpack_from(view, len(view) - _CRC.size)
+    if zlib.crc32(view[: len(view) - _CRC.size]) != crc:
+        raise ValueError("контрольная сумма не совпадает")
+    magic, version, saved_at, mark_count, guild_count = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("не файл снимка")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"версия {version}, ожидалась {FORMAT_VERSION}")
+
+    offset = _HEADER.size
+    marks = {}
+    for channel_id, msg_id in _MARK.iter_unpack(view[offset : offset + mark_count * _MARK.size]):
+        marks[channel_id] = msg_id
+    offset += mark_count * _MARK.size
+
+    blacklist, deadlines = {}, {}
+    for _ in range(guild_count):
+        guild_id, id_count, other_count, deadline_count = _GUILD.unpack_from(view, offset)
+        offset += _GUILD.size
+        blacklist[guild_id] = {
+            str(uid) for uid in struct.unpack_from(f"<{id_count}Q", view, offset)
+        }
+        offset += id_count * _ID.size
+        for _ in range(other_count):
+            (size,) = _STR_LEN.unpack_from(view, offset)
+            offset += _STR_LEN.size
+            blacklist[guild_id].add(bytes(view[offset : offset + size]).decode("utf-8"))
+            offset += size
+        end = offset + deadline_count * _DEADLINE.size
+        deadlines[guild_id] = {
+            msg_id: (uid, deadline)
+            for msg_id, uid, deadline in _DEADLINE.iter_unpack(view[offset:end])
+        }
+        offset = end
+    return saved_at, marks, blacklist, deadlines
+
+
+def load_snapshot(path: str = SNAPSHOT_FILE) -> bool:
+    """
+    Загружает снимок (mmap) в blacklist_ids, pending_deadlines и channel_marks.
+    Возвращает False, если снимка нет, он повреждён, другой версии или старше
+    SNAPSHOT_MAX_AGE — тогда состояние собирается из Discord как раньше, и
+    сохранять снимок можно только после этой сборки (mark_snapshot_ready).
+    """
+    global _ready
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                saved_at, marks, blacklist, deadlines = _parse(view)
+    except Exception as e:
+        print(f"⚠️ Снимок состояния не загружен: {e}")
+        return False
+
+    age = time.time() - saved_at
+    if age > SNAPSHOT_MAX_AGE:
+        print(f"⚠️ Снимок состояния устарел ({age / 3600:.0f} ч) — читаем всё из Discord")
+        return False
+
+    channel_marks.update(marks)
+    blacklist_ids.update(blacklist)
+    pending_deadlines.update(deadlines)
+    _ready = True
+    print(
+        f"✅ Снимок состояния загружен ({age:.0f} с назад): "
+        f"ЧС {sum(map(len, blacklist.values()))}, "
+        f"дедлайнов {sum(map(len, deadlines.values()))}, каналов {len(marks)}"
+    )
+    return True
+
+
+def mark_snapshot_ready():
+    """
+    Состояние собрано из Discord (холодный старт) — с этого момента снимок
+    можно сохранять.
+    """
+    global _ready
+    _ready = True
+
+
+async def snapshot_loop():
+    """
+    Фоновая задача: раз в SNAPSHOT_INTERVAL сохраняет снимок.
+    """
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            save_snapshot()
+        except Exception as e:
+            print(f"⚠️ Ошибка при сохранении снимка состояния: {e}")
+
+
+def start_snapshots():
+    """
+    Запускает snapshot_loop (один раз — on_ready вызывается при каждом переподключении).
+    """
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(snapshot_loop())
@@ -0,0 +1,387 @@
+"""
+state.py — общее хранилище состояния для нескольких процессов бота
+
+Задачи:
+- Интерфейс хранилища (StateBackend): анкеты с версиями и compare-and-set,
+  индексы истечения анкет, blacklist серверов, очереди событий между процессами
+- LocalStateBackend — в памяти одного процесса (без внешних сервисов)
+- RedisStateBackend — Redis или любой сервер с протоколом RESP
+  (для проверки без Redis — benchmarks/respstore.py). Клиент протокола
+  встроен, пакет redis не нужен
+
+Ключи в Redis:
+    bell:session:<uid>     JSON {"v": версия, "entry": анкета}
+    bell:lease:<uid>       аренда анкеты: токен владельца, со сроком (PX)
+    bell:sessions          множество uid, у которых есть анкета
+    bell:expiry            sorted set uid → last_active (все анкеты)
+    bell:remind            sorted set uid → last_active (ещё без напоминания)
+    bell:blacklist:<gid>   множество ID из ЧС сервера
+    bell:queue:<name>      список событий (JSON) для процессов-обработчиков
+"""
+
+import abc
+import asyncio
+import contextlib
+import json
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+PREFIX = "bell"
+DUE_KINDS = ("expiry", "remind")  # индексы истечения (см. due_sessions)
+
+
+def _expiry_score(entry: dict) -> float:
+    """Место анкеты в индексах истечения — время последнего вопроса."""
+    return entry.get("last_active") or time.time()
+
+
+def answer_queue(uid: int, workers: int) -> str:
+    """
+    Очередь обработчика для событий пользователя: все события одного uid
+    попадают к одному обработчику (по порядку, без гонок за анкету).
+    """
+    return f"answers:{uid % workers}"
+
+
+class StateBackend(abc.ABC):
+    """
+    Интерфейс общего хранилища. Версия анкеты растёт с каждой записью;
+    отсутствующая анкета имеет версию 0. Хранилище без какого-либо метода
+    не создаётся (TypeError при создании, а не при первом вызове).
+    """
+
+    @abc.abstractmethod
+    async def get_session(self, uid: int) -> tuple[dict | None, int]:
+        """Возвращает (анкета или None, версия)."""
+
+    @abc.abstractmethod
+    async def cas_session(self, uid: int, version: int, entry: dict | None) -> int | None:
+        """
+        Записывает анкету (None — удаляет), только если её версия всё ещё version.
+        Возвращает новую версию или None, если анкету успели изменить.
+        """
+
+    @abc.abstractmethod
+    async def session_ids(self) -> list[int]:
+        """uid всех анкет."""
+
+    @abc.abstractmethod
+    async def due_sessions(self, kind: str, before: float) -> list[int]:
+        """
+        uid анкет из индекса kind ("expiry" — все анкеты, "remind" — ещё без
+        напоминания), последний вопрос в которых задан не позже before.
+        Индексы обновляет cas_session, так что стоимость — O(найденных).
+        """
+
+    @abc.abstractmethod
+    async def acquire_lease(self, uid: int, token: str, ttl: float) -> bool:
+        """
+        Берёт аренду анкеты на ttl секунд, если её никто не держит.
+        Пока аренда у одного процесса, другие не читают анкету для изменения.
+        """
+
+    @abc.abstractmethod
+    async def release_lease(self, uid: int, token: str):
+        """Отпускает аренду, если она всё ещё принадлежит token."""
+
+    @abc.abstractmethod
+    async def set_blacklist(self, guild_id: int, ids: set[str]):
+        """Заменяет blacklist сервера."""
+
+    @abc.abstractmethod
+    async def add_blacklist(self, guild_id: int, ids: set[str]):
+        """Добавляет ID в blacklist сервера."""
+
+    @abc.abstractmethod
+    async def get_blacklist(self, guild_id: int) -> set[str]:
+        """blacklist сервера."""
+
+    @abc.abstractmethod
+    async def push(self, queue: str, item: dict):
+        """Кладёт событие в конец очереди."""
+
+    @abc.abstractmethod
+    async def pop(self, queue: str, timeout: float = 1.0) -> dict | None:
+        """Берёт событие из начала очереди (ждёт до timeout секунд)."""
+
+    async def close(self):
+        pass
+
+
+# -------------------------В памяти процесса-------------------------
+class LocalStateBackend(StateBackend):
+    """
+    Хранилище в памяти: для одного процесса и для проверки логики без Redis.
+    Между await нет переключений, поэтому compare-and-set атомарен.
+    """
+
+    def __init__(self):
+        self.sessions: dict[int, str] = {}  # {uid: анкета в JSON} — копия, как в Redis
+        self.versions: dict[int, int] = {}  # версия сохраняется и после удаления
+        self.due: dict[str, dict[int, float]] = {kind: {} for kind in DUE_KINDS}
+        self.leases: dict[int, tuple[str, float]] = {}  # {uid: (токен, до monotonic)}
+        self.blacklists: dict[int, set[str]] = defaultdict(set)
+        self.queues: dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
+
+    async def get_session(self, uid):
+        entry = self.sessions.get(uid)
+        return json.loads(entry) if entry else None, self.versions.get(uid, 0)
+
+    async def cas_session(self, uid, version, entry):
+        if self.versions.get(uid, 0) != version:
+            return None
+        version += 1
+        self.versions[uid] = version
+        for index in self.due.values():
+            index.pop(uid, None)
+        if entry is None:
+            self.sessions.pop(uid, None)
+        else:
+            self.sessions[uid] = json.dumps(entry, ensure_ascii=False)
+            self.due["expiry"][uid] = _expiry_score(entry)
+            if not entry.get("reminded"):
+                self.due["remind"][uid] = _expiry_score(entry)
+        return version
+
+    async def session_ids(self):
+        return list(self.sessions)
+
+    async def due_sessions(self, kind, before):
+        # полный просмотр — хранилище для проверки логики, не для нагрузки
+        return [uid for uid, score in self.due[kind].items() if score <= before]
+
+    async def acquire_lease(self, uid, token, ttl):
+        now = time.monotonic()
+        holder = self.leases.get(uid)
+        if holder is not None and holder[1] > now:
+            return False
+        self.leases[uid] = (token, now + ttl)
+        return True
+
+    async def release_lease(self, uid, token):
+        holder = self.leases.get(uid)
+        if holder is not None and holder[0] == token:
+            del self.leases[uid]
+
+    async def set_blacklist(self, guild_id, ids):
+        self.blacklists[guild_id] = set(ids)
+
+    async def add_blacklist(self, guild_id, ids):
+        self.blacklists[guild_id].update(ids)
+
+    async def get_blacklist(self, guild_id):
+        return set(self.blacklists[guild_id])
+
+    async def push(self, queue, item):
+        self.queues[queue].put_nowait(item)
+
+    async def pop(self, queue, timeout=1.0):
+        try:
+            return await asyncio.wait_for(self.queues[queue].get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+# -------------------------Протокол RESP-------------------------
+class RespError(Exception):
+    """Ошибка, которую вернул сервер (-ERR ...)."""
+
+
+class RespConnection:
+    """
+    Одно соединение с RESP-сервером: команда → ответ по очереди.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int, db: int = 0):
+        reader, writer = await asyncio.open_connection(host, port)
+        conn = cls(reader, writer)
+        if db:
+            await conn.call("SELECT", db)
+        return conn
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    async def call(self, *args):
+        self.writer.write(self._encode(args))
+        await self.writer.drain()
+        return await self._read()
+
+    async def pipeline(self, *commands):
+        """
+        Несколько команд одной записью (один обмен с сервером); ответы по порядку.
+        """
+        self.writer.write(b"".join(self._encode(args) for args in commands))
+        await self.writer.drain()
+        return [await self._read() for _ in commands]
+
+    async def _read(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("RESP-сервер закрыл соединение")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RespError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            return (await self.reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            size = int(body)
+            if size < 0:
+                return None
+            return [await self._read() for _ in range(size)]
+        raise RespError(f"неизвестный ответ: {line!r}")
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Хранилище в Redis (или совместимом RESP-сервере).
+    compare-and-set анкеты — через WATCH / MULTI / EXEC.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0):
+        self.host, self.port, self.db = host, port, db
+        self._idle: list[RespConnection] = []
+
+    @contextlib.asynccontextmanager
+    async def _connection(self):
+        """
+        Соединение из пула. После ошибки соединение закрывается (его состояние
+        неизвестно), иначе возвращается в пул.
+        """
+        conn = self._idle.pop() if self._idle else await RespConnection.open(
+            self.host, self.port, self.db
+        )
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        self._idle.append(conn)
+
+    async def _call(self, *args):
+        async with self._connection() as conn:
+            return await conn.call(*args)
+
+    async def get_session(self, uid):
+        raw = await self._call("GET", f"{PREFIX}:session:{uid}")
+        if raw is None:
+            return None, 0
+        data = json.loads(raw)
+        return data["entry"], data["v"]
+
+    async def cas_session(self, uid, version, entry):
+        key = f"{PREFIX}:session:{uid}"
+        async with self._connection() as conn:
+            _, raw = await conn.pipeline(("WATCH", key), ("GET", key))
+            current = json.loads(raw)["v"] if raw else 0
+            if current != version:
+                await conn.call("UNWATCH")
+                return None
+            version += 1
+            if entry is None:
+                # версия остаётся в «надгробии», чтобы устаревшая копия не воскресила анкету
+                write = (
+                    ("SET", key, json.dumps({"v": version, "entry": None})),
+                    ("SREM", f"{PREFIX}:sessions", uid),
+                    ("ZREM", f"{PREFIX}:expiry", uid),
+                    ("ZREM", f"{PREFIX}:remind", uid),
+                )
+            else:
+                score = _expiry_score(entry)
+                write = (
+                    ("SET", key, json.dumps({"v": version, "entry": entry}, ensure_ascii=False)),
+                    ("SADD", f"{PREFIX}:sessions", uid),
+                    ("ZADD", f"{PREFIX}:expiry", score, uid),
+                    ("ZREM", f"{PREFIX}:remind", uid)
+                    if entry.get("reminded")
+                    else ("ZADD", f"{PREFIX}:remind", score, uid),
+                )
+            *_, result = await conn.pipeline(("MULTI",), *write, ("EXEC",))
+        return None if result is None else version
+
+    async def session_ids(self):
+        return [int(uid) for uid in await self._call("SMEMBERS", f"{PREFIX}:sessions")]
+
+    async def due_sessions(self, kind, before):
+        members = await self._call("ZRANGEBYSCORE", f"{PREFIX}:{kind}", "-inf", before)
+        return [int(uid) for uid in members]
+
+    async def acquire_lease(self, uid, token, ttl):
+        reply = await self._call(
+            "SET", f"{PREFIX}:lease:{uid}", token, "NX", "PX", int(ttl * 1000)
+        )
+        return reply is not None
+
+    async def release_lease(self, uid, token):
+        # без Lua: удаляем под WATCH, только если аренда всё ещё наша
+        key = f"{PREFIX}:lease:{uid}"
+        async with self._connection() as conn:
+            _, holder = await conn.pipeline(("WATCH", key), ("GET", key))
+            if holder != token.encode():
+                await conn.call("UNWATCH")
+                return
+            await conn.pipeline(("MULTI",), ("DEL", key), ("EXEC",))
+
+    async def set_blacklist(self, guild_id, ids):
+        key = f"{PREFIX}:blacklist:{guild_id}"
+        async with self._connection() as conn:
+            await conn.call("MULTI")
+            await conn.call("DEL", key)
+            if ids:
+                await conn.call("SADD", key, *ids)
+            await conn.call("EXEC")
+
+    async def add_blacklist(self, guild_id, ids):
+        if ids:
+            await self._call("SADD", f"{PREFIX}:blacklist:{guild_id}", *ids)
+
+    async def get_blacklist(self, guild_id):
+        members = await self._call("SMEMBERS", f"{PREFIX}:blacklist:{guild_id}")
+        return {uid.decode() for uid in members}
+
+    async def push(self, queue, item):
+        await self._call(
+            "RPUSH", f"{PREFIX}:queue:{queue}", json.dumps(item, ensure_ascii=False)
+        )
+
+    async def pop(self, queue, timeout=1.0):
+        result = await self._call("BLPOP", f"{PREFIX}:queue:{queue}", timeout)
+        return json.loads(result[1]) if result else None
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+def create_backend(url: str | None) -> StateBackend:
+    """
+    Хранилище по адресу: "local" / пусто → в памяти, "redis://host:port/db" → Redis.
+    """
+    if not url or url == "local":
+        return LocalStateBackend()
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise ValueError(f"Неизвестное хранилище состояния: {url}")
+    db = int(parsed.path.strip("/") or 0)
+    return RedisStateBackend(parsed.hostname or "127.0.0.1", parsed.port or 6379, db)
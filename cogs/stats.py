@@ -0,0 +1,280 @@
+"""
+stats.py — потоковая аналитика воронки анкет
+
+Задачи:
+- Счётчики по вопросам: сколько раз задан, сколько ответов, где бросают анкету
+- Скетчи квантилей времени ответа на каждый вопрос (фиксированная относительная
+  точность, память не растёт с числом ответов)
+- Распределение вердиктов и баллов
+- Периодическое сохранение агрегатов на диск и вывод для !stats (вместе со
+  статистикой процессов-обработчиков из их файлов)
+
+Всё обновляется инкрементально за O(1) — история и архив не читаются.
+"""
+
+import asyncio
+import glob
+import json
+import math
+import os
+from collections import Counter
+
+from configuration import STATS_FILE, STATS_WORKER_FILES, STATS_CHECKPOINT_INTERVAL
+
+
+class QuantileSketch:
+    """
+    Логарифмическая гистограмма (идея DDSketch): значение x попадает в корзину
+    ceil(log(x) / log(gamma)), квантиль возвращается с относительной ошибкой
+    не больше accuracy. Число корзин зависит только от диапазона значений.
+    """
+
+    def __init__(self, accuracy: float = 0.02, buckets: dict | None = None):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = Counter({int(k): v for k, v in (buckets or {}).items()})
+        self.count = sum(self.buckets.values())
+
+    def add(self, value: float):
+        value = max(value, 1e-3)  # всё, что быстрее 1 мс, считаем за 1 мс
+        self.buckets[math.ceil(math.log(value) / self.log_gamma)] += 1
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma**key / (self.gamma + 1)
+        return None
+
+    def merge(self, other: "QuantileSketch"):
+        """
+        Добавляет значения другого скетча (с той же точностью) — корзины просто
+        складываются.
+        """
+        self.buckets.update(other.buckets)
+        self.count += other.count
+
+    def to_dict(self) -> dict:
+        return {"accuracy": self.accuracy, "buckets": dict(self.buckets)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        return cls(data.get("accuracy", 0.02), data.get("buckets"))
+
+
+# -------------------------Глобальные переменные -------------------------
+funnel = Counter()  # started / finished / abandoned / duplicates
+asked = Counter()  # {индекс вопроса: сколько раз задан}
+answered = Counter()  # {индекс вопроса: сколько ответов}
+abandoned_at = Counter()  # {индекс вопроса: сколько анкет брошено на нём}
+verdicts = Counter()  # {вердикт: количество}
+scores = Counter()  # {баллы: количество}
+answer_times: dict[int, QuantileSketch] = {}  # {индекс вопроса: скетч секунд}
+_checkpoint_task: asyncio.Task | None = None
+_loaded = False  # пока статистика не загружена, сохранять нельзя (затрём файл)
+
+
+# -------------------------Обновление агрегатов-------------------------
+def record_started():
+    funnel["started"] += 1
+
+
+def record_asked(index: int):
+    asked[index] += 1
+
+
+def record_answered(index: int, seconds: float):
+    answered[index] += 1
+    answer_times.setdefault(index, QuantileSketch()).add(seconds)
+
+
+def record_duplicate():
+    funnel["duplicates"] += 1
+
+
+def record_finished(verdict: str, score: int | None):
+    funnel["finished"] += 1
+    verdicts[verdict] += 1
+    if score is not None:
+        scores[score] += 1
+
+
+def record_abandoned(index: int):
+    funnel["abandoned"] += 1
+    abandoned_at[index] += 1
+
+
+# -------------------------Сохранение-------------------------
+def _stats_data() -> dict:
+    """
+    Агрегаты этого процесса в виде, в котором они лежат в STATS_FILE.
+    """
+    return {
+        "funnel": funnel,
+        "asked": asked,
+        "answered": answered,
+        "abandoned_at": abandoned_at,
+        "verdicts": verdicts,
+        "scores": scores,
+        "answer_times": {i: s.to_dict() for i, s in answer_times.items()},
+    }
+
+
+def _add_stats(target: dict, data: dict):
+    """
+    Прибавляет агрегаты data (формат STATS_FILE) к target: счётчики
+    суммируются, скетчи сливаются.
+    """
+    target["funnel"].update(data.get("funnel", {}))
+    target["verdicts"].update(data.get("verdicts", {}))
+    for key in ("asked", "answered", "abandoned_at", "scores"):
+        target[key].update({int(k): v for k, v in data.get(key, {}).items()})
+    for index, sketch in data.get("answer_times", {}).items():
+        sketch = QuantileSketch.from_dict(sketch)
+        if int(index) in target["answer_times"]:
+            target["answer_times"][int(index)].merge(sketch)
+        else:
+            target["answer_times"][int(index)] = sketch
+
+
+def save_stats():
+    """
+    Сохраняет агрегаты в STATS_FILE (через временный файл — без порчи при сбое).
+    """
+    if not _loaded:
+        return
+    tmp = STATS_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_stats_data(), f, ensure_ascii=False)
+    os.replace(tmp, STATS_FILE)
+
+
+def _read_stats(path: str) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Ошибка при загрузке статистики {path}: {e}")
+        return None
+
+
+def load_stats():
+    """
+    Загружает агрегаты из STATS_FILE (если есть).
+    """
+    global _loaded
+    _loaded = True
+    if not os.path.exists(STATS_FILE):
+        return
+    data = _read_stats(STATS_FILE)
+    if data is not None:
+        _add_stats(
+            {
+                "funnel": funnel,
+                "asked": asked,
+                "answered": answered,
+                "abandoned_at": abandoned_at,
+                "verdicts": verdicts,
+                "scores": scores,
+                "answer_times": answer_times,
+            },
+            data,
+        )
+
+
+def merged_stats() -> dict:
+    """
+    Агрегаты этого процесса плюс сохранённые агрегаты обработчиков
+    (STATS_WORKER_FILES). Ответы анкет при HANDOFF_WORKERS принимают
+    обработчики, так что без них воронка шлюза пуста. Файлы обработчиков
+    обновляются раз в STATS_CHECKPOINT_INTERVAL и при их остановке.
+    """
+    merged = {
+        "funnel": Counter(),
+        "asked": Counter(),
+        "answered": Counter(),
+        "abandoned_at": Counter(),
+        "verdicts": Counter(),
+        "scores": Counter(),
+        "answer_times": {},
+    }
+    _add_stats(merged, _stats_data())
+    for path in sorted(glob.glob(STATS_WORKER_FILES)):
+        if os.path.abspath(path) == os.path.abspath(STATS_FILE):
+            continue  # свой файл — уже учтён из памяти
+        data = _read_stats(path)
+        if data is not None:
+            _add_stats(merged, data)
+    return merged
+
+
+async def stats_checkpoint_loop():
+    """
+    Фоновая задача: раз в STATS_CHECKPOINT_INTERVAL сохраняет агрегаты.
+    """
+    while True:
+        await asyncio.sleep(STATS_CHECKPOINT_INTERVAL)
+        try:
+            await asyncio.to_thread(save_stats)
+        except Exception as e:
+            print(f"⚠️ Ошибка при сохранении статистики: {e}")
+
+
+def start_stats_checkpoints():
+    """
+    Загружает статистику и запускает периодическое сохранение (один раз).
+    """
+    global _checkpoint_task
+    if _checkpoint_task is None:
+        load_stats()
+        _checkpoint_task = asyncio.create_task(stats_checkpoint_loop())
+
+
+# -------------------------Вывод-------------------------
+def _fmt_seconds(value: float | None) -> str:
+    if value is None:
+        return "—"
+    if value < 60:
+        return f"{value:.0f}с"
+    if value < 3600:
+        return f"{value / 60:.1f}м"
+    return f"{value / 3600:.1f}ч"
+
+
+def format_stats(question_count: int) -> str:
+    """
+    Текст для !stats (время не зависит от числа анкет в истории).
+    """
+    stats = merged_stats()
+    counts = stats["funnel"]
+    lines = [
+        f"📈 Начато: {counts['started']} | Завершено: {counts['finished']} | "
+        f"Брошено: {counts['abandoned']} | Дубликатов отброшено: {counts['duplicates']}",
+        "",
+        "**Вопрос: задан / ответов / брошено — p50 / p90 времени ответа**",
+    ]
+    for index in range(question_count):
+        sketch = stats["answer_times"].get(index)
+        p50 = sketch.quantile(0.5) if sketch else None
+        p90 = sketch.quantile(0.9) if sketch else None
+        lines.append(
+            f"{index + 1}. {stats['asked'][index]} / {stats['answered'][index]} / "
+            f"{stats['abandoned_at'][index]} — {_fmt_seconds(p50)} / {_fmt_seconds(p90)}"
+        )
+
+    lines.append("")
+    lines.append(
+        "**Вердикты:** "
+        + (", ".join(f"{v}: {n}" for v, n in stats["verdicts"].most_common()) or "—")
+    )
+    lines.append(
+        "**Баллы:** "
+        + (", ".join(f"{s}: {n}" for s, n in sorted(stats["scores"].items())) or "—")
+    )
+    return "\n".join(lines)
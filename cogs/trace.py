@@ -0,0 +1,135 @@
+"""
+trace.py — запись событий бота в компактный trace-файл
+
+Задачи:
+- Сериализация обрабатываемых событий (сообщения в каналах заявок и ЧС, ЛС,
+  реакции) в gzip-файл JSON-строк
+- Запись сопутствующих фактов, без которых событие не воспроизвести офлайн:
+  какому участнику соответствует тег из анкеты и какие ID получили ЛС бота
+- Чтение trace-файла для движка воспроизведения (benchmarks/replay.py)
+
+Запись включается переменной окружения TRACE_FILE=<путь>.
+"""
+
+import gzip
+import json
+import time
+
+# -------------------------Глобальные переменные -------------------------
+_trace_file = None  # открытый gzip-файл или None (запись выключена)
+_started_at = 0.0
+_pending = 0  # событий с последнего flush
+FLUSH_EVERY = 50
+
+
+def start_recording(path: str):
+    """
+    Начинает запись событий в path (дописывает в конец, если файл уже есть).
+    """
+    global _trace_file, _started_at
+    if _trace_file is not None:
+        return
+    _trace_file = gzip.open(path, "at", encoding="utf-8")
+    _started_at = time.monotonic()
+    _write({"k": "start", "wall": time.time()})
+    print(f"🎥 Запись событий в {path}")
+
+
+def stop_recording():
+    """
+    Завершает запись и закрывает файл.
+    """
+    global _trace_file
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+
+
+def _write(event: dict):
+    global _pending
+    event["t"] = round(time.monotonic() - _started_at, 4)
+    _trace_file.write(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+    _pending += 1
+    if _pending >= FLUSH_EVERY:
+        _trace_file.flush()
+        _pending = 0
+
+
+# -------------------------Сериализация событий-------------------------
+def record_message(message):
+    """
+    Сообщение (в канале сервера или в ЛС).
+    """
+    if _trace_file is None:
+        return
+    _write(
+        {
+            "k": "msg",
+            "id": message.id,
+            "ch": message.channel.id,
+            "ct": message.channel.type.value,
+            "g": message.guild.id if message.guild else None,
+            "a": message.author.id,
+            "an": str(message.author),
+            "c": message.content,
+            "e": [
+                {
+                    "d": embed.description,
+                    "f": [[field.name, field.value] for field in embed.fields],
+                }
+                for embed in message.embeds
+            ],
+        }
+    )
+
+
+def record_reaction(payload):
+    """
+    Сырая реакция (on_raw_reaction_add).
+    """
+    if _trace_file is None:
+        return
+    _write(
+        {
+            "k": "react",
+            "u": payload.user_id,
+            "m": payload.message_id,
+            "ch": payload.channel_id,
+            "g": payload.guild_id,
+            "e": str(payload.emoji),
+        }
+    )
+
+
+def record_member(tag: str, uid: int):
+    """
+    Тег из анкеты («Ваш DISCORD») разрешился в участника uid.
+    """
+    if _trace_file is None:
+        return
+    _write({"k": "member", "tag": tag, "u": uid})
+
+
+def record_dm(uid: int, message_id: int):
+    """
+    Бот отправил ЛС пользователю uid (ID нужен, чтобы сопоставить реакции).
+    """
+    if _trace_file is None:
+        return
+    _write({"k": "dm", "u": uid, "m": message_id})
+
+
+# -------------------------Чтение-------------------------
+def read_trace(path: str):
+    """
+    Отдаёт события trace-файла по одному (файл не загружается целиком).
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        except (EOFError, json.JSONDecodeError):
+            # бот был остановлен без stop_recording — хвост файла обрезан
+            return
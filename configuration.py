@@ -43,6 +43,103 @@ CONFIG_PATH = os.path.join(BASE_DIR, "config.json")
 # Файлы для хранения информации о пользователях
 DECLINED_FILE = "declined.txt"  # пользователи, отклоненные при проверке
 PROGRESS_FILE = "progress.json"  # прогресс обработки заявок
+ARCHIVE_FILE = "archive.db"  # архив завершённых анкет (SQLite)
+PROCESSED_FILE = "processed.txt"  # ID уже обработанных сообщений-заявок
+DM_CACHE_FILE = "dm_channels.txt"  # кэш "uid id_лс_канала" (переживает перезапуск)
+QUEUE_FILE = "admission_queue.json"  # очередь заявок, ждущих запуска анкеты
+BACKFILL_FILE = "backfill.json"  # контрольные точки !reprocess
+
+# Номер процесса-обработчика анкет (python worker.py <номер>): у каждого
+# обработчика свои outbox и статистика, остальные файлы общие
+WORKER_ID = os.getenv("WORKER_ID")
+_WORKER_SUFFIX = f"_worker{WORKER_ID}" if WORKER_ID else ""
+OUTBOX_FILE = f"outbox{_WORKER_SUFFIX}.json"  # действия в Discord после завершения анкеты (с повторами)
+OUTBOX_DONE_FILE = f"outbox_done{_WORKER_SUFFIX}.txt"  # ключи выполненных заданий outbox
+STATS_FILE = f"stats{_WORKER_SUFFIX}.json"  # агрегаты воронки анкет (для !stats)
+STATS_WORKER_FILES = "stats_worker*.json"  # агрегаты обработчиков — !stats складывает их со своими
+STATS_CHECKPOINT_INTERVAL = 300  # как часто сохранять статистику (секунды)
+SNAPSHOT_FILE = "snapshot.bin"  # снимок состояния для быстрого перезапуска
+SNAPSHOT_INTERVAL = 300  # как часто сохранять снимок (секунды)
+# Снимок старше этого срока не используется — состояние читается из Discord целиком
+SNAPSHOT_MAX_AGE = 7 * 24 * 3600
+# Как часто канал ЧС перечитывается целиком (секунды): со снимком читаются
+# только новые сообщения, а так подхватываются удалённые, пока бот был выключен
+BLACKLIST_RESYNC_INTERVAL = 6 * 3600
 
 # Канал с черным списком пользователей (для чтения забаненных)
 BLACKLIST_CHANNEL_ID = 1401614074802077817
+
+# Каналы дедлайнов смены фамилии и роль, которую проверяем
+LOG_CHANNEL_ID = 1414026815873486868
+ALARM_CHANNEL_ID = 1414027547016040559
+ROLE_TO_CHECK = 1389184190989467677
+
+# Дополнительные серверы задаются в config.json → "GUILDS" (см. cogs/guilds.py);
+# AUTO_SHARD=1 в .env включает AutoShardedBot (включается сам, если серверов > 1)
+
+# ==============================
+# === Срок жизни анкет ========
+# ==============================
+
+# Анкета без активности удаляется через SESSION_TTL секунд
+SESSION_TTL = 3 * 24 * 3600
+# Одно напоминание после SESSION_REMINDER_AFTER секунд тишины (None — не напоминать)
+SESSION_REMINDER_AFTER = 24 * 3600
+# Как часто проверять истёкшие анкеты (секунды)
+SESSION_SWEEP_INTERVAL = 300
+
+# Сколько анкет одновременно запускается (1-й вопрос + реакции);
+# остальные заявки ждут в очереди допуска
+MAX_CONCURRENT_ONBOARDING = 3
+
+# ==============================
+# === Outbox (действия после анкеты) ===
+# ==============================
+
+# Сколько заданий outbox выполняется одновременно
+OUTBOX_WORKERS = 2
+# Сколько раз пробовать действие при сбоях сети / Discord
+OUTBOX_MAX_ATTEMPTS = 8
+# Пауза перед первым повтором (секунды), дальше удваивается
+OUTBOX_RETRY_DELAY = 5
+
+# ==============================
+# === Переобработка (!reprocess) ===
+# ==============================
+
+# Сколько заявок обрабатывается одновременно
+BACKFILL_CONCURRENCY = 4
+# Как часто обновлять сообщение с прогрессом и контрольную точку (секунды)
+BACKFILL_PROGRESS_INTERVAL = 5
+
+# ==============================
+# === Несколько процессов =====
+# ==============================
+
+# HANDOFF_WORKERS и STATE_BACKEND задаются в .env (см. worker.py)
+# Как часто обработчик перечитывает blacklist из общего хранилища (секунды)
+BLACKLIST_REFRESH_INTERVAL = 60
+# Сколько событий один обработчик выполняет одновременно (разных пользователей)
+WORKER_CONCURRENCY = 16
+# Аренда анкеты в общем хранилище (секунды): столько процесс может держать
+# анкету между чтением и записью (отправка вопроса и реакций), пока другие ждут
+SESSION_LEASE_TTL = 30
+
+# ==============================
+# === Кэш пользователей =======
+# ==============================
+
+# Сколько пользователей/участников держать в LRU-кэше и сколько секунд
+USER_CACHE_SIZE = 2048
+USER_CACHE_TTL = 600
+
+# ==============================
+# === Диагностика =============
+# ==============================
+
+# Период проверки и порог задержки event loop (секунды)
+LOOP_LAG_INTERVAL = 0.5
+LOOP_LAG_THRESHOLD = 0.25
+
+# Приватный канал для результатов !profile (None → файл уходит в ЛС админу)
+PROFILE_CHANNEL_ID = None
@@ -0,0 +1,185 @@
+"""
+Discord HR Bot — процесс-обработчик анкет
+=========================================
+Запускается рядом с bot.py, когда в .env задано HANDOFF_WORKERS=N
+и общее хранилище STATE_BACKEND=redis://host:port/db:
+
+    python worker.py 0
+    ...
+    python worker.py N-1
+
+Функционал:
+- берёт ответы анкет (реакции и сообщения в ЛС) из своей очереди в общем
+  хранилище — шлюз (bot.py) раскладывает их по uid, поэтому события одного
+  пользователя всегда попадают к одному обработчику и идут по порядку;
+- задаёт следующие вопросы и завершает анкеты (outbox и статистика — свои
+  у каждого обработчика, архив и отклонённые — общие);
+- анкеты читает и записывает в хранилище с compare-and-set по версии;
+- blacklist получает от шлюза через хранилище.
+
+К Discord подключается только с intent guilds (кэш серверов, каналов и ролей
+для веток, ролей и упоминаний) — сообщения и реакции получает шлюз.
+"""
+
+import asyncio
+import os
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    os.environ["WORKER_ID"] = sys.argv[1]  # до импорта configuration: имена файлов
+
+import discord
+from dotenv import load_dotenv
+
+from cogs import perf
+from cogs.applications import (
+    answer_reaction,
+    answer_text,
+    shared_session,
+    use_state_backend,
+)
+from cogs.guilds import guild_configs, load_guild_configs
+from cogs.helpers import blacklist_ids
+from cogs.outbox import start_outbox_workers
+from cogs.state import create_backend, answer_queue
+from cogs.stats import start_stats_checkpoints, save_stats
+from configuration import (
+    CONFIG_PATH,
+    WORKER_ID,
+    BLACKLIST_REFRESH_INTERVAL,
+    WORKER_CONCURRENCY,
+)
+
+load_dotenv()
+TOKEN = os.getenv("DISCORD_TOKEN")
+HANDOFF_WORKERS = int(os.getenv("HANDOFF_WORKERS") or 0)
+
+if os.getenv("PERF_PROFILE") == "1":
+    print(f"⚡ Профиль производительности: {perf.enable_fast_profile()}")
+
+if not os.path.exists(CONFIG_PATH):
+    raise FileNotFoundError(
+        f"❌ Файл {CONFIG_PATH} не найден! Создай config.json рядом с exe"
+    )
+load_guild_configs()
+
+intents = discord.Intents.none()
+intents.guilds = True
+client = discord.Client(
+    intents=intents,
+    member_cache_flags=discord.MemberCacheFlags.none(),
+    max_messages=None,
+)
+state_backend = None
+in_flight: set[asyncio.Task] = set()  # события в обработке
+_tasks: list[asyncio.Task] = []
+
+
+# -------------------- Ответы анкет --------------------
+async def handle_event(event: dict):
+    """
+    Одно событие от шлюза: анкета читается из хранилища, ответ принимается
+    (как в bot.py), анкета записывается обратно.
+    """
+    uid = event["uid"]
+    try:
+        async with shared_session(uid) as entry:
+            if entry is None:
+                return
+            if event["kind"] == "reaction":
+                await answer_reaction(client, uid, event["message_id"], event["emoji"])
+            else:
+                await answer_text(client, uid, event["content"])
+    except Exception as e:
+        print(f"⚠️ Не удалось задать следующий вопрос {uid}: {e}")
+
+
+async def consume(queue: str):
+    """
+    Берёт события из очереди. Разные пользователи обрабатываются параллельно
+    (до WORKER_CONCURRENCY), события одного — по порядку (session_lock).
+    """
+    while True:
+        try:
+            event = await state_backend.pop(queue)
+        except Exception as e:
+            print(f"⚠️ Очередь {queue} недоступна: {e}")
+            await asyncio.sleep(5)
+            continue
+        if event is None:
+            continue
+        if len(in_flight) >= WORKER_CONCURRENCY:
+            await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        task = asyncio.create_task(handle_event(event))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+
+async def refresh_blacklist():
+    """
+    Перечитывает blacklist серверов из хранилища (его туда пишет шлюз).
+    """
+    for guild_id in guild_configs:
+        blacklist_ids[guild_id] = await state_backend.get_blacklist(guild_id)
+
+
+async def blacklist_refresh_loop():
+    """
+    Фоновая задача: раз в BLACKLIST_REFRESH_INTERVAL обновляет blacklist.
+    """
+    while True:
+        await asyncio.sleep(BLACKLIST_REFRESH_INTERVAL)
+        try:
+            await refresh_blacklist()
+        except Exception as e:
+            print(f"⚠️ Ошибка при обновлении blacklist: {e}")
+
+
+@client.event
+async def on_ready():
+    """
+    Запуск обработчика (один раз — on_ready вызывается при каждом переподключении).
+    """
+    if _tasks:
+        return
+    await refresh_blacklist()
+    start_outbox_workers(client)
+    start_stats_checkpoints()
+    # номер обработчика < HANDOFF_WORKERS → его очередь та же, что у uid = номеру
+    queue = answer_queue(int(WORKER_ID), HANDOFF_WORKERS)
+    _tasks.append(asyncio.create_task(blacklist_refresh_loop()))
+    _tasks.append(asyncio.create_task(consume(queue)))
+    print(f"✅ Обработчик {WORKER_ID} ({client.user}) слушает очередь {queue}")
+
+
+# -------------------- Запуск --------------------
+async def run_worker():
+    """
+    Запускает обработчик с автоматическим перезапуском при ошибках подключения.
+    """
+    global state_backend
+    if WORKER_ID is None or not WORKER_ID.isdigit() or int(WORKER_ID) >= HANDOFF_WORKERS:
+        raise SystemExit(
+            f"Использование: python worker.py <номер от 0 до HANDOFF_WORKERS-1> "
+            f"(HANDOFF_WORKERS={HANDOFF_WORKERS})"
+        )
+    if not os.getenv("STATE_BACKEND", "local").startswith("redis://"):
+        raise SystemExit("❌ Обработчику нужно общее хранилище STATE_BACKEND=redis://...")
+    state_backend = create_backend(os.getenv("STATE_BACKEND"))
+    use_state_backend(state_backend)
+
+    try:
+        while True:
+            try:
+                await client.start(TOKEN)
+            except Exception as e:
+                print(f"❌ Ошибка при запуске: {e}")
+                print("⏳ Жду 30 секунд и пробую снова...")
+                await asyncio.sleep(30)
+    finally:
+        save_stats()
+        await state_backend.close()
+
+
+if __name__ == "__main__":
+    perf.run(run_worker())